@@ -46,18 +46,39 @@ REPO_DIR   = config('REPOSITORY',default=os.path.join(HOME_DIR,'.repository'),ca
 DATASETS_DIR = os.path.join(REPO_DIR,'datasets')
 META_DIR = os.path.join(REPO_DIR,'meta')
 TASKS_DIR = os.path.join(REPO_DIR,'tasks')
-for _dir in [REPO_DIR,DATASETS_DIR,META_DIR,TASKS_DIR]:
+POTCAR_DIR = os.path.join(REPO_DIR,'potcars')
+STRUCTURES_DIR = os.path.join(REPO_DIR,'structures')
+CACHE_DIR = config('CACHE_DIR',default=os.path.join(REPO_DIR,'cache'),cast=str)
+for _dir in [REPO_DIR,DATASETS_DIR,META_DIR,TASKS_DIR,POTCAR_DIR,STRUCTURES_DIR,CACHE_DIR]:
     if os.path.isdir(_dir):
        pass
     else:
        os.mkdir(_dir)
 
 API_KEY    = config('API_KEY',default='',cast=str)
+# size budget of each on-disk cache in bytes, 0 means unlimited
+CACHE_SIZE_LIMIT = config('CACHE_SIZE_LIMIT',default=2*1024**3,cast=int)
+VASPRUN_CACHE = config('VASPRUN_CACHE',default=True,cast=bool)
+# cache spglib symmetry and dimensionality results per structure
+SYMMETRY_CACHE = config('SYMMETRY_CACHE',default=True,cast=bool)
+# keep StructureMatvird structures in the compact array encoding
+COMPACT_STRUCTURE = config('COMPACT_STRUCTURE',default=False,cast=bool)
+# query and update the shared similarity index during mvdkit build, by default
+# this is a separate pass (mvdkit similarity) and builds stay independent
+SIMILARITY_INDEX = config('SIMILARITY_INDEX',default=False,cast=bool)
+# store each parsed task as one zip archive instead of a directory
+PACK_TASKS = config('PACK_TASKS',default=False,cast=bool)
+# store mechanics curves as binary array sidecars instead of inline json lists
+ARRAY_CURVES = config('ARRAY_CURVES',default=True,cast=bool)
+ARRAY_FLOAT32 = config('ARRAY_FLOAT32',default=False,cast=bool)
+# relative error bound of the stored energy- and stress-strain curves, 0 keeps every point
+CURVE_TOLERANCE = config('CURVE_TOLERANCE',default=0.0,cast=float)
 #MONGODB_URI= config('MONGO_DATABASE_URI',default='',cast=str)  
 
 log.info('Mode: %s'%DEBUG)
 log.info('Repository directory: %s'%REPO_DIR)
 log.info('API key: %s'%API_KEY)
+log.info('Cache directory: %s'%CACHE_DIR)
 #log.info('MongoDB :%s'%MONGODB_URI)
  
 EMAIL_HOST = config('EMAIL_HOST', default='localhost')
@@ -0,0 +1,133 @@
+"""
+Packed task format: one zip archive per task.
+
+All raw outputs (already gzipped) and json sidecars of a task, plus its
+task.json, are stored as members of ``<task_id>.zip`` next to where the task
+directory would be. The zip central directory is the trailing index, so a
+single member can be read with one seek and without touching the others.
+JFData entries of a packed task carry the archive name in ``archive`` and
+the member names in ``file_name`` / ``json_file_name``.
+"""
+import os
+import gzip
+import shutil
+import zipfile
+from uuid import uuid4
+from typing import Any, List, Optional
+
+from matvirdkit import log
+from matvirdkit.model.utils import loadjson, loadsjson
+
+__author__ = 'Haidi Wang'
+__email__ = 'haidi@hfut.edu.cn'
+
+ARCHIVE_SUFFIX = '.zip'
+# members that are compressed already are stored as is
+_STORED = ('.gz', '.bz2', '.xz', '.png', '.jpg', '.npz', '.npy')
+
+
+class TaskArchive(object):
+    def __init__(self, fname: str):
+        self.fname = os.path.abspath(fname)
+        self._zf = None
+
+    def __enter__(self) -> 'TaskArchive':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    @property
+    def zf(self) -> zipfile.ZipFile:
+        if self._zf is None:
+            self._zf = zipfile.ZipFile(self.fname, 'r')
+        return self._zf
+
+    def close(self) -> None:
+        if self._zf is not None:
+            self._zf.close()
+            self._zf = None
+
+    @classmethod
+    def pack(cls, src_dir: str, fname: Optional[str] = None, remove: bool = True) -> 'TaskArchive':
+        """
+        Pack all files of src_dir into one archive (default: src_dir + '.zip').
+
+        Args:
+            src_dir (str): task directory
+            fname (str): archive name
+            remove (bool): remove src_dir once the archive is in place
+        """
+        src_dir = os.path.abspath(src_dir)
+        fname = fname if fname else src_dir.rstrip(os.sep) + ARCHIVE_SUFFIX
+        tmp = os.path.join(os.path.dirname(fname), '.%s.tmp' % uuid4().hex)
+        with zipfile.ZipFile(tmp, 'w') as zf:
+            for root, _, files in os.walk(src_dir):
+                for f in sorted(files):
+                    path = os.path.join(root, f)
+                    member = os.path.relpath(path, src_dir)
+                    compress = zipfile.ZIP_STORED if f.endswith(_STORED) else zipfile.ZIP_DEFLATED
+                    zf.write(path, member, compress_type=compress)
+        os.replace(tmp, fname)
+        if remove:
+            shutil.rmtree(src_dir)
+        log.debug('packed %s into %s' % (src_dir, fname))
+        return cls(fname)
+
+    def names(self) -> List[str]:
+        return self.zf.namelist()
+
+    def __contains__(self, member: str) -> bool:
+        try:
+            self.zf.getinfo(member)
+            return True
+        except KeyError:
+            return False
+
+    def open(self, member: str):
+        """
+        File object of one member, gzipped members are decompressed on the fly.
+        """
+        fid = self.zf.open(member, 'r')
+        if member.endswith('.gz'):
+            return gzip.GzipFile(fileobj=fid, mode='rb')
+        return fid
+
+    def read(self, member: str) -> bytes:
+        with self.open(member) as fid:
+            return fid.read()
+
+    def load(self, member: str) -> Any:
+        """
+        Decode a json member without class reconstruction.
+        """
+        data = self.read(member)
+        return loadsjson(data)
+
+    def extract(self, member: str, dst_dir: str, decompress: bool = False) -> str:
+        dst = os.path.join(dst_dir, member[:-3] if decompress and member.endswith('.gz') else member)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        src = self.open(member) if decompress else self.zf.open(member, 'r')
+        with src, open(dst, 'wb') as out:
+            shutil.copyfileobj(src, out)
+        return dst
+
+
+def archive_name(task_dir: str) -> str:
+    return os.path.abspath(task_dir).rstrip(os.sep) + ARCHIVE_SUFFIX
+
+
+def read_task_file(task_dir: str, member: str = 'task.json') -> Optional[Any]:
+    """
+    Load a json file of a stored task, whether the task is a plain
+    directory or a packed archive. None if neither exists.
+    """
+    fname = os.path.join(task_dir, member)
+    if os.path.isfile(fname):
+        return loadjson(fname)
+    fname = archive_name(task_dir)
+    if os.path.isfile(fname):
+        with TaskArchive(fname) as ta:
+            if member in ta:
+                return ta.load(member)
+    return None
@@ -3,7 +3,6 @@ import inspect
 import pandas as pd
 import warnings
 import numpy as np
-from glob import glob
 from pprint import pprint
 from datetime import datetime
 from hashlib import sha1
@@ -14,25 +13,30 @@ from matvirdkit.model.utils import jsanitize
 from abc import ABCMeta, abstractmethod
 from typing import Dict, List, Tuple, Optional, Union, Iterator, Set, Sequence, Iterable
 from pymatgen.core import Structure
-from matvirdkit import log,REPO_DIR,DATASETS_DIR
-from matvirdkit.model.utils import jsanitize,create_path,sha1encode
+from matvirdkit import log,REPO_DIR,DATASETS_DIR,SIMILARITY_INDEX,CURVE_TOLERANCE
+from matvirdkit.model.utils import jsanitize,create_path,content_hash
 #from matvirdkit.model.electronic import EMC,Bandgap,Mobility,Workfunction,ElectronicStructureDoc
 #from matvirdkit.model.properties import PropertyOrigin
 from matvirdkit.model.thermo import Thermo,ThermoDoc
 from matvirdkit.model.xrd import Xrd,XrdDoc
 from matvirdkit.model.stability import ThermoDynamicStability,PhononStability,StiffnessStability,StabilityDoc,Stability
+from matvirdkit.model.stability import combine_stiffness
 from matvirdkit.model.common import Meta,MetaDoc,Source,SourceDoc,Task,TaskDoc,DataFigure, JFData
 from matvirdkit.model.magnetism import Magnetism,MagnetismDoc
 from matvirdkit.model.bms import BMS, BMSDoc
-from matvirdkit.model.structure import StructureMatvird
-from matvirdkit.model.mechanics import Mechanics2d,Mechanics2dDoc
+from matvirdkit.model.structure import StructureMatvird,SimilarStructure,SimilarStructuresDoc
+from matvirdkit.model.mechanics import Mechanics2d,Mechanics2dDoc,Mechanics3d,Mechanics3dDoc
 from matvirdkit.model.provenance import LocalProvenance,GlobalProvenance,Origin
 from matvirdkit.model.electronic import Workfunction, Bandgap, EMC, Mobility, ElectronicStructureDoc,ElectronicStructure
 from matvirdkit.builder.readstructure import structure_from_file
 from matvirdkit.builder.task import GeneralTask #,VaspTask
 from matvirdkit.builder.vasp.electronic_structure import VaspElectronicStructure
-from matvirdkit.builder.mechanics import mechanics2d_parser
+from matvirdkit.builder.mechanics import mechanics2d_parser,mechanics2d_parsers,mechanics3d_parser,eos_parser
+from matvirdkit.builder.manifest import scan_mechanics
 from matvirdkit.builder.id import get_snowflake_id
+from matvirdkit.builder.reader import dump_material_doc
+from matvirdkit.builder.similarity import SimilarityIndex,rdf_fingerprint,similarity_key
+from matvirdkit.builder.stability import stiffness_min_eigenvalues
 
 __version__ = "0.1.0"
 __author__ = "Matvird"
@@ -41,7 +45,8 @@ def function_name():
     return inspect.stack()[1][3]
 
 supported_database = ['bms', 'mech2d', 'npr2d', 'penta',  'rashba', 'carbon2d', 'carbon3d', 'raman' ]
-DocKeys = ['electronic', 'magnetism', 'stability', 'thermo', 'xrd', 'mechanics2d', 'meta', 'source']
+# stability is classified from the thermo and mechanics docs set before it
+DocKeys = ['electronic', 'magnetism', 'thermo', 'xrd', 'mechanics2d', 'mechanics3d', 'stability', 'meta', 'source']
 default_prefix = {"bms": 'bms', "mech2d":"m2d", "npr2d":"npr2d", "carbon2d":'c2d',"carbon3d":'c3d', 'raman':'rm'}
 
 class Builder():
@@ -67,6 +72,7 @@ class Builder():
         self._thermo      = {}  #thermo
         self._electronicstructure  = {}  #
         self._mechanics2d  = {}
+        self._mechanics3d  = {}
         self._mechanics    = {}
         self._stability    = {}
         self._magnetism    = {}
@@ -97,7 +103,9 @@ class Builder():
         self._StabilityDoc = {}
         self._TaskDoc = {}
         self._Mechanics2dDoc = {}
+        self._Mechanics3dDoc = {}
         self._BMSDoc = {}
+        self._SimilarDoc = {}
 
 
     @property 
@@ -108,9 +116,10 @@ class Builder():
         if value not in self._registered_doc:
            self._registered_doc.append(value)
 
-    def save_doc(self,**kwargs):
-        dumpfn(self.get_doc(),
-               os.path.join(self.work_dir,self.material_id+'.json'),**kwargs)
+    def save_doc(self,indent=False):
+        # written block by block with an index, see builder.reader
+        dump_material_doc(self.get_doc(),
+               os.path.join(self.work_dir,self.material_id+'.json'),indent=bool(indent))
 
     def get_doc(self,json=True) -> Dict:
         ret =   { 
@@ -173,8 +182,13 @@ class Builder():
     def get_ThermoDoc(self) -> Union[Dict,ThermoDoc]:
         return self._ThermoDoc       
 
-    def _get_mechanics2d_provenance(self,prov={}):
+    def _get_mechanics2d_provenance(self,prov={},manifests=None):
+        """
+        manifests: {task_dir: MechanicsManifest} of the task directories
+        already scanned by the parsers, the others are scanned here
+        """
         provenance={}
+        manifests=manifests if manifests else {}
         if prov:
            pass
         else:
@@ -189,12 +203,12 @@ class Builder():
             # make sure only one task_info in the list
             log.debug('key  :%s'%key)
             if task_dir:
-               fs=glob(os.path.join(task_dir,pmap[key],'Def_*/Def_*_[0-9][0-9][0-9]') )
-               fs.sort()
+               manifest=manifests.get(task_dir) or scan_mechanics(task_dir,[pmap[key]])
                origins=[]
-               for f in fs:
+               for step_dir in manifest.step_dirs(pmap[key]):
+                   description=os.path.relpath(step_dir,manifest.root)
+                   f=os.path.join(task_dir,description)
                    log.debug('dir: %s'%f)
-                   description=f.replace(task_dir+'/','')
                    task_id,calc_type = self.encode_task(f,code=code)
                    self.set_task( task_id = task_id, code= code, calc_type = str(calc_type) , description=description)
                    log.debug('task_id: %s calc_type: %s'%(task_id,calc_type))
@@ -299,15 +313,29 @@ class Builder():
             stress_strain_dir=info.get('stress_strain',{}).get('task_dir','')
             description=info.get('description','')
             root_meta=info.get('meta',{})
-            elc2nd_stress = mechanics2d_parser(elc2nd_stress_dir,self.mech_dir,'elc_stress')
-            elc2nd_energy = mechanics2d_parser(elc2nd_energy_dir,self.mech_dir,'elc_energy')
-            stress_strain = mechanics2d_parser(stress_strain_dir,self.mech_dir,'ssc_stress')
             prov=info.pop('provenance',{})
-            provenance=self._get_mechanics2d_provenance(prov)
+            # every mech2d tree is walked once, parsers and provenance share the scan
+            manifests={d: scan_mechanics(d) for d in set([elc2nd_stress_dir,elc2nd_energy_dir,stress_strain_dir]+
+                                                         [p.get('task_dir','') for p in prov.values()]) if d}
+            rets = mechanics2d_parsers({'elc_stress': elc2nd_stress_dir,
+                                        'elc_energy': elc2nd_energy_dir,
+                                        'ssc_stress': stress_strain_dir},
+                                       self.mech_dir,
+                                       orders={'elc_stress': info.get('elc2nd_stress',{}).get('order'),
+                                               'elc_energy': info.get('elc2nd_energy',{}).get('order')},
+                                       tolerance=info.get('tolerance',CURVE_TOLERANCE),
+                                       manifests=manifests)
+            elc2nd_stress = rets['elc_stress']
+            elc2nd_energy = rets['elc_energy']
+            stress_strain = rets['ssc_stress']
+            # {key: {'task_dir', 'x', 'form'}} energy-area/strain scans
+            eos = eos_parser(info.get('eos',{}), self.mech_dir)
+            provenance=self._get_mechanics2d_provenance(prov,manifests)
             self._mechanics2d  [label] = Mechanics2d(provenance=provenance,
                                       elc2nd_stress=elc2nd_stress,
                                       elc2nd_energy=elc2nd_energy,
                                       stress_strain=stress_strain,
+                                      eos=eos if eos else None,
                                       description=description,
                                       meta=root_meta) 
     def get_mechanics2d(self):
@@ -322,6 +350,37 @@ class Builder():
     def get_Mechanics2dDoc(self):
         return self._Mechanics2dDoc
 
+    def set_mechanics3d(self, infos) -> None:
+        func_name=function_name().split('_')[-1]
+        log.debug('Func name: set_%s()'%func_name) 
+        for label in infos.get(func_name,{}).keys():
+            info=infos[func_name].get(label,{})
+            elc2nd_stress_dir=info.get('elc2nd_stress',{}).get('task_dir','')
+            description=info.get('description','')
+            root_meta=info.get('meta',{})
+            prov=info.pop('provenance',{})
+            manifests={d: scan_mechanics(d) for d in set([elc2nd_stress_dir]+
+                                                         [p.get('task_dir','') for p in prov.values()]) if d}
+            elc2nd_stress = mechanics3d_parser(elc2nd_stress_dir, self.mech_dir,
+                                               nprocs=info.get('elc2nd_stress',{}).get('nprocs',4),
+                                               manifest=manifests.get(elc2nd_stress_dir))
+            provenance=self._get_mechanics2d_provenance(prov,manifests)
+            self._mechanics3d  [label] = Mechanics3d(provenance=provenance,
+                                      elc2nd_stress=elc2nd_stress,
+                                      description=description,
+                                      meta=root_meta) 
+    def get_mechanics3d(self):
+        return self._mechanics3d
+                                        
+    def set_Mechanics3dDoc(self) -> None:
+        self._Mechanics3dDoc=Mechanics3dDoc(
+                         mechanics3d = self.get_mechanics3d()
+                         )
+        self.registery_doc(function_name().split('_')[-1])
+    
+    def get_Mechanics3dDoc(self):
+        return self._Mechanics3dDoc
+
     #-----------------BMS--------------------
     def set_bms(self, infos) -> None:
         func_name=function_name().split('_')[-1]
@@ -490,7 +549,7 @@ class Builder():
             if thermo_doc:
                formation_energy_per_atom=thermo_doc.thermo.get(label,{}).formation_energy_per_atom
                energy_above_hull=thermo_doc.thermo.get(label,{}).energy_above_hull
-               if formation_energy_per_atom and energy_above_hull:
+               if formation_energy_per_atom is not None and energy_above_hull is not None:
                   thermo_stability = self.thermo_stability(formation_energy_per_atom=formation_energy_per_atom,energy_above_hull=energy_above_hull)
                else:
                   thermo_stability  = self.thermo_stability(value=thermo_stability_value)
@@ -507,38 +566,12 @@ class Builder():
                   thermo_stability  = self.thermo_stability(value=thermo_stability_value)
             #----------stiff-------------
             d_stiff_stability = info.pop("stiff_stability",{})
-            mechanics2d_doc= self.get_Mechanics2dDoc()
-            if mechanics2d_doc:
-               C_energy=mechanics2d_doc.mechanics2d.get(label,{}).elc2nd_energy.summary.c_tensor
-               if C_energy:
-                  if self.dimension==2:
-                     min_eig_tensor_energy=min(np.linalg.eigvals(C_energy)[[0,1,-1]])
-                  elif self.dimension==3:
-                     min_eig_tensor_energy=min(np.linalg.eigvals(C_energy))
-                  else:
-                     pass
- 
-               C_stress=mechanics2d_doc.mechanics2d.get(label,{}).elc2nd_stress.summary.c_tensor
-               if C_stress:
-                  if self.dimension==2:
-                     min_eig_tensor_stress=min(np.linalg.eigvals(C_stress)[[0,1,-1]])
-                  elif self.dimension==3:
-                     min_eig_tensor_stress=min(np.linalg.eigvals(C_stress))
-                  else:
-                     pass
-
-               if C_stress and C_energy:  
-                  if (np.array([min_eig_tensor_stress, min_eig_tensor_energy])>0).all():
-                     value='high'
-                  else:
-                     value='checking'
-                  stiff_stability  = self.stiff_stability(value=value)
-               elif not C_stress and C_energy:  
-                  stiff_stability  = self.stiff_stability(min_eig_tensor=min_eig_tensor_energy)
-               elif C_stress and not C_energy:  
-                  stiff_stability  = self.stiff_stability(min_eig_tensor=min_eig_tensor_stress)
-               else:
-                  stiff_stability = self.stiff_stability(value=stiff_stability_value)
+            mechanics_doc= self.get_Mechanics3dDoc() if self.dimension==3 else self.get_Mechanics2dDoc()
+            if mechanics_doc:
+               min_eigs=stiffness_min_eigenvalues(mechanics_doc, label, self.dimension)
+               value=str(combine_stiffness(min_eigs['elc2nd_energy'], min_eigs['elc2nd_stress']))
+               stiff_stability = self.stiff_stability(value=value,
+                                       meta={k: v for k, v in min_eigs.items() if np.isfinite(v)})
             else:     
                  
                if "from_json" in d_stiff_stability.keys():
@@ -628,7 +661,7 @@ class Builder():
                task_info['calc_type'] = str(calc_type)
                log.debug(task_info)
                task=Task(**task_info)
-               hash_id = sha1encode (task)
+               hash_id = content_hash(task)
                self._tasks[hash_id]= task
 
     def encode_task(self,task_dir, code='vasp', **kwargs ):
@@ -651,7 +684,7 @@ class Builder():
                               calc_type = calc_type,   
                               description = description   
                            )
-        hash_id = sha1encode (task)
+        hash_id = content_hash(task)
         self._tasks[hash_id]= task
 
     def get_task(self) -> Dict:
@@ -709,8 +742,37 @@ class Builder():
     def get_phonons(self):
         pass
 
-    def get_similar_structures(self):
-        pass
+    #-----------------Similar structures------------
+    def similarity_key(self) -> str:
+        return similarity_key(self.database,self.material_id)
+
+    def index_structure(self, index=None) -> None:
+        """
+        Add the structure to the shared similarity index, an explicit step
+        after save_doc (see builder.similarity for the database pass)
+        """
+        if self._structure is None:
+           return
+        index = index if index else SimilarityIndex()
+        index.add(self.similarity_key(), rdf_fingerprint(self._structure))
+
+    def get_similar_structures(self, n=10, index=None) -> List[SimilarStructure]:
+        if self._structure is None:
+           return []
+        index = index if index else SimilarityIndex()
+        hits = index.query(rdf_fingerprint(self._structure), n=n, exclude=(self.similarity_key(),))
+        ret=[]
+        for key, similarity in hits:
+            database, material_id = key.split(':',1)
+            ret.append(SimilarStructure(material_id=material_id,database=database,similarity=similarity))
+        return ret
+
+    def set_SimilarDoc(self, n=10) -> None:
+        self._SimilarDoc = SimilarStructuresDoc(similar_structures=self.get_similar_structures(n=n))
+        self.registery_doc(function_name().split('_')[-1])
+
+    def get_SimilarDoc(self) -> Union[Dict, SimilarStructuresDoc]:
+        return self._SimilarDoc
 
     @classmethod
     def from_file(cls,fname='info.json'):
@@ -745,6 +807,8 @@ class Builder():
         log.debug(tasks)
         builder.set_tasks(tasks)     
         builder.set_TaskDoc()
+        if SIMILARITY_INDEX:
+           builder.set_SimilarDoc()
         builder.set_properties()
         builder.update_properties(key='CustomerDoc',val=infos.get('customer',{}))
         return builder
@@ -753,6 +817,8 @@ def main(args):
     fname=args.config
     builder=Builder.from_file(fname=fname)
     builder.save_doc()
+    if SIMILARITY_INDEX:
+       builder.index_structure()
 
 if __name__ == '__main__':
    from matvirdkit.model.utils import test_path
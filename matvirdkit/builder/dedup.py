@@ -0,0 +1,196 @@
+"""
+Persistent deduplication index of structures.
+
+Structures are bucketed by reduced formula, space group (computed once per
+structure) and a logarithmic bin of the volume per atom. StructureMatcher
+only compares a structure with the group representatives of its own bucket
+and of the two neighbouring volume bins, and buckets of different formula or
+space group are matched in parallel. The index is kept under
+``META_DIR/dedup/<name>``: ``index.json`` lists the groups, the structures
+themselves live in the structure store. New structures can be added to an
+existing index at any time.
+"""
+import os
+import math
+import time
+from multiprocessing import Pool
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from pymatgen.core import Structure
+from pymatgen.analysis.structure_matcher import ElementComparator, StructureMatcher
+
+from matvirdkit import log, META_DIR
+from matvirdkit.model.settings import SYMPREC, LTOL, STOL, ANGLE_TOL
+from matvirdkit.model.utils import get_sg, dumpjson, loadjson
+from matvirdkit.builder.structure_store import StructureStore
+
+__author__ = 'Haidi Wang'
+__email__ = 'haidi@hfut.edu.cn'
+
+DEDUP_DIR = os.path.join(META_DIR, 'dedup')
+
+
+def _matcher(params: Dict) -> StructureMatcher:
+    return StructureMatcher(ltol=params['ltol'], stol=params['stol'], angle_tol=params['angle_tol'],
+                            primitive_cell=True, scale=True, attempt_supercell=False,
+                            allow_subset=False, comparator=ElementComparator())
+
+
+def _match_bucket(args: Tuple) -> List[Tuple[int, Any]]:
+    """
+    Match the new structures of one (formula, space group) bucket against
+    its existing representatives and against each other.
+
+    Returns:
+        [(i, gid)] with gid the id of an existing group or ('new', k) for the
+        k-th group created in this bucket
+    """
+    existing, new, params = args
+    sm = _matcher(params)
+    reps = [(gid, vbin, st) for gid, vbin, st in existing]
+    ret = []
+    k = 0
+    for i, vbin, st in new:
+        gid = None
+        for rgid, rbin, rst in reps:
+            if abs(rbin - vbin) <= 1 and sm.fit(rst, st):
+                gid = rgid
+                break
+        if gid is None:
+            gid = ('new', k)
+            k += 1
+            reps.append((gid, vbin, st))
+        ret.append((i, gid))
+    return ret
+
+
+class StructureIndex(object):
+    def __init__(self, name: str = 'default', index_dir: Optional[str] = None,
+                 ltol: float = LTOL, stol: float = STOL, angle_tol: float = ANGLE_TOL,
+                 symprec: float = SYMPREC, vol_tol: float = 0.1,
+                 store: Optional[StructureStore] = None):
+        """
+        Args:
+            name (str): name of the index under DEDUP_DIR
+            index_dir (str): explicit directory of the index
+            ltol, stol, angle_tol: StructureMatcher tolerances
+            symprec (float): symmetry tolerance for the space group
+            vol_tol (float): relative width of the volume per atom bins,
+                structures further apart in volume are never matched
+            store (StructureStore): where the structures are kept
+        """
+        self.index_dir = index_dir if index_dir else os.path.join(DEDUP_DIR, name)
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.fname = os.path.join(self.index_dir, 'index.json')
+        self.store = store if store else StructureStore()
+        self.params = {'ltol': ltol, 'stol': stol, 'angle_tol': angle_tol,
+                       'symprec': symprec, 'vol_tol': vol_tol}
+        # groups: [{'key': [formula, sg], 'vbin': int, 'members': [[ref, label], ...]}]
+        self.groups = []
+        self._buckets = {}
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.isfile(self.fname):
+            return
+        d = loadjson(self.fname)
+        if d['params'] != self.params:
+            raise RuntimeError('Index %s was built with %s' % (self.fname, d['params']))
+        self.groups = d['groups']
+        for gid, g in enumerate(self.groups):
+            self._buckets.setdefault(tuple(g['key']), []).append(gid)
+
+    def save(self) -> None:
+        tmp = self.fname + '.tmp'
+        dumpjson({'params': self.params, 'groups': self.groups}, tmp)
+        os.replace(tmp, self.fname)
+
+    def __len__(self) -> int:
+        return len(self.groups)
+
+    def bucket_key(self, structure: Structure) -> Tuple[Tuple[str, int], int]:
+        """
+        (reduced formula, space group) and volume bin of a structure
+        """
+        sg = get_sg(structure, symprec=self.params['symprec'])
+        vbin = int(math.floor(math.log(structure.volume / len(structure)) / math.log1p(self.params['vol_tol'])))
+        return (structure.composition.reduced_formula, sg), vbin
+
+    def representative(self, gid: int) -> Structure:
+        return self.store.get(self.groups[gid]['members'][0][0])
+
+    def members(self, gid: int) -> List[List[str]]:
+        return self.groups[gid]['members']
+
+    def add(self, structures: Sequence[Structure], labels: Optional[Sequence[str]] = None,
+            nprocs: int = 1, save: bool = True) -> List[int]:
+        """
+        Insert structures and return the group id of each of them; a
+        structure matching an indexed one joins its group.
+
+        Args:
+            structures (list): pymatgen structures
+            labels (list): optional labels (e.g. material ids) kept with the members
+            nprocs (int): buckets are matched in that many processes
+        """
+        labels = list(labels) if labels is not None else [''] * len(structures)
+        new = {}
+        for i, st in enumerate(structures):
+            key, vbin = self.bucket_key(st)
+            new.setdefault(key, []).append((i, vbin, st))
+
+        jobs = []
+        for key, items in new.items():
+            existing = [(gid, self.groups[gid]['vbin'], self.representative(gid))
+                        for gid in self._buckets.get(key, [])]
+            jobs.append((existing, items, self.params))
+        if nprocs > 1 and len(jobs) > 1:
+            with Pool(processes=min(nprocs, len(jobs))) as pool:
+                results = pool.map(_match_bucket, jobs)
+        else:
+            results = [_match_bucket(job) for job in jobs]
+
+        gids = [None] * len(structures)
+        for key, result in zip(new.keys(), results):
+            vbins = {i: vbin for i, vbin, _ in new[key]}
+            created = {}
+            for i, gid in result:
+                if isinstance(gid, tuple):
+                    if gid not in created:
+                        created[gid] = len(self.groups)
+                        self.groups.append({'key': list(key), 'vbin': vbins[i], 'members': []})
+                        self._buckets.setdefault(key, []).append(created[gid])
+                    gid = created[gid]
+                self.groups[gid]['members'].append([self.store.put(structures[i]), labels[i]])
+                gids[i] = gid
+        if save:
+            self.save()
+        log.debug('%d structures into %d groups' % (len(structures), len(self.groups)))
+        return gids
+
+    def query(self, structure: Structure) -> Optional[int]:
+        """
+        Group id of an indexed structure matching structure, None if there is none.
+        """
+        key, vbin = self.bucket_key(structure)
+        existing = [(gid, self.groups[gid]['vbin'], self.representative(gid))
+                    for gid in self._buckets.get(key, [])]
+        (_, gid), = _match_bucket((existing, [(0, vbin, structure)], self.params))
+        return None if isinstance(gid, tuple) else gid
+
+
+def benchmark_dedup(structures: List[Structure], nprocs: int = 1) -> None:
+    """
+    Time group_structures against a fresh StructureIndex on the same set.
+    """
+    import tempfile
+    from matvirdkit.model.utils import group_structures
+    t = time.time()
+    ngroups = len(list(group_structures(structures)))
+    t_group = time.time() - t
+    t = time.time()
+    index = StructureIndex(index_dir=tempfile.mkdtemp())
+    index.add(structures, nprocs=nprocs)
+    t_index = time.time() - t
+    print('group_structures %d groups %.2f s   index %d groups %.2f s'
+          % (ngroups, t_group, len(index), t_index))
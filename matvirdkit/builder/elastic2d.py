@@ -0,0 +1,413 @@
+"""
+Native 2D elastic constant engine.
+
+Reads the deformation tree written by ``m2d init`` (``<approach>/Def_*/Def_*_NNN``
+below a task directory holding the reference POSCAR) and replaces ``m2d post``.
+The Lagrangian strain of every step follows from its lattice and the
+reference lattice, so neither ``Mech2D.json`` nor the text tables of ``m2d``
+are needed. Energies and stresses are read from the last ionic step of each
+``vasprun.xml``.
+
+Strains and stresses are Voigt vectors (xx, yy, xy) with the engineering
+shear strain. Every deformation mode is a strain direction d scaled by the
+strain of its steps, which gives
+
+    energy method:  E(e) = E0 + A0 * 1/2 d.C.d e^2
+    stress method:  S(e) = C.d e
+
+The energy-strain polynomials (or the stress-strain slopes) of all modes are
+fitted in one batched least squares, and the independent constants of the
+2D lattice follow from a second one.
+"""
+import io
+import os
+import time
+from xml.etree import ElementTree
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from matvirdkit import log, DATASETS_DIR
+from matvirdkit.model.mechanics import Mechanics2dSummary, polar_statistics
+from matvirdkit.builder.reader import LazyMaterial
+from matvirdkit.builder.manifest import MechanicsManifest, scan_mechanics, prefetch, PREFETCH_WORKERS
+
+__author__ = 'Haidi Wang'
+__email__ = 'haidi@hfut.edu.cn'
+
+EV_A2_TO_NM = 16.021766208      # eV/A^2 -> N/m
+KBAR_A_TO_NM = 0.01             # kBar*A -> N/m
+ENERGY_ORDER = 4
+STRESS_ORDER = 1
+# m2d keeps the unstrained step of a mode under this strain
+M2D_ZERO_STRAIN = 1e-4
+# components of the 6 column stress tables: XX YY ZZ YZ XZ XY
+TABLE_INDEX = ([0, 1, 2, 1, 0, 0], [0, 1, 2, 2, 2, 1])
+# independent constants of each 2D lattice, as columns over
+# (C11, C12, C16, C22, C26, C66)
+LATTICE_BASIS = {
+    'oblique': np.eye(6),
+    'rectangular': np.array([[1, 0, 0, 0],
+                             [0, 1, 0, 0],
+                             [0, 0, 0, 0],
+                             [0, 0, 1, 0],
+                             [0, 0, 0, 0],
+                             [0, 0, 0, 1]], dtype=float),
+    'square': np.array([[1, 0, 0],
+                        [0, 1, 0],
+                        [0, 0, 0],
+                        [1, 0, 0],
+                        [0, 0, 0],
+                        [0, 0, 1]], dtype=float),
+    'hexagonal': np.array([[1, 0],
+                           [0, 1],
+                           [0, 0],
+                           [1, 0],
+                           [0, 0],
+                           [0.5, -0.5]]),
+}
+
+
+def _varray(elem: ElementTree.Element) -> np.ndarray:
+    return np.array([[float(x) for x in v.text.split()] for v in elem.findall('v')])
+
+
+def read_vasprun_step(fname: str, data: Optional[bytes] = None) -> Tuple[Optional[np.ndarray], Optional[float], Optional[np.ndarray]]:
+    """
+    Initial lattice, energy (e_fr_energy, eV) and stress (kBar, VASP sign)
+    of the last ionic step of a vasprun.xml (or of its prefetched content
+    data), a truncated file gives what was written before the error.
+    """
+    lattice = energy = stress = None
+    try:
+        for _, elem in ElementTree.iterparse(io.BytesIO(data) if data is not None else fname):
+            if elem.tag == 'structure' and elem.get('name') == 'initialpos':
+                lattice = _varray(elem.find("crystal/varray[@name='basis']"))
+            elif elem.tag == 'calculation':
+                e = elem.find("energy/i[@name='e_fr_energy']")
+                s = elem.find("varray[@name='stress']")
+                if e is not None:
+                    energy = float(e.text)
+                if s is not None:
+                    stress = _varray(s)
+                elem.clear()
+    except ElementTree.ParseError:
+        log.warning('Truncated %s' % fname)
+    return lattice, energy, stress
+
+
+def read_lattice(fname: str) -> np.ndarray:
+    """
+    Lattice vectors (rows, A) of a POSCAR.
+    """
+    with open(fname) as fid:
+        lines = fid.readlines()
+    scale = float(lines[1].split()[0])
+    lattice = np.array([[float(x) for x in line.split()[:3]] for line in lines[2:5]])
+    if scale < 0:
+        # negative scale is the cell volume
+        scale = (-scale / abs(np.linalg.det(lattice))) ** (1.0 / 3.0)
+    return lattice * scale
+
+
+def lagrangian_strain(ref: np.ndarray, lattices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Deformation gradients F and Lagrangian strains 1/2 (F^T F - I) of
+    stacked lattices (rows are lattice vectors) against ref.
+    """
+    # lattice = ref F^T with lattice vectors as rows
+    F = np.swapaxes(np.linalg.solve(ref[None], lattices), 1, 2)
+    eta = 0.5 * (np.swapaxes(F, 1, 2) @ F - np.eye(3))
+    return F, eta
+
+
+def lattice_type(ref: np.ndarray, ltol: float = 1e-3, atol: float = 0.1) -> str:
+    """
+    2D Bravais lattice of the in-plane vectors of ref.
+    """
+    a, b = np.linalg.norm(ref[0]), np.linalg.norm(ref[1])
+    gamma = np.degrees(np.arccos(np.dot(ref[0], ref[1]) / a / b))
+    equal = abs(a - b) < ltol * max(a, b)
+    if abs(gamma - 90) < atol:
+        return 'square' if equal else 'rectangular'
+    if equal and (abs(gamma - 60) < atol or abs(gamma - 120) < atol):
+        return 'hexagonal'
+    return 'oblique'
+
+
+def read_deformations(task_dir: str, prop: str, manifest: Optional[MechanicsManifest] = None,
+                      max_workers: int = PREFETCH_WORKERS) -> Tuple[np.ndarray, Dict[str, Dict]]:
+    """
+    Reference lattice and steps of all deformation modes of one approach.
+
+    Args:
+        manifest (MechanicsManifest): scan of task_dir, scanned here if not given
+        max_workers (int): threads prefetching the vasprun.xml files
+    Returns:
+        ref, {mode: {'steps', 'strain', 'direction', 'energy', 'stress', 'F', 'c'}}
+        with the steps sorted by strain, stress in kBar with the VASP sign
+        and c the length of the third lattice vector
+    """
+    manifest = manifest if manifest else scan_mechanics(task_dir, [prop])
+    ref = read_lattice(os.path.join(task_dir, 'POSCAR'))
+    entries = sorted(manifest.modes(prop).items())
+    # prefetched in the order they are consumed below
+    fnames = [step.file('vasprun.xml') for _, entry in entries for step in entry.steps
+              if step.has('vasprun.xml')]
+    contents = prefetch(fnames, max_workers)
+    modes = {}
+    for mode, entry in entries:
+        steps, lattices, energies, stresses = [], [], [], []
+        for step in entry.steps:
+            if not step.has('vasprun.xml'):
+                log.warning('No vasprun.xml in %s' % step.path)
+                continue
+            fname, data = next(contents)
+            assert fname == step.file('vasprun.xml'), 'prefetched %s for step %s' % (fname, step.path)
+            lattice, energy, stress = read_vasprun_step(fname, data) if data is not None else (None, None, None)
+            if lattice is None or energy is None or stress is None:
+                log.warning('Incomplete step %s' % step.path)
+                continue
+            steps.append(step.name)
+            lattices.append(lattice)
+            energies.append(energy)
+            stresses.append(stress)
+        if len(steps) < 2:
+            log.warning('Skip deformation %s with %d steps' % (mode, len(steps)))
+            continue
+        F, eta = lagrangian_strain(ref, np.array(lattices))
+        voigt = np.stack([eta[:, 0, 0], eta[:, 1, 1], 2 * eta[:, 0, 1]], axis=1)
+        tensor = np.stack([eta[:, 0, 0], eta[:, 1, 1], eta[:, 0, 1]], axis=1)
+        # the strain of a step is its largest tensor component, strains and
+        # directions are rounded like the nominal ones of m2d
+        big = np.argmax(np.abs(tensor).max(axis=1))
+        k = np.argmax(np.abs(tensor[big]))
+        strain = np.round(tensor[:, k], 6)
+        if prop != 'ssc_stress':
+            strain[strain == 0] = M2D_ZERO_STRAIN
+        order = np.argsort(strain, kind='stable')
+        modes[mode] = {'steps': [steps[i] for i in order],
+                       'strain': strain[order],
+                       'direction': np.round(voigt[big] / tensor[big, k], 3),
+                       'energy': np.array(energies)[order],
+                       'stress': np.array(stresses)[order],
+                       'F': F[order],
+                       'c': np.array(lattices)[order, 2, 2]}
+    return ref, modes
+
+
+def polyfit_many(x: np.ndarray, y: np.ndarray, order: int) -> np.ndarray:
+    """
+    Least squares polynomials of stacked curves.
+
+    Args:
+        x (array): (m, n) abscissae
+        y (array): (m, n) or (m, n, r) ordinates
+    Returns:
+        (m, order+1) or (m, order+1, r) coefficients, constant term first
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    rhs = y if y.ndim == 3 else y[..., None]
+    # scaled abscissae keep the normal equations well conditioned
+    scale = np.abs(x).max(axis=1, keepdims=True)
+    scale[scale == 0] = 1.0
+    powers = np.arange(order + 1)
+    V = (x / scale)[..., None] ** powers
+    Vt = np.swapaxes(V, 1, 2)
+    p = np.linalg.solve(Vt @ V, Vt @ rhs) / scale[..., None] ** powers[None, :, None]
+    return p if y.ndim == 3 else p[..., 0]
+
+
+def _fit_curves(modes: Dict[str, Dict], names: List[str], y: Dict[str, np.ndarray], order: int) -> Dict[str, np.ndarray]:
+    # modes sharing a number of steps are fitted in one call
+    groups = {}
+    for name in names:
+        groups.setdefault(len(modes[name]['strain']), []).append(name)
+    ret = {}
+    for n, group in groups.items():
+        if n <= order:
+            raise RuntimeError('%d steps can not be fitted with order %d' % (n, order))
+        p = polyfit_many(np.array([modes[name]['strain'] for name in group]),
+                         np.array([y[name] for name in group]), order)
+        ret.update(zip(group, p))
+    return ret
+
+
+def _solve_constants(rows: np.ndarray, target: np.ndarray, lattice: str) -> np.ndarray:
+    basis = LATTICE_BASIS[lattice]
+    A = rows @ basis
+    if np.linalg.matrix_rank(A) < basis.shape[1]:
+        raise RuntimeError('Deformations do not determine the elastic constants of a %s lattice' % lattice)
+    c = basis @ np.linalg.lstsq(A, target, rcond=None)[0]
+    return np.array([[c[0], c[1], c[2]],
+                     [c[1], c[3], c[4]],
+                     [c[2], c[4], c[5]]])
+
+
+def fit_energy(ref: np.ndarray, modes: Dict[str, Dict], order: int = ENERGY_ORDER,
+               lattice: Optional[str] = None) -> np.ndarray:
+    """
+    3x3 stiffness tensor (N/m) from the energy-strain curves.
+    """
+    lattice = lattice if lattice else lattice_type(ref)
+    names = sorted(modes)
+    p = _fit_curves(modes, names, {name: modes[name]['energy'] for name in names}, order)
+    area = np.linalg.norm(np.cross(ref[0], ref[1]))
+    rows, target = [], []
+    for name in names:
+        d1, d2, d6 = modes[name]['direction']
+        rows.append(0.5 * np.array([d1 * d1, 2 * d1 * d2, 2 * d1 * d6, d2 * d2, 2 * d2 * d6, d6 * d6]))
+        target.append(p[name][2] / area * EV_A2_TO_NM)
+    return _solve_constants(np.array(rows), np.array(target), lattice)
+
+
+def lagrangian_stress(mode: Dict) -> np.ndarray:
+    """
+    Second Piola-Kirchhoff stress J F^-1 sigma F^-T of the steps (kBar, VASP sign).
+    """
+    F = mode['F']
+    Fi = np.linalg.inv(F)
+    return np.linalg.det(F)[:, None, None] * Fi @ mode['stress'] @ np.swapaxes(Fi, 1, 2)
+
+
+def fit_stress(ref: np.ndarray, modes: Dict[str, Dict], order: int = STRESS_ORDER,
+               lattice: Optional[str] = None) -> np.ndarray:
+    """
+    3x3 stiffness tensor (N/m) from the slopes of the Lagrangian stress-strain curves.
+    """
+    lattice = lattice if lattice else lattice_type(ref)
+    names = sorted(modes)
+    y = {}
+    for name in names:
+        S = -lagrangian_stress(modes[name]) * modes[name]['c'][:, None, None] * KBAR_A_TO_NM
+        y[name] = np.stack([S[:, 0, 0], S[:, 1, 1], S[:, 0, 1]], axis=1)
+    p = _fit_curves(modes, names, y, order)
+    rows, target = [], []
+    for name in names:
+        d1, d2, d6 = modes[name]['direction']
+        rows += [[d1, d2, d6, 0, 0, 0],
+                 [0, d1, 0, d2, d6, 0],
+                 [0, 0, d1, 0, d2, d6]]
+        target += list(p[name][1])
+    return _solve_constants(np.array(rows, dtype=float), np.array(target), lattice)
+
+
+def energy_table(mode: Dict) -> np.ndarray:
+    """
+    strain, energy (eV) as in Def_*_Energy.dat
+    """
+    return np.column_stack([mode['strain'], mode['energy']])
+
+
+def stress_tables(mode: Dict, prop: str = 'elc_stress') -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Lagrangian and physical stress tables as written by m2d: strain and
+    XX YY ZZ YZ XZ XY. For elc_stress these are in kBar with the VASP sign,
+    for ssc_stress they are in N/m, followed by the energy, and m2d stores
+    the Cauchy stress in the Lagrangian table and the transformed one in
+    the physical table.
+    """
+    lag = lagrangian_stress(mode)[:, TABLE_INDEX[0], TABLE_INDEX[1]]
+    phy = mode['stress'][:, TABLE_INDEX[0], TABLE_INDEX[1]]
+    # out of plane components are not reported
+    lag[:, 2:5] = 0.0
+    phy[:, 2:5] = 0.0
+    if prop == 'elc_stress':
+        return np.column_stack([mode['strain'], lag]), np.column_stack([mode['strain'], phy])
+    factor = -mode['c'][:, None] * KBAR_A_TO_NM
+    return (np.column_stack([mode['strain'], phy * factor, mode['energy']]),
+            np.column_stack([mode['strain'], lag * factor, mode['energy']]))
+
+
+def collect_compliance(database: str, approach: str = 'elc2nd_energy') -> Tuple[List[Tuple[str, str]], np.ndarray]:
+    """
+    Compliance tensors of all materials of a database, read through the
+    block index of the material documents.
+
+    Returns:
+        [(material_id, label)], (n, 6, 6) array
+    """
+    keys, tensors = [], []
+    root = os.path.join(DATASETS_DIR, database)
+    for entry in sorted(os.scandir(root), key=lambda e: e.name) if os.path.isdir(root) else []:
+        fname = os.path.join(entry.path, entry.name + '.json')
+        if not entry.is_dir() or not os.path.isfile(fname):
+            continue
+        try:
+            doc = LazyMaterial(fname).get_property('Mechanics2dDoc', model=False)
+        except KeyError:
+            continue
+        for label, mech in (doc.get('mechanics2d') or {}).items():
+            tensor = ((mech.get(approach) or {}).get('summary') or {}).get('c_tensor')
+            if tensor:
+                keys.append((entry.name, label))
+                tensors.append(tensor)
+    return keys, np.array(tensors, dtype=float).reshape(-1, 6, 6)
+
+
+def screen_polar(database: str, approach: str = 'elc2nd_energy', ntheta: int = 360) -> Dict[str, Any]:
+    """
+    Max/min Young's modulus, its anisotropy ratio and the Poisson's ratio
+    range of every material of a database.
+
+    Returns:
+        {'keys': [(material_id, label)], 'E_max': array, ...}
+    """
+    keys, compliance = collect_compliance(database, approach)
+    ret = polar_statistics(compliance, ntheta) if len(keys) else {}
+    ret['keys'] = keys
+    return ret
+
+
+def benchmark_polar(n: int = 100000, ntheta: int = 360) -> None:
+    """
+    Time polar_statistics on n random orthotropic tensors against a loop
+    over Mechanics2dSummary.polar_ev.
+    """
+    rng = np.random.default_rng(0)
+    c2d = np.zeros((n, 3, 3))
+    c2d[:, 0, 0], c2d[:, 1, 1], c2d[:, 2, 2] = rng.uniform(20, 200, (3, n))
+    c2d[:, 0, 1] = c2d[:, 1, 0] = rng.uniform(0, 0.5, n) * np.sqrt(c2d[:, 0, 0] * c2d[:, 1, 1])
+    t = time.time()
+    stats = polar_statistics(np.linalg.inv(c2d), ntheta)
+    t_batch = time.time() - t
+    m = min(n, 1000)
+    t = time.time()
+    for i in range(m):
+        ev = Mechanics2dSummary.from_tensor(c2d[i]).polar_ev(ntheta)
+        assert abs(ev[:, 1].max() - stats['E_max'][i]) < 1e-6 * stats['E_max'][i]
+    t_loop = (time.time() - t) * n / m
+    print('%d tensors: batched %.3f s  per material loop %.1f s (estimated)' % (n, t_batch, t_loop))
+
+
+def benchmark_elastic2d(task_dir: str, order: int = ENERGY_ORDER) -> None:
+    """
+    Time the energy and stress fits of a task directory and compare the
+    energy result with the EV_theta.dat written by m2d, if there is one.
+    """
+    for prop, fit, kwargs in [('elc_energy', fit_energy, {'order': order}), ('elc_stress', fit_stress, {})]:
+        if not os.path.isdir(os.path.join(task_dir, prop)):
+            continue
+        t = time.time()
+        ref, modes = read_deformations(task_dir, prop)
+        t_read = time.time() - t
+        t = time.time()
+        c2d = fit(ref, modes, **kwargs)
+        t_fit = time.time() - t
+        print('%s: read %d steps %.3f s  fit %.4f s' % (prop, sum(len(m['steps']) for m in modes.values()), t_read, t_fit))
+        print(np.array2string(c2d, precision=4, suppress_small=True))
+        fname = os.path.join(task_dir, 'EV_theta.dat')
+        if prop == 'elc_energy' and os.path.isfile(fname):
+            m2d = np.loadtxt(fname)
+            ev = Mechanics2dSummary.from_tensor(c2d).polar_ev(len(m2d))
+            print('max |dE| %.2e N/m  max |dv| %.2e against m2d' % (np.abs(ev[:, 1] - m2d[:, 1]).max(),
+                                                                 np.abs(ev[:, 2] - m2d[:, 2]).max()))
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) > 1:
+        benchmark_elastic2d(sys.argv[1], *[int(x) for x in sys.argv[2:3]])
+    else:
+        benchmark_polar()
@@ -0,0 +1,229 @@
+"""
+3D elastic constant engine (stress method).
+
+A task directory holds the reference POSCAR and the strained calculations
+``elc_stress/Def_*/Def_*_NNN`` (the layout of the 2d tree, see elastic2d).
+The Lagrangian strain of every step follows from its lattice and the
+reference lattice, the second Piola-Kirchhoff stress from the stress of the
+last ionic step of its ``vasprun.xml``. With the Voigt vectors (engineering
+shear strain) of all steps stacked, the 6x6 stiffness tensor is the least
+squares solution of
+
+    S = S0 + e.C
+
+where S0 absorbs the residual stress of the reference. The vasprun files of
+any number of materials are read in one pool of processes and materials with
+the same number of steps are fitted in one batched solve.
+"""
+import os
+import time
+from multiprocessing import Pool
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from matvirdkit import log
+from matvirdkit.model.mechanics import elastic_moduli
+from matvirdkit.builder.elastic2d import read_lattice, read_vasprun_step, lagrangian_strain
+from matvirdkit.builder.manifest import MechanicsManifest, scan_mechanics
+
+__author__ = 'Haidi Wang'
+__email__ = 'haidi@hfut.edu.cn'
+
+KBAR_TO_GPA = 0.1
+# Voigt order xx yy zz yz xz xy
+VOIGT_INDEX = ([0, 1, 2, 1, 0, 0], [0, 1, 2, 2, 2, 1])
+VOIGT_SHEAR = np.array([1, 1, 1, 2, 2, 2], dtype=float)
+
+
+def find_steps(task_dir: str, prop: str = 'elc_stress',
+               manifest: Optional[MechanicsManifest] = None) -> Dict[str, List[str]]:
+    """
+    Strained calculations of a task directory, {mode: [step directories]},
+    from its manifest (scanned here if not given).
+    """
+    manifest = manifest if manifest else scan_mechanics(task_dir, [prop])
+    return {mode: [step.path for step in entry.steps] for mode, entry in sorted(manifest.modes(prop).items())}
+
+
+def _read_step(step_dir: str):
+    fname = os.path.join(step_dir, 'vasprun.xml')
+    if not os.path.isfile(fname):
+        return None, None, None
+    return read_vasprun_step(fname)
+
+
+def read_steps(step_dirs: List[str], nprocs: int = 1) -> List[Tuple]:
+    """
+    (lattice, energy, stress) of the last ionic step of each step
+    directory, parsed in a pool of nprocs processes.
+    """
+    if nprocs > 1 and len(step_dirs) > 1:
+        with Pool(processes=min(nprocs, len(step_dirs))) as pool:
+            return pool.map(_read_step, step_dirs, chunksize=max(1, len(step_dirs) // (4 * nprocs)))
+    return [_read_step(d) for d in step_dirs]
+
+
+def voigt_strain(eta: np.ndarray) -> np.ndarray:
+    """
+    Voigt vectors (engineering shear) of stacked 3x3 strain tensors.
+    """
+    return eta[..., VOIGT_INDEX[0], VOIGT_INDEX[1]] * VOIGT_SHEAR
+
+
+def voigt_stress(sigma: np.ndarray) -> np.ndarray:
+    return sigma[..., VOIGT_INDEX[0], VOIGT_INDEX[1]]
+
+
+def assemble(ref: np.ndarray, modes: Dict[str, List[str]], results: Dict[str, Tuple]) -> Dict[str, Dict]:
+    """
+    Strains and stresses of the deformation modes of one material.
+
+    Returns:
+        {mode: {'steps', 'strain' (n, 6), 'stress' (n, 6) in GPa, 'energy'}},
+        the second Piola-Kirchhoff stress with the tensile sign
+    """
+    ret = {}
+    for mode, step_dirs in modes.items():
+        steps, lattices, energies, stresses = [], [], [], []
+        for step_dir in step_dirs:
+            lattice, energy, stress = results[step_dir]
+            if lattice is None or stress is None:
+                log.warning('Incomplete step %s' % step_dir)
+                continue
+            steps.append(os.path.basename(step_dir))
+            lattices.append(lattice)
+            energies.append(energy)
+            stresses.append(stress)
+        if not steps:
+            log.warning('Skip deformation %s without steps' % mode)
+            continue
+        F, eta = lagrangian_strain(ref, np.array(lattices))
+        Fi = np.linalg.inv(F)
+        pk2 = np.linalg.det(F)[:, None, None] * Fi @ np.array(stresses) @ np.swapaxes(Fi, 1, 2)
+        ret[mode] = {'steps': steps,
+                     'strain': voigt_strain(eta),
+                     'stress': -KBAR_TO_GPA * voigt_stress(pk2),
+                     'energy': np.array(energies, dtype=float)}
+    return ret
+
+
+def read_deformations(task_dirs: List[str], prop: str = 'elc_stress', nprocs: int = 1,
+                      manifests: Optional[List[Optional[MechanicsManifest]]] = None) -> List[Tuple[np.ndarray, Dict[str, Dict]]]:
+    """
+    Reference lattices and deformation modes (see assemble) of several task
+    directories, with all vasprun.xml files parsed in one pool.
+    """
+    manifests = manifests if manifests else [None] * len(task_dirs)
+    trees = [(read_lattice(os.path.join(d, 'POSCAR')), find_steps(d, prop, m)) for d, m in zip(task_dirs, manifests)]
+    step_dirs = [s for _, modes in trees for steps in modes.values() for s in steps]
+    t = time.time()
+    results = dict(zip(step_dirs, read_steps(step_dirs, nprocs)))
+    log.debug('read %d steps in %.2f s' % (len(step_dirs), time.time() - t))
+    return [(ref, assemble(ref, modes, results)) for ref, modes in trees]
+
+
+def stack_modes(modes: Dict[str, Dict]) -> Tuple[np.ndarray, np.ndarray]:
+    names = sorted(modes)
+    return (np.concatenate([modes[m]['strain'] for m in names]),
+            np.concatenate([modes[m]['stress'] for m in names]))
+
+
+def fit_stiffness_many(strains: np.ndarray, stresses: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Least squares stiffness tensors of stacked strain-stress sets.
+
+    Args:
+        strains (array): (m, n, 6) Voigt strains
+        stresses (array): (m, n, 6) Voigt stresses
+    Returns:
+        (m, 6, 6) symmetrised stiffness and (m, 6) residual stress
+    """
+    strains = np.asarray(strains, dtype=float)
+    stresses = np.asarray(stresses, dtype=float)
+    m, n, _ = strains.shape
+    # scaled strains keep the normal equations well conditioned
+    scale = np.abs(strains).max(axis=(1, 2))
+    scale[scale == 0] = 1.0
+    A = np.concatenate([np.ones((m, n, 1)), strains / scale[:, None, None]], axis=2)
+    At = np.swapaxes(A, 1, 2)
+    AtA = At @ A
+    if (np.linalg.matrix_rank(AtA) < 7).any():
+        raise RuntimeError('Deformations do not determine the 6x6 stiffness tensor')
+    x = np.linalg.solve(AtA, At @ stresses)
+    C = x[:, 1:] / scale[:, None, None]
+    return 0.5 * (C + np.swapaxes(C, 1, 2)), x[:, 0]
+
+
+def fit_stiffness(modes: Dict[str, Dict]) -> np.ndarray:
+    """
+    6x6 stiffness tensor (GPa) of one material.
+    """
+    strains, stresses = stack_modes(modes)
+    return fit_stiffness_many(strains[None], stresses[None])[0][0]
+
+
+def fit_materials(task_dirs: List[str], prop: str = 'elc_stress', nprocs: int = 1) -> List[Optional[np.ndarray]]:
+    """
+    Stiffness tensors of several materials, None where the fit failed.
+    Materials with the same number of steps are fitted in one call.
+    """
+    data = [stack_modes(modes) if modes else None for _, modes in read_deformations(task_dirs, prop, nprocs)]
+    groups = {}
+    for i, d in enumerate(data):
+        if d is not None:
+            groups.setdefault(len(d[0]), []).append(i)
+    ret = [None] * len(task_dirs)
+    for n, group in groups.items():
+        try:
+            C, _ = fit_stiffness_many(np.array([data[i][0] for i in group]), np.array([data[i][1] for i in group]))
+            for i, c in zip(group, C):
+                ret[i] = c
+        except RuntimeError as exc:
+            log.warning('%d materials with %d steps: %s' % (len(group), n, exc))
+    return ret
+
+
+def stress_table(mode: Dict) -> np.ndarray:
+    """
+    Largest strain component of each step and the Voigt stresses (GPa):
+    strain XX YY ZZ YZ XZ XY
+    """
+    strain = mode['strain']
+    k = np.argmax(np.abs(strain).max(axis=0))
+    return np.column_stack([strain[:, k], mode['stress']])
+
+
+def benchmark_elastic3d(n: int = 10000, nsteps: int = 24) -> None:
+    """
+    Time fit_stiffness_many and elastic_moduli on n random materials
+    against a per material lstsq loop.
+    """
+    rng = np.random.default_rng(0)
+    L = rng.normal(size=(n, 6, 6))
+    C = L @ np.swapaxes(L, 1, 2) * 20 + 100 * np.eye(6)
+    strains = rng.uniform(-0.01, 0.01, (n, nsteps, 6))
+    stresses = strains @ C + rng.normal(scale=1e-3, size=(n, nsteps, 6))
+    t = time.time()
+    fitted, _ = fit_stiffness_many(strains, stresses)
+    moduli = elastic_moduli(fitted)
+    t_batch = time.time() - t
+    m = min(n, 1000)
+    t = time.time()
+    for i in range(m):
+        A = np.column_stack([np.ones(nsteps), strains[i]])
+        c = np.linalg.lstsq(A, stresses[i], rcond=None)[0][1:]
+        elastic_moduli(0.5 * (c + c.T))
+    t_loop = (time.time() - t) * n / m
+    print('%d materials: batched %.3f s  per material loop %.2f s (estimated)' % (n, t_batch, t_loop))
+    print('max |dC| %.2e GPa, %d unstable' % (np.abs(fitted - C).max(), (moduli['min_eig'] <= 0).sum()))
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) > 1:
+        for task_dir, c in zip(sys.argv[1:], fit_materials(sys.argv[1:], nprocs=4)):
+            print(task_dir)
+            print(np.array2string(c, precision=2, suppress_small=True) if c is not None else 'failed')
+    else:
+        benchmark_elastic3d()
@@ -0,0 +1,285 @@
+"""
+Batched equation of state fits.
+
+A scan is a directory of calculations (any sub directory holding a
+vasprun.xml) at different volumes, areas or strains. The energies and
+lattices of the last ionic steps of all scans are read in one pool of
+processes (see elastic3d.read_steps) and the curves are fitted together:
+
+    birch_murnaghan  the third order Birch-Murnaghan form is a cubic in
+                     V^(-2/3), so it is an exact batched linear least squares
+    vinet            batched Levenberg-Marquardt on (E0, B0, B0', V0),
+                     started from the Birch-Murnaghan parameters
+    polynomial       batched polynomial in the abscissa, the minimum is
+                     located on a grid and refined by Newton steps
+
+Every form gives the minimum energy E0, the equilibrium abscissa x0 and,
+for volume (area) scans, the bulk (layer) modulus and its pressure
+derivative.
+"""
+import os
+import time
+from glob import glob
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from matvirdkit import log
+from matvirdkit.builder.elastic2d import polyfit_many, read_lattice, lagrangian_strain, EV_A2_TO_NM
+from matvirdkit.builder.elastic3d import read_steps
+
+__author__ = 'Haidi Wang'
+__email__ = 'haidi@hfut.edu.cn'
+
+EV_A3_TO_GPA = 160.21766208
+EOS_FORMS = ['birch_murnaghan', 'vinet', 'polynomial']
+# modulus unit of the abscissa, strain scans have no modulus
+MODULUS_UNIT = {'volume': EV_A3_TO_GPA, 'area': EV_A2_TO_NM}
+POLY_ORDER = 4
+LM_ITER = 50
+
+
+def find_scan(scan_dir: str) -> List[str]:
+    return sorted(d for d in glob(os.path.join(scan_dir, '*'))
+                  if os.path.isfile(os.path.join(d, 'vasprun.xml')))
+
+
+def abscissa(lattices: np.ndarray, x: str = 'volume', ref: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Volume (A^3), in-plane area (A^2) or the largest Lagrangian strain
+    component against ref of stacked lattices.
+    """
+    if x == 'volume':
+        return np.abs(np.linalg.det(lattices))
+    if x == 'area':
+        return np.linalg.norm(np.cross(lattices[:, 0], lattices[:, 1]), axis=1)
+    if x == 'strain':
+        _, eta = lagrangian_strain(ref, lattices)
+        flat = eta.reshape(len(eta), 9)
+        return flat[:, np.argmax(np.abs(flat).max(axis=0))]
+    raise RuntimeError('Unknown abscissa %s' % x)
+
+
+def read_scans(scans: Dict[str, Dict], nprocs: int = 1) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Curves of several scans, all vasprun.xml files parsed in one pool.
+
+    Args:
+        scans (dict): {key: {'task_dir', 'x': 'volume'|'area'|'strain'}},
+            strain scans need a reference POSCAR in task_dir
+    Returns:
+        {key: (x, energy)} sorted by x
+    """
+    steps = {key: find_scan(info['task_dir']) for key, info in scans.items()}
+    step_dirs = [s for v in steps.values() for s in v]
+    results = dict(zip(step_dirs, read_steps(step_dirs, nprocs)))
+    ret = {}
+    for key, info in scans.items():
+        good = [results[s] for s in steps[key] if results[s][0] is not None and results[s][1] is not None]
+        if len(good) < 4:
+            log.warning('Skip scan %s with %d steps' % (key, len(good)))
+            continue
+        kind = info.get('x', 'volume')
+        ref = read_lattice(os.path.join(info['task_dir'], 'POSCAR')) if kind == 'strain' else None
+        x = abscissa(np.array([g[0] for g in good]), kind, ref)
+        energy = np.array([g[1] for g in good])
+        order = np.argsort(x)
+        ret[key] = (x[order], energy[order])
+    return ret
+
+
+def _polyval_many(p: np.ndarray, x: np.ndarray) -> np.ndarray:
+    # p (m, k) constant term first, x (m, n)
+    return (x[..., None] ** np.arange(p.shape[1]) * p[:, None, :]).sum(-1)
+
+
+def _polyder_many(p: np.ndarray, n: int = 1) -> np.ndarray:
+    for _ in range(n):
+        p = p[:, 1:] * np.arange(1, p.shape[1])
+    return p
+
+
+def fit_birch_murnaghan(V: np.ndarray, E: np.ndarray) -> np.ndarray:
+    """
+    Third order Birch-Murnaghan fits of stacked curves.
+
+    Args:
+        V (array): (m, n) volumes (or areas)
+        E (array): (m, n) energies
+    Returns:
+        (m, 4) E0, B0 (energy/volume units), B0', V0; nan where the curve has
+        no minimum
+    """
+    x = V ** (-2.0 / 3.0)
+    a = polyfit_many(x, E, 3)
+    d1, d2, d3 = _polyder_many(a, 1), _polyder_many(a, 2), _polyder_many(a, 3)
+    # minimum of the cubic in x: root of E_x with E_xx > 0
+    A, B, C = 3 * a[:, 3], 2 * a[:, 2], a[:, 1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        disc = np.sqrt(B * B - 4 * A * C)
+        r1 = np.where(np.abs(A) > 1e-12 * np.abs(B), (-B + disc) / (2 * A), -C / B)
+        r2 = np.where(np.abs(A) > 1e-12 * np.abs(B), (-B - disc) / (2 * A), -C / B)
+        x0 = np.where(_polyval_many(d2, r1[:, None])[:, 0] > 0, r1, r2)
+        v0 = x0 ** (-1.5)
+    ex = _polyval_many(d1, x0[:, None])[:, 0]
+    exx = _polyval_many(d2, x0[:, None])[:, 0]
+    exxx = d3[:, 0]
+    # derivatives of x(V) = V^(-2/3)
+    x1 = -2.0 / 3.0 * v0 ** (-5.0 / 3.0)
+    x2 = 10.0 / 9.0 * v0 ** (-8.0 / 3.0)
+    x3 = -80.0 / 27.0 * v0 ** (-11.0 / 3.0)
+    evv = exx * x1 ** 2 + ex * x2
+    evvv = exxx * x1 ** 3 + 3 * exx * x1 * x2 + ex * x3
+    e0 = _polyval_many(a, x0[:, None])[:, 0]
+    b0 = v0 * evv
+    b1 = -(1 + v0 * evvv / evv)
+    params = np.column_stack([e0, b0, b1, v0])
+    params[~np.isfinite(params).all(axis=1) | (exx <= 0)] = np.nan
+    return params
+
+
+def birch_murnaghan(V: np.ndarray, params: np.ndarray) -> np.ndarray:
+    e0, b0, b1, v0 = [params[:, i:i + 1] for i in range(4)]
+    eta = (v0 / V) ** (2.0 / 3.0)
+    return e0 + 9.0 * v0 * b0 / 16.0 * ((eta - 1) ** 3 * b1 + (eta - 1) ** 2 * (6 - 4 * eta))
+
+
+def vinet(V: np.ndarray, params: np.ndarray) -> np.ndarray:
+    e0, b0, b1, v0 = [params[:, i:i + 1] for i in range(4)]
+    eta = (V / v0) ** (1.0 / 3.0)
+    return e0 + 2.0 * b0 * v0 / (b1 - 1.0) ** 2 * (
+        2.0 - (5.0 + 3.0 * b1 * (eta - 1.0) - 3.0 * eta) * np.exp(-3.0 * (b1 - 1.0) * (eta - 1.0) / 2.0))
+
+
+def levenberg_marquardt(func, x: np.ndarray, y: np.ndarray, p0: np.ndarray,
+                        niter: int = LM_ITER, tol: float = 1e-12) -> np.ndarray:
+    """
+    Batched Levenberg-Marquardt least squares of y ~ func(x, p).
+
+    Args:
+        func: model, func((m, n), (m, k)) -> (m, n)
+        x, y (array): (m, n) data
+        p0 (array): (m, k) start parameters
+    Returns:
+        (m, k) parameters
+    """
+    p = p0.copy()
+    m, k = p.shape
+    lam = np.full(m, 1e-3)
+    r = func(x, p) - y
+    cost = (r * r).sum(1)
+    for _ in range(niter):
+        # forward difference Jacobian, one model evaluation per parameter
+        h = 1e-7 * np.maximum(np.abs(p), 1e-8)
+        J = np.empty(r.shape + (k,))
+        for i in range(k):
+            dp = p.copy()
+            dp[:, i] += h[:, i]
+            J[..., i] = (func(x, dp) - y - r) / h[:, i:i + 1]
+        JtJ = np.swapaxes(J, 1, 2) @ J
+        g = np.swapaxes(J, 1, 2) @ r[..., None]
+        damp = JtJ + lam[:, None, None] * (np.eye(k) * JtJ.diagonal(axis1=1, axis2=2)[:, :, None])
+        with np.errstate(all='ignore'):
+            step = np.linalg.solve(damp + 1e-300 * np.eye(k), -g)[..., 0]
+            trial = p + step
+            r_trial = func(x, trial) - y
+            cost_trial = (r_trial * r_trial).sum(1)
+        better = np.isfinite(cost_trial) & (cost_trial < cost)
+        p[better], r[better] = trial[better], r_trial[better]
+        converged = better & (cost - cost_trial < tol * np.maximum(cost, 1e-30))
+        cost[better] = cost_trial[better]
+        lam = np.where(better, lam / 3, lam * 3)
+        if converged.all():
+            break
+    return p
+
+
+def fit_polynomial(x: np.ndarray, E: np.ndarray, order: int = POLY_ORDER, ngrid: int = 256) -> np.ndarray:
+    """
+    Polynomial fits of stacked curves.
+
+    Returns:
+        (m, 4) E0, x0 E''(x0), nan, x0 in the layout of the other forms
+    """
+    p = polyfit_many(x, E, order)
+    d1, d2 = _polyder_many(p, 1), _polyder_many(p, 2)
+    grid = x.min(1)[:, None] + (x.max(1) - x.min(1))[:, None] * np.linspace(0, 1, ngrid)
+    x0 = grid[np.arange(len(x)), np.argmin(_polyval_many(p, grid), axis=1)]
+    for _ in range(5):
+        curv = _polyval_many(d2, x0[:, None])[:, 0]
+        step = np.where(curv > 0, _polyval_many(d1, x0[:, None])[:, 0] / np.where(curv > 0, curv, 1), 0)
+        x0 = np.clip(x0 - step, x.min(1), x.max(1))
+    e0 = _polyval_many(p, x0[:, None])[:, 0]
+    return np.column_stack([e0, x0 * _polyval_many(d2, x0[:, None])[:, 0], np.full(len(x), np.nan), x0])
+
+
+def fit_many(x: np.ndarray, E: np.ndarray, form: str = 'birch_murnaghan', order: int = POLY_ORDER) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fit stacked curves with one form.
+
+    Returns:
+        (m, 4) parameters E0, B0, B0', x0 (energy/volume units) and the
+        (m, n) fitted energies
+    """
+    x = np.asarray(x, dtype=float)
+    E = np.asarray(E, dtype=float)
+    if form == 'polynomial':
+        params = fit_polynomial(x, E, order)
+        return params, _polyval_many(polyfit_many(x, E, order), x)
+    params = fit_birch_murnaghan(x, E)
+    if form == 'birch_murnaghan':
+        return params, birch_murnaghan(x, params)
+    if form == 'vinet':
+        ok = np.isfinite(params).all(1)
+        if ok.any():
+            params[ok] = levenberg_marquardt(vinet, x[ok], E[ok], params[ok])
+        return params, vinet(x, params)
+    raise RuntimeError('Unknown equation of state %s' % form)
+
+
+def fit_curves(curves: Dict[str, Tuple[np.ndarray, np.ndarray]], form: str = 'birch_murnaghan',
+               order: int = POLY_ORDER) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Fit curves of any length, curves with the same number of points in one
+    call of fit_many.
+
+    Returns:
+        {key: (params, fitted energies)}
+    """
+    groups = {}
+    for key, (x, _) in curves.items():
+        groups.setdefault(len(x), []).append(key)
+    ret = {}
+    for n, keys in groups.items():
+        params, fitted = fit_many(np.array([curves[k][0] for k in keys]),
+                                  np.array([curves[k][1] for k in keys]), form, order)
+        ret.update({k: (params[i], fitted[i]) for i, k in enumerate(keys)})
+    return ret
+
+
+def benchmark_eos(n: int = 10000, npts: int = 11) -> None:
+    """
+    Time the batched fits of n synthetic Vinet curves against a per curve
+    loop of pymatgen's EOS.
+    """
+    from pymatgen.analysis.eos import EOS as PymatgenEOS
+    rng = np.random.default_rng(0)
+    true = np.column_stack([rng.uniform(-10, -2, n), rng.uniform(0.3, 1.5, n),
+                            rng.uniform(3.5, 5.5, n), rng.uniform(10, 40, n)])
+    V = true[:, 3:4] * np.linspace(0.9, 1.1, npts)
+    E = vinet(V, true) + rng.normal(scale=1e-5, size=V.shape)
+    for form in EOS_FORMS:
+        t = time.time()
+        params, _ = fit_many(V, E, form)
+        print('%-16s %d curves %.2f s  max |dV0|/V0 %.1e  max |dB0|/B0 %.1e' % (
+            form, n, time.time() - t, np.nanmax(np.abs(params[:, 3] / true[:, 3] - 1)),
+            np.nanmax(np.abs(params[:, 1] / true[:, 1] - 1))))
+    m = min(n, 200)
+    t = time.time()
+    for i in range(m):
+        PymatgenEOS('vinet').fit(V[i], E[i])
+    print('pymatgen vinet loop %.1f s (estimated)' % ((time.time() - t) * n / m))
+
+
+if __name__ == '__main__':
+    benchmark_eos()
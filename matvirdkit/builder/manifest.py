@@ -0,0 +1,195 @@
+"""
+One pass discovery of a mechanics task tree.
+
+``scan_mechanics`` walks ``<task_dir>/<approach>/Def_*/Def_*_NNN`` once with
+os.scandir (one directory listing per directory, no glob) and returns a
+MechanicsManifest of the deformation modes, their strain steps, the files of
+every step and the (size, mtime_ns) stamp of the files read later. The
+provenance of the Builder, elastic2d, elastic3d and the mechanics parsers all
+work from the same manifest, so the tree is listed once per material instead
+of once per stage.
+
+``prefetch`` reads the files of the steps in a pool of threads ahead of the
+consumer, which then parses them from memory.
+"""
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from matvirdkit import log
+
+__author__ = 'Haidi Wang'
+__email__ = 'haidi@hfut.edu.cn'
+
+APPROACHES = ('elc_energy', 'elc_stress', 'ssc_stress')
+# files whose stamps are recorded, the other files are only listed
+STAMPED_FILES = ('vasprun.xml',)
+PREFETCH_WORKERS = 8
+_STEP = re.compile(r'^Def_.+_[0-9]{3}$')
+
+
+class StepEntry(NamedTuple):
+    name: str
+    path: str
+    files: Tuple[str, ...]
+    stamps: Dict[str, Tuple[int, int]]
+
+    def has(self, fname: str) -> bool:
+        return fname in self.files
+
+    def file(self, fname: str) -> str:
+        return os.path.join(self.path, fname)
+
+
+class ModeEntry(NamedTuple):
+    name: str
+    path: str
+    steps: List[StepEntry]
+
+
+class MechanicsManifest(NamedTuple):
+    root: str
+    files: Tuple[str, ...]
+    approaches: Dict[str, Dict[str, ModeEntry]]
+
+    def modes(self, prop: str) -> Dict[str, ModeEntry]:
+        return self.approaches.get(prop, {})
+
+    def steps(self, prop: str) -> List[StepEntry]:
+        return [step for mode in self.modes(prop).values() for step in mode.steps]
+
+    def step_dirs(self, prop: str) -> List[str]:
+        return [step.path for step in self.steps(prop)]
+
+
+def _listdir(path: str) -> Tuple[List[os.DirEntry], List[os.DirEntry]]:
+    dirs, files = [], []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir():
+                    dirs.append(entry)
+                elif entry.is_file():
+                    files.append(entry)
+    except FileNotFoundError:
+        pass
+    return sorted(dirs, key=lambda e: e.name), sorted(files, key=lambda e: e.name)
+
+
+def _scan_step(entry: os.DirEntry) -> StepEntry:
+    _, files = _listdir(entry.path)
+    stamps = {}
+    for f in files:
+        if f.name in STAMPED_FILES:
+            st = f.stat()
+            stamps[f.name] = (st.st_size, st.st_mtime_ns)
+    return StepEntry(entry.name, entry.path, tuple(f.name for f in files), stamps)
+
+
+def scan_mechanics(task_dir: str, props: Sequence[str] = APPROACHES,
+                   max_workers: int = 1) -> MechanicsManifest:
+    """
+    Manifest of the approaches props of a mechanics task directory.
+
+    Args:
+        max_workers (int): threads listing the step directories, worth it
+            on network filesystems with a high metadata latency
+    """
+    task_dir = os.path.abspath(task_dir)
+    t = time.time()
+    root_dirs, root_files = _listdir(task_dir)
+    approaches = {}
+    step_entries = []
+    for prop_entry in root_dirs:
+        if prop_entry.name not in props:
+            continue
+        modes = {}
+        for mode_entry in _listdir(prop_entry.path)[0]:
+            if not mode_entry.name.startswith('Def_'):
+                continue
+            steps = [e for e in _listdir(mode_entry.path)[0]
+                     if _STEP.match(e.name) and e.name.startswith(mode_entry.name + '_')]
+            modes[mode_entry.name] = (mode_entry, steps)
+            step_entries.extend(steps)
+        approaches[prop_entry.name] = modes
+    if max_workers > 1 and len(step_entries) > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            scanned = dict(zip([e.path for e in step_entries], pool.map(_scan_step, step_entries)))
+    else:
+        scanned = {e.path: _scan_step(e) for e in step_entries}
+    manifest = MechanicsManifest(
+        task_dir, tuple(f.name for f in root_files),
+        {prop: {name: ModeEntry(name, entry.path, [scanned[s.path] for s in steps])
+                for name, (entry, steps) in modes.items()}
+         for prop, modes in approaches.items()})
+    log.debug('scanned %s: %d steps in %.3f s' % (task_dir, len(step_entries), time.time() - t))
+    return manifest
+
+
+def _read_bytes(fname: str) -> Optional[bytes]:
+    try:
+        with open(fname, 'rb') as fid:
+            return fid.read()
+    except OSError:
+        return None
+
+
+def prefetch(fnames: Sequence[str], max_workers: int = PREFETCH_WORKERS,
+             depth: Optional[int] = None) -> Iterator[Tuple[str, Optional[bytes]]]:
+    """
+    (fname, content) of the files in order, read ahead in max_workers
+    threads with at most depth (default 2 * max_workers) files held in
+    memory; content is None for a file that can not be read.
+    """
+    if max_workers <= 1 or len(fnames) <= 1:
+        for fname in fnames:
+            yield fname, _read_bytes(fname)
+        return
+    depth = depth if depth else 2 * max_workers
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        window = deque()
+        for fname in fnames:
+            window.append((fname, pool.submit(_read_bytes, fname)))
+            if len(window) >= depth:
+                head, future = window.popleft()
+                yield head, future.result()
+        while window:
+            head, future = window.popleft()
+            yield head, future.result()
+
+
+def benchmark_manifest(task_dir: str, repeat: int = 10) -> None:
+    """
+    Time the glob based discovery of the three mechanics stages against one
+    scan_mechanics, and the read and parse of the vasprun.xml files of all
+    approaches without and with prefetch.
+    """
+    from glob import glob
+    from matvirdkit.builder.elastic2d import read_deformations
+    t = time.time()
+    for _ in range(repeat):
+        for prop in APPROACHES:
+            glob(os.path.join(task_dir, prop, 'Def_*/Def_*_[0-9][0-9][0-9]'))
+            for mode_dir in glob(os.path.join(task_dir, prop, 'Def_*')):
+                mode = os.path.basename(mode_dir)
+                for step_dir in glob(os.path.join(mode_dir, mode + '_[0-9][0-9][0-9]')):
+                    os.path.isfile(os.path.join(step_dir, 'vasprun.xml'))
+    t_glob = (time.time() - t) / repeat
+    t = time.time()
+    for _ in range(repeat):
+        manifest = scan_mechanics(task_dir)
+    t_scan = (time.time() - t) / repeat
+    print('%d steps: glob %.4f s  scan %.4f s' % (sum(len(manifest.steps(p)) for p in APPROACHES), t_glob, t_scan))
+    for workers in [1, PREFETCH_WORKERS]:
+        t = time.time()
+        for prop in APPROACHES:
+            read_deformations(task_dir, prop, manifest=manifest, max_workers=workers)
+        print('read %d workers: %.3f s' % (workers, time.time() - t))
+
+
+if __name__ == '__main__':
+    import sys
+    benchmark_manifest(sys.argv[1])
@@ -1,161 +1,337 @@
 import os
-import subprocess
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from uuid import uuid4
 from glob import glob
 from monty.serialization import loadfn,dumpfn
 from matvirdkit.model.utils import jsanitize
-from matvirdkit import log
+from matvirdkit import log, ARRAY_CURVES, ARRAY_FLOAT32, CURVE_TOLERANCE
 from matvirdkit.model.mechanics import Mechanics2d, Mechanics2dDoc,Mechanics2dSummary,Elc2nd2d,StressStrain
+from matvirdkit.model.mechanics import Mechanics3dSummary,EOS
 from matvirdkit.model.common import DataFigure,JFData
-from matvirdkit.model.utils import create_path,transfer_file,jsanitize
+from matvirdkit.model.utils import create_path,jsanitize,dump_arrays
 from matvirdkit import REPO_DIR as repo_dir
+from matvirdkit.builder.elastic2d import read_deformations,fit_energy,fit_stress,energy_table,stress_tables
+from matvirdkit.builder.elastic2d import ENERGY_ORDER,STRESS_ORDER
+from matvirdkit.builder import elastic3d
+from matvirdkit.builder.eos import read_scans,fit_curves,MODULUS_UNIT
+from matvirdkit.builder.render import recipe
+from matvirdkit.builder.manifest import scan_mechanics
 #from matvirdkit.builder.task import VaspTask
 
-def mechanics2d_parser(task_dir,dst_dir,prop, code= 'vasp'):
+STRESS_HEADER = '%s strain          XX           YY           ZZ           YZ           XZ           XY '
+SSC_HEADER = STRESS_HEADER + '(N/m)  energy (eV)'
+POLAR_NTHETA = 360
+EOS_XLABEL = {'volume': 'Volume (A$^3$)', 'area': 'Area (A$^2$)', 'strain': 'Lagrangian strain'}
 
+def rdp_mask(x, y, tolerance):
+    """
+    Points of a curve kept by Ramer-Douglas-Peucker decimation: the curve
+    is split at its worst point until the linear interpolation between the
+    kept points deviates from every column of y by at most tolerance times
+    the range of that column. All segments are refined together.
+
+    Args:
+        x (array): (n,) increasing abscissa
+        y (array): (n,) or (n, k) ordinates
+    Returns:
+        (n,) bool mask, the end points are always kept
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float).reshape(len(x), -1)
+    scale = np.ptp(y, axis=0)
+    y = y / np.where(scale > 0, scale, 1.0)
+    n = len(x)
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, -1]] = True
+    points = np.arange(n)
+    while True:
+        idx = np.nonzero(keep)[0]
+        seg = np.clip(np.searchsorted(idx, points, side='right') - 1, 0, len(idx) - 2)
+        i0, i1 = idx[seg], idx[seg + 1]
+        dx = x[i1] - x[i0]
+        t = np.where(dx != 0, (x - x[i0]) / np.where(dx != 0, dx, 1.0), 0.0)
+        err = np.abs(y - (y[i0] + t[:, None] * (y[i1] - y[i0]))).max(axis=1)
+        err[keep] = 0.0
+        # worst point of every segment
+        order = np.lexsort((-err, seg))
+        first = order[np.r_[True, seg[order][1:] != seg[order][:-1]]]
+        split = first[err[first] > tolerance]
+        if not len(split):
+            return keep
+        keep[split] = True
+
+def _curve_data(description, arrays, dst_dir, fname, float32=ARRAY_FLOAT32, meta=None, tolerance=0.0, full=None):
+    """
+    JFData of curve arrays: a binary sidecar fname (relative to the material
+    directory, i.e. the parent of dst_dir) when ARRAY_CURVES is set,
+    otherwise inline json lists.
+
+    With a tolerance the rows of the arrays (sharing their first column as
+    abscissa) are decimated by rdp_mask; the tolerance, the number of points
+    kept (points) and before decimation (points_full) and the full
+    resolution table full are recorded in meta.
+    """
+    meta = dict(meta) if meta else {}
+    arrays = {k: np.asarray(v) for k,v in arrays.items()}
+    if tolerance and tolerance > 0:
+       x = arrays[sorted(arrays)[0]][:,0]
+       mask = rdp_mask(x, np.column_stack([v[:,1:] for v in arrays.values()]), tolerance)
+       meta.update({'tolerance': tolerance, 'points': int(mask.sum()), 'points_full': int(len(mask)),
+                    'full': full})
+       arrays = {k: v[mask] for k,v in arrays.items()}
+    if not ARRAY_CURVES:
+       return JFData(description=description, json_data={k: v.tolist() for k,v in arrays.items()},
+             json_file_name=None,json_id=None,meta=meta)
+    layout, digest = dump_arrays(arrays, os.path.join(os.path.dirname(dst_dir), fname), float32=float32)
+    meta['hash'] = digest
+    return JFData(description=description, file_fmt='bin', file_name=fname, file_id=None,
+             json_file_name=None,json_id=None, arrays=layout, meta=meta)
+
+def mechanics2d_parser(task_dir,dst_dir,prop, code= 'vasp', order=None, ntheta=POLAR_NTHETA, float32=ARRAY_FLOAT32,
+                       tolerance=CURVE_TOLERANCE, manifest=None):
+    """
+    Elastic constants, deformation curves and stress-strain curves of one
+    approach of a mech2d task directory, fitted in process by
+    matvirdkit.builder.elastic2d. All paths are explicit, the parser never
+    changes the working directory and can run in threads.
+
+    Args:
+        task_dir (str): root of the mech2d calculation holding POSCAR and
+           the elc_energy, elc_stress and ssc_stress trees
+        dst_dir (str): mechanics directory of the material
+        prop (str): 'elc_energy', 'elc_stress' or 'ssc_stress'
+        order (int): polynomial order of the energy-strain (default 4) or
+           stress-strain (default 1) fits
+        ntheta (int): angular resolution of polar_EV, computed from the
+           compliance tensor of the summary
+        float32 (bool): keep the curves in single precision, the .dat
+           tables are written in full
+        tolerance (float): relative error bound of the stored energy-strain
+           and SSC curves (see rdp_mask), 0 keeps every point
+        manifest (MechanicsManifest): scan of task_dir (see
+           builder.manifest), scanned here if not given
+    """
     ret={'summary':{},
          'polar_EV':{},
          'deformations':{},
-         'stress_strain':{},
          'meta':{}
          }
     if not task_dir:
        return ret
 
-    pwd=os.getcwd()
     assert prop in ['elc_energy','elc_stress','ssc_stress']
     log.debug("task_dir: %s"%(task_dir))  
-    os.chdir(task_dir)
     if prop=='elc_energy':
        log.debug('-'*20)
        log.info('Processing %s '%prop)
        log.debug(task_dir)
        log.debug(os.path.join(dst_dir,prop))
-       with open("m2d.ana.log","wb") as out, open("m2d.ana.err","wb") as err:
-            p=subprocess.Popen(["m2d","post","--plot","-f","png"],stdout=out,stderr=err)
-            p.communicate()
-
-       defs=list(map(os.path.basename,glob(os.path.join(task_dir,prop,'Def_*'))))
-       defs.sort()
-       os.chdir(pwd)
+       ref, modes = read_deformations(task_dir, prop, manifest=manifest)
+       order = order if order else ENERGY_ORDER
+       c2d = fit_energy(ref, modes, order=order)
        create_path(os.path.join(dst_dir,prop))
        deformations={}
-       for _def in defs:
+       for _def in sorted(modes):
            create_path(os.path.join(dst_dir,prop,_def))
-           transfer_file(_def+'_Energy.dat',        os.path.join(task_dir,prop,_def) , os.path.join(dst_dir,prop,_def) , rename= False)
-           transfer_file(_def+'_Energy_Strain.png', os.path.join(task_dir,prop,_def) , os.path.join(dst_dir,prop,_def) , rename= False)
-           data = np.loadtxt(os.path.join(dst_dir,prop,_def,_def+'_Energy.dat')).tolist()
-           def_data=JFData(description='Energy v.s. strain data', json_data= {'data':data},
-             json_file_name=None,json_id=None,meta={})
+           data = energy_table(modes[_def])
+           np.savetxt(os.path.join(dst_dir,prop,_def,_def+'_Energy.dat'), data, fmt='%+.10f   %.10f')
+           def_data=_curve_data('Energy v.s. strain data', {'data':data}, dst_dir,
+             os.path.join('mechanics',prop,_def,_def+'_Energy.bin'), float32,
+             tolerance=tolerance, full=os.path.join('mechanics',prop,_def,_def+'_Energy.dat'))
            def_fig=JFData(description='Energy v.s. strain figure',
-             file_fmt='png', file_name=os.path.join('mechanics',prop,_def, _def+'_Energy_Strain.png'),file_id=None)
-             #file_fmt='png', file_name=os.path.join(dst_dir,prop,_def, _def+'_Energy_Strain.png'),file_id=None)
+             file_fmt='png', file_name=os.path.join('mechanics',prop,_def, _def+'_Energy_Strain.png'),file_id=None,
+             recipe=recipe('energy_strain', key='data'))
            def_datafig=DataFigure(data=[def_data],figure=def_fig)
            deformations[_def]=def_datafig
-       os.chdir(pwd)
-       for f in ['EV_theta.dat','Result.json','energy-EV.png']:
-           transfer_file(f, task_dir , os.path.join(dst_dir,prop) , rename= False)
-       transfer_file('energy-EV.png', task_dir , os.path.join(dst_dir,prop) , rename= False)
-       transfer_file(os.path.join(task_dir,'elc_energy','Mech2D.json'), task_dir , dst_dir , rename= False)
-        
-       data=np.loadtxt(os.path.join(dst_dir,prop,'EV_theta.dat')).tolist()
-       ev_data=JFData(description='Angle dependent Young\'s modulus and Poisson\'s ratio figure', json_data= {'data':data},
-             json_file_name=None,json_id=None,meta={})
-       summary=Mechanics2dSummary.from_file(os.path.join(dst_dir,prop,'Result.json'))
+
+       summary=Mechanics2dSummary.from_tensor(c2d)
+       data=summary.polar_ev(ntheta)
+       ev_data=_curve_data('Angle dependent Young\'s modulus and Poisson\'s ratio data', {'data':data}, dst_dir,
+             os.path.join('mechanics',prop,'energy-EV.bin'), float32, meta={'ntheta':ntheta})
        ev_fig=JFData(description='Angle dependent Young\'s modulus and Poisson\'s ratio figure',
-             file_fmt='png', file_name=os.path.join('mechanics',prop,'energy-EV.png'),file_id=None)
-             #file_fmt='png', file_name=os.path.join(dst_dir,prop,'energy-EV.png'),file_id=None)
+             file_fmt='png', file_name=os.path.join('mechanics',prop,'energy-EV.png'),file_id=None,
+             recipe=recipe('polar_ev', key='data'))
        ev_datafig=DataFigure(data=[ev_data],figure=ev_fig)
          
        ret['summary'] = summary
        ret['polar_EV'] = ev_datafig
        ret['deformations']=deformations
-       #dumpfn(jsanitize(Elc2nd2d(**ret)),'test.json')
+       ret['meta']={'order': order}
        
     elif prop=='elc_stress':
        log.debug('-'*20)
        log.info('Processing %s '%prop)
        log.debug(task_dir)
        log.debug(os.path.join(dst_dir,prop))
-       with open("m2d.ana.log","wb") as out, open("m2d.ana.err","wb") as err:
-            p=subprocess.Popen(["m2d","post","-a","stress","-p","elc","--plot","-f","png"],stdout=out,stderr=err)
-            p.communicate()
-       defs=list(map(os.path.basename,glob(os.path.join(task_dir,prop,'Def_*'))))
-       defs.sort()
-       os.chdir(pwd)
+       ref, modes = read_deformations(task_dir, prop, manifest=manifest)
+       order = order if order else STRESS_ORDER
+       c2d = fit_stress(ref, modes, order=order)
        create_path(os.path.join(dst_dir,prop))
        deformations={}
-       for _def in defs:
+       for _def in sorted(modes):
            create_path(os.path.join(dst_dir,prop,_def))
-           transfer_file(_def+'_Physical_Stress.dat',   os.path.join(task_dir,prop,_def) , os.path.join(dst_dir,prop,_def) , rename= False)
-           transfer_file(_def+'_Lagrangian_Stress.dat', os.path.join(task_dir,prop,_def) , os.path.join(dst_dir,prop,_def) , rename= False)
-           transfer_file(_def+'_Lagrangian_Stress.png', os.path.join(task_dir,prop,_def) , os.path.join(dst_dir,prop,_def) , rename= False)
-           data_Lag = np.loadtxt(os.path.join(dst_dir,prop,_def,_def+'_Lagrangian_Stress.dat')).tolist()
-           def_Lag_data=JFData(description='Energy v.s. strain data', json_data= {'data':data_Lag},
-             json_file_name=None,json_id=None,meta={})
-           data_Phy = np.loadtxt(os.path.join(dst_dir,prop,_def,_def+'_Physical_Stress.dat')).tolist()
-           def_Phy_data=JFData(description='Energy v.s. strain data', json_data= {'data':data_Phy},
-             json_file_name=None,json_id=None,meta={})
-           def_fig=JFData(description='Energy v.s. strain figure',
-             file_fmt='png', file_name=os.path.join('mechanics',prop,_def, _def+'_Energy_Strain.png'),file_id=None)
-             #file_fmt='png', file_name=os.path.join(dst_dir,prop,_def, _def+'_Energy_Strain.png'),file_id=None)
+           data_Lag, data_Phy = stress_tables(modes[_def], prop)
+           np.savetxt(os.path.join(dst_dir,prop,_def,_def+'_Lagrangian_Stress.dat'), data_Lag, fmt='%+.10f'+' %16.8f'*6, header=STRESS_HEADER%'Lag.', comments='#')
+           np.savetxt(os.path.join(dst_dir,prop,_def,_def+'_Physical_Stress.dat'), data_Phy, fmt='%+.10f'+' %16.8f'*6, header=STRESS_HEADER%'Phy.', comments='#')
+           def_Lag_data=_curve_data('Lagrangian stress v.s. strain data', {'data':data_Lag}, dst_dir,
+             os.path.join('mechanics',prop,_def,_def+'_Lagrangian_Stress.bin'), float32)
+           def_Phy_data=_curve_data('Physical stress v.s. strain data', {'data':data_Phy}, dst_dir,
+             os.path.join('mechanics',prop,_def,_def+'_Physical_Stress.bin'), float32)
+           def_fig=JFData(description='Lagrangian stress v.s. strain figure',
+             file_fmt='png', file_name=os.path.join('mechanics',prop,_def, _def+'_Lagrangian_Stress.png'),file_id=None,
+             recipe=recipe('stress_strain', key='data', ylabel='Lagrangian stress (kBar)'))
            def_datafig=DataFigure(data=[def_Lag_data, def_Phy_data],figure=def_fig)
            deformations[_def]=def_datafig
-       os.chdir(pwd)
-       for f in ['EV_theta.dat','Result.json','stress-EV.png']:
-           transfer_file(f, task_dir , os.path.join(dst_dir,prop) , rename= False)
-       transfer_file(os.path.join(task_dir,'elc_stress','Mech2D.json'), task_dir , dst_dir , rename= False)
-        
-       data=np.loadtxt(os.path.join(dst_dir,prop,'EV_theta.dat')).tolist()
-       ev_data=JFData(description='Angle dependent Young\'s modulus and Poisson\'s ratio figure', json_data= {'data':data},
-             json_file_name=None,json_id=None,meta={})
-       summary=Mechanics2dSummary.from_file(os.path.join(dst_dir,prop,'Result.json'))
+
+       summary=Mechanics2dSummary.from_tensor(c2d)
+       data=summary.polar_ev(ntheta)
+       ev_data=_curve_data('Angle dependent Young\'s modulus and Poisson\'s ratio data', {'data':data}, dst_dir,
+             os.path.join('mechanics',prop,'stress-EV.bin'), float32, meta={'ntheta':ntheta})
        ev_fig=JFData(description='Angle dependent Young\'s modulus and Poisson\'s ratio figure',
-             file_fmt='png', file_name=os.path.join('mechanics',prop,'stress-EV.png'),file_id=None)
-             #file_fmt='png', file_name=os.path.join(dst_dir,prop,'stress-EV.png'),file_id=None)
+             file_fmt='png', file_name=os.path.join('mechanics',prop,'stress-EV.png'),file_id=None,
+             recipe=recipe('polar_ev', key='data'))
        ev_datafig=DataFigure(data=[ev_data],figure=ev_fig)
          
        ret['summary'] = summary
        ret['polar_EV'] = ev_datafig
        ret['deformations']=deformations
-       #dumpfn(jsanitize(Elc2nd2d(**ret)),'test1.json')
+       ret['meta']={'order': order}
 
     elif prop=='ssc_stress':
        log.debug('-'*20)
        log.info('Processing %s '%prop)
        log.debug(task_dir)
        log.debug(os.path.join(dst_dir,prop))
-       with open("m2d.ana.log","wb") as out, open("m2d.ana.err","wb") as err:
-            p=subprocess.Popen(["m2d","post","-a","stress","-p","ssc","--plot","-f","png"],stdout=out,stderr=err)
-            p.communicate()
-       sscs=map(os.path.basename,glob(os.path.join(task_dir,prop,'Def_*')) )
-       os.chdir(pwd)
+       ref, modes = read_deformations(task_dir, prop, manifest=manifest)
        create_path(os.path.join(dst_dir,prop))
-       for ssc in sscs:
-           log.debug('pwd: %s'%os.getcwd())
-           task_infos=[]
+       for ssc in sorted(modes):
            log.info('SSC direction: %s '%ssc)
            create_path(os.path.join(dst_dir,prop,ssc))
-           transfer_file(ssc+'_Lagrangian_Stress.dat', os.path.join(task_dir,prop,ssc) , os.path.join(dst_dir,prop,ssc) , rename= False)
-           transfer_file(ssc+'_Lagrangian_Stress.png', os.path.join(task_dir,prop,ssc) , os.path.join(dst_dir,prop,ssc) , rename= False)
-           transfer_file(ssc+'_Physical_Stress.dat', os.path.join(task_dir,prop,ssc) , os.path.join(dst_dir,prop,ssc) , rename= False)
-           SS_Lag=np.loadtxt(os.path.join(dst_dir,prop,ssc,ssc+'_Lagrangian_Stress.dat')).tolist()
-           SS_Phy=np.loadtxt(os.path.join(dst_dir,prop,ssc,ssc+'_Physical_Stress.dat')).tolist()
-           data=JFData(description='SS data', json_data= {'SS_Lagrangian':SS_Lag,'SS_Physical':SS_Phy},
-                 json_file_name=None,json_id=None,meta={})
+           SS_Lag, SS_Phy = stress_tables(modes[ssc], prop)
+           np.savetxt(os.path.join(dst_dir,prop,ssc,ssc+'_Lagrangian_Stress.dat'), SS_Lag, fmt='%14.8f', header=SSC_HEADER%'Lag.', comments='#')
+           np.savetxt(os.path.join(dst_dir,prop,ssc,ssc+'_Physical_Stress.dat'), SS_Phy, fmt='%14.8f', header=SSC_HEADER%'Phy.', comments='#')
+           data=_curve_data('SS data', {'SS_Lagrangian':SS_Lag,'SS_Physical':SS_Phy}, dst_dir,
+                 os.path.join('mechanics',prop,ssc,ssc+'_Stress.bin'), float32,
+                 tolerance=tolerance, full=os.path.join('mechanics',prop,ssc,ssc+'_Lagrangian_Stress.dat'))
            fig=JFData(description='SS Lag figure',
-             file_fmt='png', file_name=os.path.join('mechanics',prop,ssc,ssc+'_Lagrangian_Stress.png'),file_id=None)
-             #file_fmt='png', file_name=os.path.join(dst_dir,prop,ssc,ssc+'_Lagrangian_Stress.png'),file_id=None)
+             file_fmt='png', file_name=os.path.join('mechanics',prop,ssc,ssc+'_Lagrangian_Stress.png'),file_id=None,
+             recipe=recipe('stress_strain', key='SS_Lagrangian', ylabel='Stress (N/m)'))
            data_fig=DataFigure(data=[data],figure=fig)
-           ret['stress_strain'][ssc]=data_fig
+           ret['deformations'][ssc]=data_fig
     else:
        raise RuntimeError('Unknow combination of approach and property : %s '%(prop))
 
-    transfer_file('Mech2D.json', os.path.join(task_dir,prop) , os.path.join(dst_dir,prop) , rename= False)
-    meta=JFData(description='meta data',
-             json_file_name=os.path.join('mechanics',prop,'Mech2D.json'),json_id=None,meta={})
-    ret['meta']=meta
+    return ret
+
+def mechanics2d_parsers(task_dirs, dst_dir, code='vasp', orders=None, max_workers=3, float32=ARRAY_FLOAT32,
+                        tolerance=CURVE_TOLERANCE, manifests=None):
+    """
+    Run mechanics2d_parser for several approaches concurrently, the latency
+    is that of the slowest approach. Every distinct task directory is
+    scanned once and its manifest shared by its approaches.
+
+    Args:
+        task_dirs (dict): {prop: task_dir}, empty task_dir gives an empty result
+        dst_dir (str): mechanics directory of the material
+        orders (dict): {prop: fit order}
+        max_workers (int): number of threads
+        float32 (bool): keep the curves in single precision
+        tolerance (float): relative error bound of the stored curves
+        manifests (dict): {task_dir: MechanicsManifest} already scanned
+    Returns:
+        {prop: result of mechanics2d_parser}
+    """
+    orders = orders if orders else {}
+    manifests = dict(manifests) if manifests else {}
+    for task_dir in set(task_dirs.values()):
+        if task_dir and task_dir not in manifests:
+           manifests[task_dir] = scan_mechanics(task_dir)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {prop: pool.submit(mechanics2d_parser, task_dir, dst_dir, prop, code, orders.get(prop),
+                                           float32=float32, tolerance=tolerance, manifest=manifests.get(task_dir))
+                   for prop, task_dir in task_dirs.items()}
+        return {prop: future.result() for prop, future in futures.items()}
+
+def mechanics3d_parser(task_dir, dst_dir, prop='elc_stress', code='vasp', nprocs=4, float32=ARRAY_FLOAT32,
+                       manifest=None):
+    """
+    6x6 elastic constants and stress-strain curves of a 3d task directory
+    holding POSCAR and elc_stress/Def_*/Def_*_NNN, fitted by
+    matvirdkit.builder.elastic3d with the vasprun.xml files parsed in
+    nprocs processes; manifest is the scan of task_dir if already done.
+    """
+    ret={'summary':{},
+         'deformations':{},
+         'meta':{}
+         }
+    if not task_dir:
+       return ret
+    assert prop in ['elc_stress']
+    log.info('Processing 3d %s '%prop)
+    log.debug(task_dir)
+    (ref, modes), = elastic3d.read_deformations([task_dir], prop, nprocs=nprocs, manifests=[manifest])
+    if not modes:
+       raise RuntimeError('No deformation found in %s'%os.path.join(task_dir,prop))
+    c3d = elastic3d.fit_stiffness(modes)
+    create_path(os.path.join(dst_dir,prop))
+    deformations={}
+    for _def in sorted(modes):
+        create_path(os.path.join(dst_dir,prop,_def))
+        data = elastic3d.stress_table(modes[_def])
+        np.savetxt(os.path.join(dst_dir,prop,_def,_def+'_Lagrangian_Stress.dat'), data, fmt='%+.10f'+' %16.8f'*6, header=STRESS_HEADER%'Lag.'+'(GPa)', comments='#')
+        def_data=_curve_data('Lagrangian stress v.s. strain data', {'data':data}, dst_dir,
+             os.path.join('mechanics',prop,_def,_def+'_Lagrangian_Stress.bin'), float32)
+        def_fig=JFData(description='Lagrangian stress v.s. strain figure',
+             file_fmt='png', file_name=os.path.join('mechanics',prop,_def, _def+'_Lagrangian_Stress.png'),file_id=None,
+             recipe=recipe('stress_strain', key='data', ylabel='Lagrangian stress (GPa)'))
+        deformations[_def]=DataFigure(data=[def_data],figure=def_fig)
+    ret['summary']=Mechanics3dSummary.from_tensor(c3d)
+    ret['deformations']=deformations
+    ret['meta']={'steps': int(sum(len(m['steps']) for m in modes.values()))}
+    return ret
+
+def eos_parser(infos, dst_dir, nprocs=4, float32=ARRAY_FLOAT32):
+    """
+    Equation of state fits of energy-volume, energy-area or energy-strain
+    scans, read in one pool of nprocs processes and fitted in batches by
+    matvirdkit.builder.eos.
+
+    Args:
+        infos (dict): {key: {'task_dir', 'x': 'volume'|'area'|'strain',
+           'form': 'birch_murnaghan'|'vinet'|'polynomial', 'order'}}
+        dst_dir (str): mechanics directory of the material
+    Returns:
+        {key: EOS}
+    """
+    infos = {key: info for key, info in infos.items() if info.get('task_dir')}
+    if not infos:
+       return {}
+    curves = read_scans(infos, nprocs=nprocs)
+    groups = {}
+    for key in curves:
+        form = infos[key].get('form','birch_murnaghan')
+        groups.setdefault((form, infos[key].get('order',4)), {})[key] = curves[key]
+    ret={}
+    for (form, order), group in groups.items():
+        for key, (params, fitted) in fit_curves(group, form, order).items():
+            kind = infos[key].get('x','volume')
+            x, energy = curves[key]
+            e0, b0, b1, x0 = [float(v) if np.isfinite(v) else None for v in params]
+            if kind in MODULUS_UNIT and b0 is not None:
+               b0 *= MODULUS_UNIT[kind]
+            else:
+               b0 = b1 = None
+            create_path(os.path.join(dst_dir,'eos',key))
+            table = np.column_stack([x, energy, fitted])
+            np.savetxt(os.path.join(dst_dir,'eos',key,key+'_EOS.dat'), table, fmt='%16.8f', header='%s  energy (eV)  %s (eV)'%(kind,form), comments='#')
+            data=_curve_data('Energy v.s. %s data'%kind, {'data':table}, dst_dir,
+                 os.path.join('mechanics','eos',key,key+'_EOS.bin'), float32)
+            fig=JFData(description='Energy v.s. %s figure'%kind,
+                 file_fmt='png', file_name=os.path.join('mechanics','eos',key,key+'_EOS.png'),file_id=None,
+                 recipe=recipe('eos', key='data', xlabel=EOS_XLABEL[kind], form=form))
+            ret[key]=EOS(minmum=e0, equilibrium=x0, modulus=b0, modulus_derivative=b1, form=form,
+                         data=DataFigure(data=[data],figure=fig))
     return ret
 
 if __name__== '__main__':
@@ -166,13 +342,15 @@ if __name__== '__main__':
    tasks_dir='m2d-1/tasks'
    
    create_path(dst_dir)
-   ret1=mechanics2d_parser(task_dir,dst_dir,prop='elc_energy', code= 'vasp')
-   print(ret1.keys())
+   t=datetime.now()
+   for prop in ['elc_energy','elc_stress','ssc_stress']:
+       mechanics2d_parser(task_dir,dst_dir,prop=prop, code= 'vasp')
+   print('sequential: %s'%(datetime.now()-t))
+   t=datetime.now()
+   rets=mechanics2d_parsers({prop:task_dir for prop in ['elc_energy','elc_stress','ssc_stress']},dst_dir)
+   print('concurrent: %s'%(datetime.now()-t))
+   ret1,ret2,ret3=rets['elc_energy'],rets['elc_stress'],rets['ssc_stress']
    print(ret1['meta'])
-   #print(ret1['meta'])
-   ret2=mechanics2d_parser(task_dir,dst_dir,prop='elc_stress', code= 'vasp')
-   ret3=mechanics2d_parser(task_dir,dst_dir,prop='ssc_stress', code= 'vasp')
-   #print(ret3['stress_strain'])
    root_meta={}
    ret=Mechanics2d(elc2nd_stress=Elc2nd2d(**ret2),elc2nd_energy=Elc2nd2d(**ret1),stress_strain=StressStrain(**ret3),**root_meta)
    dumpfn(jsanitize(ret),'ret.json',indent=4)
@@ -0,0 +1,143 @@
+"""
+Migration of task ids from sha1encode(str(input)) to content_hash(input).
+
+Old ids depended on dict ordering and object reprs. ``build_task_id_map``
+scans a tasks directory and records ``{old_id: new_id}`` in
+``META_DIR/task_id_map.json``; ``migrate_task_ids`` additionally renames the
+stored tasks. GeneralTask looks stale ids of tag.json files up in the map and
+renames a task that is still stored under its old id (``rename_task``), so
+already parsed calculations are not parsed again.
+
+Ids are computed by ``task_id_of`` on the canonical input, with every
+structure replaced by its structure store reference: legacy tasks storing
+full structures, deduplicated tasks and freshly parsed tasks get the same id.
+"""
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, Optional
+
+from matvirdkit import log, META_DIR, TASKS_DIR
+from matvirdkit.model.utils import content_hash, dumpjson, loadjson
+from matvirdkit.cache import file_stamp
+from matvirdkit.builder.archive import TaskArchive, ARCHIVE_SUFFIX, read_task_file
+from matvirdkit.builder.structure_store import StructureStore
+
+__author__ = 'Haidi Wang'
+__email__ = 'haidi@hfut.edu.cn'
+
+TASK_ID_MAP = os.path.join(META_DIR, 'task_id_map.json')
+
+_MAP_CACHE = {'stamp': None, 'map': {}}
+
+
+def task_id_of(inputs: Any, store: Optional[StructureStore] = None) -> str:
+    """
+    Task id of the input block of a task document: the content hash of the
+    input with the structures replaced by their store references.
+    """
+    store = store if store else StructureStore()
+    return content_hash(store.dedup(inputs, write=False))
+
+
+def _stored_tasks(tasks_dir: str):
+    for name in sorted(os.listdir(tasks_dir)):
+        path = os.path.join(tasks_dir, name)
+        if name.endswith(ARCHIVE_SUFFIX) and os.path.isfile(path):
+            yield name[:-len(ARCHIVE_SUFFIX)]
+        elif os.path.isfile(os.path.join(path, 'task.json')):
+            yield name
+
+
+def build_task_id_map(tasks_dir: str = os.path.join(TASKS_DIR, 'vasp'),
+                      fname: str = TASK_ID_MAP) -> Dict[str, str]:
+    """
+    Map the id of every stored task to the content hash of its input.
+    Tasks whose id is already the content hash are left out. The map is
+    merged into fname.
+    """
+    id_map = load_task_id_map(fname)
+    store = StructureStore()
+    for task_id in _stored_tasks(tasks_dir):
+        try:
+            td = read_task_file(os.path.join(tasks_dir, task_id))
+            new_id = task_id_of(td['input'], store)
+        except Exception as e:
+            log.warning('skip task %s : %s' % (task_id, e))
+            continue
+        if new_id != task_id:
+            id_map[task_id] = new_id
+    dumpjson(id_map, fname, indent=True)
+    log.info('%d task ids in %s' % (len(id_map), fname))
+    return id_map
+
+
+def load_task_id_map(fname: str = TASK_ID_MAP) -> Dict[str, str]:
+    if not os.path.isfile(fname):
+        return {}
+    stamp = file_stamp(fname)
+    if _MAP_CACHE['stamp'] != stamp:
+        _MAP_CACHE['map'] = loadjson(fname)
+        _MAP_CACHE['stamp'] = stamp
+    return dict(_MAP_CACHE['map'])
+
+
+def map_task_id(task_id: str, fname: str = TASK_ID_MAP) -> str:
+    """
+    New id of a task, task_id itself if it was not migrated.
+    """
+    return load_task_id_map(fname).get(task_id, task_id)
+
+
+def migrate_task_ids(tasks_dir: str = os.path.join(TASKS_DIR, 'vasp'),
+                     rename: bool = False, fname: str = TASK_ID_MAP) -> Dict[str, str]:
+    """
+    Build the id map and, with rename, move every stored task (directory
+    or archive) to its new id and rewrite its task_id.
+    """
+    id_map = build_task_id_map(tasks_dir, fname)
+    if not rename:
+        return id_map
+    for old_id, new_id in id_map.items():
+        rename_task(tasks_dir, old_id, new_id)
+    return id_map
+
+
+def rename_task(tasks_dir: str, old_id: str, new_id: str) -> bool:
+    """
+    Move a stored task (directory or archive) from old_id to new_id and
+    rewrite its task_id, False if nothing is stored under old_id.
+    """
+    src = os.path.join(tasks_dir, old_id)
+    dst = os.path.join(tasks_dir, new_id)
+    if os.path.isdir(src):
+        td = loadjson(os.path.join(src, 'task.json'))
+        td['task_id'] = new_id
+        dumpjson(td, os.path.join(src, 'task.json'))
+        if os.path.isdir(dst):
+            shutil.rmtree(dst)
+        shutil.move(src, dst)
+    elif os.path.isfile(src + ARCHIVE_SUFFIX):
+        # members are renamed by repacking, archives are immutable
+        tmp_dir = tempfile.mkdtemp(dir=tasks_dir)
+        with TaskArchive(src + ARCHIVE_SUFFIX) as ta:
+            for member in ta.names():
+                ta.extract(member, tmp_dir)
+        td = loadjson(os.path.join(tmp_dir, 'task.json'))
+        td['task_id'] = new_id
+        for jfd in td.get('orig_outputs', {}).values():
+            if isinstance(jfd, dict) and jfd.get('archive'):
+                jfd['archive'] = new_id + ARCHIVE_SUFFIX
+        dumpjson(td, os.path.join(tmp_dir, 'task.json'))
+        TaskArchive.pack(tmp_dir, dst + ARCHIVE_SUFFIX)
+        os.remove(src + ARCHIVE_SUFFIX)
+    else:
+        return False
+    log.info('task %s -> %s' % (old_id, new_id))
+    return True
+
+
+if __name__ == '__main__':
+    import sys
+    migrate_task_ids(sys.argv[1] if len(sys.argv) > 1 else os.path.join(TASKS_DIR, 'vasp'),
+                     rename='--rename' in sys.argv)
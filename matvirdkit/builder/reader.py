@@ -0,0 +1,265 @@
+"""
+Lazy reader of stored material documents.
+
+``dump_material_doc`` writes ``<material_id>.json`` block by block and records
+the byte range of every top level block and of every property sub-document
+in ``<material_id>.idx.json``. The material file stays one plain json
+document; the index only allows a reader to seek to one block and decode
+just that. LazyMaterial decodes blocks, property documents, JFData json
+payloads and referenced task documents on first access. Documents without
+(or with a stale) index are parsed in full once.
+"""
+import os
+import time
+import shutil
+import tempfile
+from typing import Any, Dict, List, Optional, Union
+
+from matvirdkit import log, DATASETS_DIR, TASKS_DIR
+from matvirdkit.model.utils import dumpsjson, dumpjson, loadjson, loadsjson, load_arrays, construct_trusted
+from matvirdkit.model.thermo import ThermoDoc
+from matvirdkit.model.xrd import XrdDoc
+from matvirdkit.model.stability import StabilityDoc
+from matvirdkit.model.common import MetaDoc, SourceDoc, JFData
+from matvirdkit.model.magnetism import MagnetismDoc
+from matvirdkit.model.bms import BMSDoc
+from matvirdkit.model.mechanics import Mechanics2dDoc, Mechanics3dDoc
+from matvirdkit.model.electronic import ElectronicStructureDoc
+from matvirdkit.model.structure import SimilarStructuresDoc
+from matvirdkit.builder.archive import TaskArchive, read_task_file
+from matvirdkit.builder.structure_store import StructureStore
+from matvirdkit.builder.task import TaskDocument
+
+__author__ = 'Haidi Wang'
+__email__ = 'haidi@hfut.edu.cn'
+
+INDEX_SUFFIX = '.idx.json'
+# block keys of the properties, as registered by the Builder
+DOC_MODELS = {
+    'ThermoDoc': ThermoDoc,
+    'ElectronicDoc': ElectronicStructureDoc,
+    'Mechanics2dDoc': Mechanics2dDoc,
+    'Mechanics3dDoc': Mechanics3dDoc,
+    'BmsDoc': BMSDoc,
+    'MagnetismDoc': MagnetismDoc,
+    'XrdDoc': XrdDoc,
+    'SourceDoc': SourceDoc,
+    'MetaDoc': MetaDoc,
+    'StabilityDoc': StabilityDoc,
+    'SimilarDoc': SimilarStructuresDoc,
+}
+
+
+def index_name(fname: str) -> str:
+    return fname[:-5] + INDEX_SUFFIX if fname.endswith('.json') else fname + INDEX_SUFFIX
+
+
+def _loads(data: bytes) -> Any:
+    return loadsjson(data)
+
+
+def dump_material_doc(doc: Dict, fname: str, indent: bool = False) -> Dict:
+    """
+    Write a (jsanitized) material document and its block index.
+
+    Returns:
+        the index: {'size', 'mtime_ns', 'blocks': {key: [offset, length]}},
+        properties sub-documents are keyed 'properties/<name>'
+    """
+    blocks = {}
+    chunks = []
+    pos = 0
+
+    def emit(data: bytes, key: Optional[str] = None) -> None:
+        nonlocal pos
+        if key is not None:
+            blocks[key] = [pos, len(data)]
+        chunks.append(data)
+        pos += len(data)
+
+    emit(b'{')
+    for i, key in enumerate(sorted(doc.keys())):
+        emit((',' if i else '').encode('utf-8') + dumpsjson(key) + b':')
+        value = doc[key]
+        if key == 'properties' and isinstance(value, dict):
+            start = pos
+            emit(b'{')
+            for j, name in enumerate(sorted(value.keys())):
+                emit((',' if j else '').encode('utf-8') + dumpsjson(name) + b':')
+                emit(dumpsjson(value[name], indent=indent), 'properties/' + name)
+            emit(b'}')
+            blocks[key] = [start, pos - start]
+        else:
+            emit(dumpsjson(value, indent=indent), key)
+    emit(b'}')
+
+    with open(fname, 'wb') as fid:
+        fid.write(b''.join(chunks))
+    st = os.stat(fname)
+    index = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'blocks': blocks}
+    dumpjson(index, index_name(fname))
+    return index
+
+
+class LazyMaterial(object):
+    """
+    Stored material document, decoded block by block on access.
+
+        >>> m = LazyMaterial.from_id('m2d-1', 'mech2d')
+        >>> m.get_property('ThermoDoc')            # ThermoDoc model
+        >>> m.get_task(m.task_ids()[0])            # TaskDocument model
+    """
+    def __init__(self, fname: str):
+        self.fname = os.path.abspath(fname)
+        self.work_dir = os.path.dirname(self.fname)
+        self._index = None
+        self._full = None
+        self._blocks = {}
+        self._properties = {}
+        self._tasks = {}
+        self._load_index()
+
+    @classmethod
+    def from_id(cls, material_id: str, database: str) -> 'LazyMaterial':
+        return cls(os.path.join(DATASETS_DIR, database, material_id, material_id + '.json'))
+
+    def _load_index(self) -> None:
+        fname = index_name(self.fname)
+        if not os.path.isfile(fname):
+            return
+        index = loadjson(fname)
+        st = os.stat(self.fname)
+        if index.get('size') == st.st_size and index.get('mtime_ns') == st.st_mtime_ns:
+            self._index = index['blocks']
+        else:
+            log.debug('stale index %s' % fname)
+
+    def _read(self, key: str) -> Any:
+        if self._index is not None and key in self._index:
+            offset, length = self._index[key]
+            with open(self.fname, 'rb') as fid:
+                fid.seek(offset)
+                return _loads(fid.read(length))
+        if self._full is None:
+            self._full = loadjson(self.fname)
+        if key.startswith('properties/'):
+            return self._full.get('properties', {})[key[len('properties/'):]]
+        return self._full[key]
+
+    def keys(self) -> List[str]:
+        if self._index is not None:
+            return [k for k in self._index if '/' not in k]
+        if self._full is None:
+            self._full = loadjson(self.fname)
+        return list(self._full.keys())
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._blocks:
+            self._blocks[key] = self._read(key)
+        return self._blocks[key]
+
+    @property
+    def material_id(self) -> str:
+        return self['material_id']
+
+    @property
+    def structure(self) -> Dict:
+        return self['structure']
+
+    def property_names(self) -> List[str]:
+        if self._index is not None:
+            return [k[len('properties/'):] for k in self._index if k.startswith('properties/')]
+        return list(self['properties'].keys())
+
+    def get_property(self, name: str, model: bool = True) -> Union[Dict, Any]:
+        """
+        One property document, as its model (trusted construction) when
+        the name is known and model is set, otherwise as a dict.
+        """
+        if name not in self._properties:
+            if 'properties' in self._blocks:
+                self._properties[name] = self._blocks['properties'][name]
+            else:
+                self._properties[name] = self._read('properties/' + name)
+        d = self._properties[name]
+        if model and name in DOC_MODELS and isinstance(d, dict):
+            return construct_trusted(DOC_MODELS[name], d)
+        return d
+
+    def load_json_file(self, jfd: Union[Dict, JFData], base_dir: Optional[str] = None) -> Any:
+        """
+        Payload of a JFData entry: json_data, the named arrays of its binary
+        file_name ({key: numpy array}), or its json_file_name read from the
+        archive, an absolute path or a path relative to base_dir (default:
+        the material directory).
+        """
+        if isinstance(jfd, JFData):
+            jfd = jfd.dict()
+        if jfd.get('json_data'):
+            return jfd['json_data']
+        base_dir = base_dir if base_dir else self.work_dir
+        if jfd.get('arrays'):
+            fname = jfd['file_name']
+            if jfd.get('archive'):
+                with TaskArchive(os.path.join(base_dir, jfd['archive'])) as ta:
+                    return load_arrays(fname, jfd['arrays'], data=ta.read(fname))
+            return load_arrays(fname if os.path.isabs(fname) else os.path.join(base_dir, fname), jfd['arrays'])
+        fname = jfd.get('json_file_name')
+        if not fname:
+            return None
+        if jfd.get('archive'):
+            with TaskArchive(os.path.join(base_dir, jfd['archive'])) as ta:
+                return ta.load(fname)
+        return loadjson(fname if os.path.isabs(fname) else os.path.join(base_dir, fname))
+
+    def task_ids(self) -> List[str]:
+        return [t['task_id'] for t in self['tasks'].get('task', {}).values() if t.get('task_id')]
+
+    def get_task(self, task_id: str, code: Optional[str] = None) -> Any:
+        """
+        TaskDocument of a referenced task, read from the tasks directory.
+        """
+        if task_id not in self._tasks:
+            if code is None:
+                codes = [t.get('code') for t in self['tasks'].get('task', {}).values()
+                         if t.get('task_id') == task_id]
+                code = codes[0] if codes and codes[0] else 'vasp'
+            data = read_task_file(os.path.join(TASKS_DIR, code, task_id))
+            if data is None:
+                raise RuntimeError('Task %s not found' % task_id)
+            data = StructureStore().rehydrate(data)
+            self._tasks[task_id] = TaskDocument(code=code).from_dict(trusted=True, **data)
+        return self._tasks[task_id]
+
+
+def benchmark_reader(fname: str, name: str = 'ThermoDoc', n: int = 100000,
+                     work_dir: Optional[str] = None) -> None:
+    """
+    Time fetching one property from n copies of the material document
+    fname, with the lazy reader and with a full parse.
+    """
+    doc = loadjson(fname)
+    work_dir = work_dir if work_dir else tempfile.mkdtemp()
+    fnames = []
+    for i in range(n):
+        sub = os.path.join(work_dir, '%03d' % (i % 1000))
+        os.makedirs(sub, exist_ok=True)
+        f = os.path.join(sub, 'm-%d.json' % i)
+        dump_material_doc(doc, f)
+        fnames.append(f)
+    t = time.time()
+    for f in fnames:
+        LazyMaterial(f).get_property(name, model=False)
+    t_lazy = time.time() - t
+    t = time.time()
+    for f in fnames:
+        loadjson(f)['properties'][name]
+    t_full = time.time() - t
+    print('%s from %d materials: lazy %.3f s  full parse %.3f s' % (name, n, t_lazy, t_full))
+    shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) > 1:
+        benchmark_reader(sys.argv[1], *(sys.argv[2:3]), n=int(sys.argv[3]) if len(sys.argv) > 3 else 100000)
@@ -0,0 +1,236 @@
+"""
+Deferred rendering of the figures of material documents.
+
+The builder no longer draws figures. A figure entry (the ``figure`` JFData of
+a DataFigure) carries a render recipe instead::
+
+    {'kind': 'energy_strain', 'data': 0, 'key': 'data', 'options': {}}
+
+``kind`` names a renderer of RENDERERS, ``data`` the index of the input in the
+``data`` list of the same DataFigure and ``key`` the entry of its json payload.
+Figures are drawn on demand by render_figure, which skips a figure whose
+inputs did not change since it was drawn (the recipe and input hash is kept in
+``<figure>.key``), or in bulk by render_database (``mvdkit render``) in a pool
+of processes using the Agg backend only.
+"""
+import os
+import time
+from multiprocessing import Pool
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from matvirdkit import log, DATASETS_DIR
+from matvirdkit.model.utils import content_hash
+from matvirdkit.builder.reader import LazyMaterial
+
+__author__ = 'Haidi Wang'
+__email__ = 'haidi@hfut.edu.cn'
+
+KEY_SUFFIX = '.key'
+
+
+def _pyplot():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def _energy_strain(data: Any, fname: str, **options) -> None:
+    plt = _pyplot()
+    data = np.asarray(data)
+    fig, ax = plt.subplots(figsize=options.get('figsize', (6, 4.5)))
+    ax.plot(data[:, 0], data[:, 1] - data[:, 1].min(), 'o-')
+    ax.set_xlabel('Lagrangian strain')
+    ax.set_ylabel('Energy (eV)')
+    fig.tight_layout()
+    fig.savefig(fname, dpi=options.get('dpi', 150))
+    plt.close(fig)
+
+
+def _stress_strain(data: Any, fname: str, **options) -> None:
+    plt = _pyplot()
+    data = np.asarray(data)
+    fig, ax = plt.subplots(figsize=options.get('figsize', (6, 4.5)))
+    # columns: strain, XX YY ZZ YZ XZ XY
+    for col, label in [(1, 'XX'), (2, 'YY'), (6, 'XY')]:
+        ax.plot(data[:, 0], data[:, col], 'o-', label=label)
+    ax.set_xlabel('Lagrangian strain')
+    ax.set_ylabel(options.get('ylabel', 'Stress'))
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(fname, dpi=options.get('dpi', 150))
+    plt.close(fig)
+
+
+def _polar_ev(data: Any, fname: str, **options) -> None:
+    plt = _pyplot()
+    data = np.asarray(data)
+    fig, axes = plt.subplots(1, 2, subplot_kw={'projection': 'polar'}, figsize=options.get('figsize', (10, 4.5)))
+    axes[0].plot(data[:, 0], data[:, 1])
+    axes[0].set_title("Young's modulus (N/m)")
+    axes[1].plot(data[:, 0], data[:, 2])
+    axes[1].set_title("Poisson's ratio")
+    fig.tight_layout()
+    fig.savefig(fname, dpi=options.get('dpi', 150))
+    plt.close(fig)
+
+
+def _eos(data: Any, fname: str, **options) -> None:
+    plt = _pyplot()
+    data = np.asarray(data)
+    # columns: x, energy, fitted energy
+    fig, ax = plt.subplots(figsize=options.get('figsize', (6, 4.5)))
+    ax.plot(data[:, 0], data[:, 1], 'o', label='calculated')
+    ax.plot(data[:, 0], data[:, 2], '-', label=options.get('form', 'fit'))
+    ax.set_xlabel(options.get('xlabel', 'Volume'))
+    ax.set_ylabel('Energy (eV)')
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(fname, dpi=options.get('dpi', 150))
+    plt.close(fig)
+
+
+def _dos(data: Any, fname: str, **options) -> None:
+    from pymatgen.electronic_structure.dos import CompleteDos, Dos
+    from pymatgen.electronic_structure.plotter import DosPlotter
+    _pyplot()
+    dos = CompleteDos.from_dict(data) if 'structure' in data else Dos.from_dict(data)
+    plotter = DosPlotter(sigma=options.get('sigma'))
+    plotter.add_dos('Total', dos)
+    plotter.save_plot(fname, img_format=os.path.splitext(fname)[1][1:], xlim=options.get('xlim'))
+    _pyplot().close('all')
+
+
+def _band(data: Any, fname: str, **options) -> None:
+    from pymatgen.electronic_structure.bandstructure import BandStructureSymmLine
+    from pymatgen.electronic_structure.plotter import BSPlotter
+    _pyplot()
+    plotter = BSPlotter(BandStructureSymmLine.from_dict(data))
+    plotter.save_plot(fname, img_format=os.path.splitext(fname)[1][1:], ylim=options.get('ylim'))
+    _pyplot().close('all')
+
+
+RENDERERS = {
+    'energy_strain': _energy_strain,
+    'stress_strain': _stress_strain,
+    'polar_ev': _polar_ev,
+    'eos': _eos,
+    'dos': _dos,
+    'band': _band,
+}
+
+
+def recipe(kind: str, data: int = 0, key: Optional[str] = None, **options) -> Dict:
+    """
+    Render recipe of a figure entry.
+    """
+    if kind not in RENDERERS:
+        raise RuntimeError('Unknown figure kind %s' % kind)
+    return {'kind': kind, 'data': data, 'key': key, 'options': options}
+
+
+def iter_figures(doc: Any) -> Iterator[Dict]:
+    """
+    DataFigure dicts of a (jsanitized) document whose figure has a recipe.
+    """
+    if isinstance(doc, dict):
+        figure = doc.get('figure')
+        if isinstance(figure, dict) and figure.get('recipe') and isinstance(doc.get('data'), list):
+            yield doc
+        for value in doc.values():
+            yield from iter_figures(value)
+    elif isinstance(doc, list):
+        for value in doc:
+            yield from iter_figures(value)
+
+
+def render_figure(datafig: Dict, material: LazyMaterial, force: bool = False) -> Optional[str]:
+    """
+    Draw the figure of a DataFigure dict if it is missing or stale.
+
+    Returns:
+        absolute path of the figure, None if there is nothing to draw
+    """
+    figure = datafig['figure']
+    rcp = figure.get('recipe')
+    if not rcp or not figure.get('file_name'):
+        return None
+    fname = os.path.join(material.work_dir, figure['file_name'])
+    jfd = datafig['data'][rcp.get('data', 0)]
+    key = content_hash({'recipe': rcp, 'data': jfd})
+    if not force and os.path.isfile(fname) and os.path.isfile(fname + KEY_SUFFIX):
+        with open(fname + KEY_SUFFIX) as fid:
+            if fid.read() == key:
+                return fname
+    payload = material.load_json_file(jfd)
+    if rcp.get('key'):
+        payload = payload[rcp['key']]
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    RENDERERS[rcp['kind']](payload, fname, **rcp.get('options', {}))
+    with open(fname + KEY_SUFFIX, 'w') as fid:
+        fid.write(key)
+    return fname
+
+
+def render_material(fname: str, force: bool = False) -> Tuple[str, int, List[str]]:
+    """
+    Draw all figures of one stored material document.
+
+    Returns:
+        (fname, number of figures, errors)
+    """
+    material = LazyMaterial(fname)
+    n = 0
+    errors = []
+    for name in material.property_names():
+        for datafig in iter_figures(material.get_property(name, model=False)):
+            try:
+                if render_figure(datafig, material, force=force):
+                    n += 1
+            except Exception as exc:
+                errors.append('%s: %s' % (datafig['figure'].get('file_name'), exc))
+    return fname, n, errors
+
+
+def _render_job(args: Tuple[str, bool]) -> Tuple[str, int, List[str]]:
+    return render_material(*args)
+
+
+def material_files(database: str, material_ids: Optional[List[str]] = None) -> List[str]:
+    root = os.path.join(DATASETS_DIR, database)
+    ids = material_ids if material_ids else sorted(os.listdir(root)) if os.path.isdir(root) else []
+    fnames = [os.path.join(root, mid, mid + '.json') for mid in ids]
+    return [f for f in fnames if os.path.isfile(f)]
+
+
+def render_database(database: str, material_ids: Optional[List[str]] = None,
+                    nprocs: int = 1, force: bool = False) -> int:
+    """
+    Draw the figures of all (or the given) materials of a database in a
+    pool of processes.
+
+    Returns:
+        number of figures up to date
+    """
+    fnames = material_files(database, material_ids)
+    jobs = [(f, force) for f in fnames]
+    t = time.time()
+    if nprocs > 1 and len(jobs) > 1:
+        with Pool(processes=min(nprocs, len(jobs))) as pool:
+            results = pool.map(_render_job, jobs, chunksize=4)
+    else:
+        results = [_render_job(job) for job in jobs]
+    total = 0
+    for fname, n, errors in results:
+        total += n
+        for error in errors:
+            log.warning('%s: %s' % (os.path.basename(fname), error))
+    log.info('%d figures of %d materials in %.2f s' % (total, len(fnames), time.time() - t))
+    return total
+
+
+def main(args):
+    render_database(args.database, material_ids=args.material_ids,
+                    nprocs=args.nprocs, force=args.force)
@@ -0,0 +1,296 @@
+"""
+Fingerprint index for similar-structure search.
+
+Every material is described by a fixed-length, scale free radial distribution
+fingerprint: pair distances (from the vectorised periodic neighbour list) in
+units of the mean atomic spacing (V/N)^(1/3), Gaussian smeared on a grid and
+normalised to unit length, so that the cosine similarity of two materials is
+a dot product.
+
+SimilarityIndex keeps the fingerprints under ``META_DIR/similarity/<name>``
+(``vectors.npy`` and ``ids.json``). Queries are exact up to ``exact_limit``
+entries. Larger indexes are searched through an inverted file: the vectors are
+clustered around k-means centroids and only the ``nprobe`` clusters closest
+to the query are scored. Materials are added one at a time under a file lock,
+new vectors join their nearest cluster and the clustering is retrained once
+the index has doubled.
+
+The index is shared by all builds, so it is filled and queried in a separate
+pass over the stored materials (``mvdkit similarity``), which also writes the
+SimilarDoc block of every material; building a material does not touch it
+unless SIMILARITY_INDEX is set.
+
+    >>> similarity_database('mech2d', nprocs=8)
+"""
+import os
+import time
+import fcntl
+from uuid import uuid4
+from multiprocessing import Pool
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from pymatgen.core import Structure
+
+from matvirdkit import log, META_DIR
+from matvirdkit.model.utils import dumpjson, loadjson, jsanitize
+from matvirdkit.model.structure import CompactStructure, SimilarStructure, SimilarStructuresDoc
+from matvirdkit.builder.reader import LazyMaterial, dump_material_doc
+from matvirdkit.builder.render import material_files
+
+__author__ = 'Haidi Wang'
+__email__ = 'haidi@hfut.edu.cn'
+
+SIMILARITY_DIR = os.path.join(META_DIR, 'similarity')
+FP_RMAX = 4.0     # in units of (V/N)^(1/3)
+FP_NBINS = 64
+FP_SIGMA = 0.08
+
+
+def similarity_key(database: str, material_id: str) -> str:
+    return '%s:%s' % (database, material_id)
+
+
+def rdf_fingerprint(structure: Structure, r_max: float = FP_RMAX,
+                    nbins: int = FP_NBINS, sigma: float = FP_SIGMA) -> np.ndarray:
+    """
+    Scale free radial distribution fingerprint of a structure.
+
+    Args:
+        r_max (float): cutoff in units of the mean atomic spacing
+        nbins (int): length of the fingerprint
+        sigma (float): Gaussian smearing in units of the mean atomic spacing
+    Returns:
+        float32 vector of unit length (zeros if there are no pairs)
+    """
+    spacing = (structure.volume / len(structure)) ** (1.0 / 3.0)
+    _, _, _, dist = structure.get_neighbor_list(r_max * spacing)
+    r = dist / spacing
+    grid = np.linspace(0.0, r_max, nbins)
+    # Gaussian smeared pair density, 1/r^2 removes the shell volume growth
+    g = np.exp(-0.5 * ((grid[:, None] - r[None, :]) / sigma) ** 2) / np.maximum(r, 1e-3)[None, :] ** 2
+    fp = g.sum(axis=1) / len(structure)
+    norm = np.linalg.norm(fp)
+    return (fp / norm if norm > 0 else fp).astype(np.float32)
+
+
+def _kmeans(x: np.ndarray, k: int, niter: int = 10, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(niter):
+        assign = np.argmax(x @ centroids.T, axis=1)
+        for c in range(k):
+            members = x[assign == c]
+            if len(members):
+                v = members.mean(axis=0)
+                n = np.linalg.norm(v)
+                centroids[c] = v / n if n > 0 else v
+    return centroids
+
+
+class SimilarityIndex(object):
+    def __init__(self, name: str = 'default', index_dir: Optional[str] = None,
+                 exact_limit: int = 20000, nprobe: int = 8):
+        """
+        Args:
+            name (str): name of the index under SIMILARITY_DIR
+            index_dir (str): explicit directory of the index
+            exact_limit (int): up to that many entries queries are exact
+            nprobe (int): clusters scored by an approximate query
+        """
+        self.index_dir = index_dir if index_dir else os.path.join(SIMILARITY_DIR, name)
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.exact_limit = exact_limit
+        self.nprobe = nprobe
+        self._stamp = None
+        self.ids: List[str] = []
+        self.vectors = np.zeros((0, FP_NBINS), dtype=np.float32)
+        self.centroids: Optional[np.ndarray] = None
+        self.assign: Optional[np.ndarray] = None
+        self.trained_on = 0
+        self._load()
+
+    def _path(self, fname: str) -> str:
+        return os.path.join(self.index_dir, fname)
+
+    @contextmanager
+    def _lock(self):
+        with open(self._path('.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load(self) -> None:
+        fname = self._path('ids.json')
+        if not os.path.isfile(fname):
+            return
+        stamp = os.stat(fname).st_mtime_ns
+        if stamp == self._stamp:
+            return
+        meta = loadjson(fname)
+        self.ids = meta['ids']
+        self.trained_on = meta.get('trained_on', 0)
+        self.vectors = np.load(self._path('vectors.npy'))
+        if os.path.isfile(self._path('centroids.npy')) and self.trained_on:
+            self.centroids = np.load(self._path('centroids.npy'))
+            self.assign = np.load(self._path('assign.npy'))
+        else:
+            self.centroids = self.assign = None
+        self._stamp = stamp
+
+    def _save_array(self, fname: str, arr: np.ndarray) -> None:
+        tmp = self._path('.%s.npy' % uuid4().hex)
+        np.save(tmp, arr)
+        os.replace(tmp, self._path(fname))
+
+    def _save(self) -> None:
+        self._save_array('vectors.npy', self.vectors)
+        if self.centroids is not None:
+            self._save_array('centroids.npy', self.centroids)
+            self._save_array('assign.npy', self.assign)
+        tmp = self._path('.ids.tmp')
+        dumpjson({'ids': self.ids, 'trained_on': self.trained_on}, tmp)
+        os.replace(tmp, self._path('ids.json'))
+        self._stamp = os.stat(self._path('ids.json')).st_mtime_ns
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _train(self) -> None:
+        k = max(1, int(np.sqrt(len(self.ids))))
+        self.centroids = _kmeans(self.vectors, k)
+        self.assign = np.argmax(self.vectors @ self.centroids.T, axis=1).astype(np.int32)
+        self.trained_on = len(self.ids)
+        log.debug('similarity index %s: %d clusters' % (self.index_dir, k))
+
+    def add(self, key: str, fingerprint: np.ndarray) -> None:
+        """
+        Insert or replace the fingerprint of one material.
+        """
+        self.add_many([key], [fingerprint])
+
+    def add_many(self, keys: List[str], fingerprints: List[np.ndarray]) -> None:
+        with self._lock():
+            self._load()
+            pos = {k: i for i, k in enumerate(self.ids)}
+            new_keys, new_vecs = [], []
+            for key, fp in zip(keys, fingerprints):
+                if key in pos:
+                    self.vectors[pos[key]] = fp
+                    if self.centroids is not None:
+                        self.assign[pos[key]] = np.argmax(self.centroids @ fp)
+                else:
+                    new_keys.append(key)
+                    new_vecs.append(fp)
+            if new_keys:
+                new_vecs = np.asarray(new_vecs, dtype=np.float32)
+                self.ids.extend(new_keys)
+                self.vectors = np.concatenate([self.vectors, new_vecs])
+                if self.centroids is not None:
+                    self.assign = np.concatenate(
+                        [self.assign, np.argmax(new_vecs @ self.centroids.T, axis=1).astype(np.int32)])
+            if len(self.ids) > self.exact_limit and len(self.ids) >= 2 * self.trained_on:
+                self._train()
+            self._save()
+
+    def query(self, fingerprint: np.ndarray, n: int = 10,
+              exclude: Tuple[str, ...] = ()) -> List[Tuple[str, float]]:
+        """
+        The n most similar materials as (key, cosine similarity).
+        """
+        self._load()
+        if not self.ids:
+            return []
+        if self.centroids is None or len(self.ids) <= self.exact_limit:
+            candidates = np.arange(len(self.ids))
+        else:
+            probe = np.argsort(-(self.centroids @ fingerprint))[:self.nprobe]
+            candidates = np.nonzero(np.isin(self.assign, probe))[0]
+        scores = self.vectors[candidates] @ fingerprint
+        order = np.argsort(-scores)
+        ret = []
+        for i in order:
+            key = self.ids[candidates[i]]
+            if key in exclude:
+                continue
+            ret.append((key, float(scores[i])))
+            if len(ret) == n:
+                break
+        return ret
+
+
+def stored_structure(doc: Dict) -> Structure:
+    """
+    Structure of a stored StructureMatvird block, MP style or compact.
+    """
+    if doc.get('compact_structure'):
+        return CompactStructure(**doc['compact_structure']).to_structure()
+    return Structure.from_dict(doc['structure'])
+
+
+def _material_fingerprint(fname: str) -> Tuple[str, Optional[np.ndarray]]:
+    try:
+        return fname, rdf_fingerprint(stored_structure(LazyMaterial(fname).structure))
+    except Exception as e:
+        log.warning('no fingerprint for %s : %s' % (fname, e))
+        return fname, None
+
+
+def _write_similar(args: Tuple[str, List[Dict]]) -> str:
+    fname, similar = args
+    doc = loadjson(fname)
+    doc.setdefault('properties', {})['SimilarDoc'] = jsanitize(SimilarStructuresDoc(
+        similar_structures=[SimilarStructure(**s) for s in similar]))
+    dump_material_doc(doc, fname)
+    return fname
+
+
+def similarity_database(database: str, material_ids: Optional[List[str]] = None,
+                        n: int = 10, nprocs: int = 1, index: Optional[SimilarityIndex] = None,
+                        update_docs: bool = True) -> Dict[str, int]:
+    """
+    Add all (or the given) materials of a database to the similarity index
+    and write the n most similar materials of each into its SimilarDoc.
+
+    Returns:
+        {'materials', 'indexed', 'updated'}
+    """
+    index = index if index else SimilarityIndex()
+    fnames = material_files(database, material_ids)
+    t = time.time()
+    if nprocs > 1 and len(fnames) > 1:
+        with Pool(processes=min(nprocs, len(fnames))) as pool:
+            fps = pool.map(_material_fingerprint, fnames, chunksize=16)
+    else:
+        fps = [_material_fingerprint(f) for f in fnames]
+    fps = [(f, fp) for f, fp in fps if fp is not None]
+    keys = [similarity_key(database, os.path.basename(os.path.dirname(f))) for f, _ in fps]
+    index.add_many(keys, [fp for _, fp in fps])
+    t_index = time.time() - t
+    t = time.time()
+    jobs = []
+    if update_docs:
+        for key, (fname, fp) in zip(keys, fps):
+            similar = []
+            for hit, similarity in index.query(fp, n=n, exclude=(key,)):
+                hit_database, hit_id = hit.split(':', 1)
+                similar.append({'material_id': hit_id, 'database': hit_database, 'similarity': similarity})
+            jobs.append((fname, similar))
+        if nprocs > 1 and len(jobs) > 1:
+            with Pool(processes=min(nprocs, len(jobs))) as pool:
+                pool.map(_write_similar, jobs, chunksize=16)
+        else:
+            for job in jobs:
+                _write_similar(job)
+    log.info('similarity of %d materials: index %.2f s  query and write %.2f s' % (
+        len(fnames), t_index, time.time() - t))
+    return {'materials': len(fnames), 'indexed': len(keys), 'updated': len(jobs)}
+
+
+def main(args):
+    print(similarity_database(args.database, material_ids=args.material_ids, n=args.top,
+                              nprocs=args.nprocs, index=SimilarityIndex(args.index),
+                              update_docs=not args.index_only))
@@ -0,0 +1,226 @@
+"""
+Batch (re)classification of the stability blocks of a database.
+
+The classification rules of model.stability are applied to whole columns:
+the stored stiffness tensors of all materials, labels and methods are
+stacked and their smallest eigenvalues come from one eigvalsh call per
+dimension; the thermodynamic inputs come from the ThermoDoc blocks (or the
+meta of the stored classification) and the phonon input from the meta of the
+stored classification. Only materials whose StabilityDoc changed are
+written back, in a pool of processes.
+
+    >>> restability_database('mech2d', nprocs=8, limits={'min_eig': 0.5})
+"""
+import time
+from multiprocessing import Pool
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from matvirdkit import log
+from matvirdkit.model.utils import loadjson
+from matvirdkit.model.mechanics import min_eigenvalues
+from matvirdkit.model.stability import (classify_thermo, classify_phonon, combine_stiffness,
+                                        FORMATION_ENERGY_LIMIT, MAX_HESSIAN_LIMIT, MIN_EIG_LIMIT)
+from matvirdkit.builder.reader import LazyMaterial, dump_material_doc
+from matvirdkit.builder.render import material_files
+
+__author__ = 'Haidi Wang'
+__email__ = 'haidi@hfut.edu.cn'
+
+METHODS = ['elc2nd_energy', 'elc2nd_stress']
+DEFAULT_LIMITS = {'formation_energy': FORMATION_ENERGY_LIMIT,
+                  'max_hessian': MAX_HESSIAN_LIMIT,
+                  'min_eig': MIN_EIG_LIMIT}
+
+
+def _get(obj: Any, key: str) -> Any:
+    if obj is None:
+        return None
+    return obj.get(key) if isinstance(obj, dict) else getattr(obj, key, None)
+
+
+def _tensor(mechanics: Any, method: str) -> Optional[Any]:
+    # s_tensor is the stiffness, c_tensor the compliance
+    return _get(_get(_get(mechanics, method), 'summary'), 's_tensor')
+
+
+def stiffness_min_eigenvalues(doc: Any, label: str, dimension: int = 2) -> Dict[str, float]:
+    """
+    Smallest eigenvalue of the stiffness tensor (N/m for 2d, GPa for 3d) of
+    each method of one label of a Mechanics2dDoc / Mechanics3dDoc (model or
+    dict), nan where missing.
+    """
+    key = 'mechanics3d' if dimension == 3 else 'mechanics2d'
+    mechanics = (_get(doc, key) or {}).get(label)
+    ret = {}
+    for method in METHODS:
+        tensor = _tensor(mechanics, method)
+        ret[method] = float(min_eigenvalues(tensor, dimension)) if tensor else np.nan
+    return ret
+
+
+def _material_rows(fname: str) -> List[Dict]:
+    """
+    Classification inputs of every stability label of one material.
+    """
+    material = LazyMaterial(fname)
+    names = material.property_names()
+    if 'StabilityDoc' not in names:
+        return []
+    stability = material.get_property('StabilityDoc', model=False).get('stability') or {}
+    thermo = (material.get_property('ThermoDoc', model=False).get('thermo') or {}) if 'ThermoDoc' in names else {}
+    dimension = 3 if 'Mechanics3dDoc' in names else 2
+    try:
+        dimension = material.structure.get('dimension') or dimension
+    except KeyError:
+        pass
+    mech_name = 'Mechanics3dDoc' if dimension == 3 else 'Mechanics2dDoc'
+    mechanics = {}
+    if mech_name in names:
+        mechanics = material.get_property(mech_name, model=False).get(mech_name[:-3].lower()) or {}
+    rows = []
+    for label, stab in stability.items():
+        stored_thermo = (stab.get('thermo_stability') or {}).get('meta') or {}
+        fe = _get(thermo.get(label), 'formation_energy_per_atom')
+        eh = _get(thermo.get(label), 'energy_above_hull')
+        if fe is None or eh is None:
+            fe = stored_thermo.get('formation_energy_per_atom')
+            eh = stored_thermo.get('energy_above_hull')
+        rows.append({'fname': fname, 'label': label, 'dimension': dimension,
+                     'tensors': [_tensor(mechanics.get(label), m) for m in METHODS],
+                     'thermo': (fe, eh),
+                     'max_hessian': ((stab.get('phonon_stability') or {}).get('meta') or {}).get('max_hessian'),
+                     'values': [(stab.get(k) or {}).get('value') for k in
+                                ['stiff_stability', 'thermo_stability', 'phonon_stability']]})
+    return rows
+
+
+def classify(rows: List[Dict], limits: Optional[Dict[str, float]] = None) -> Dict[str, np.ndarray]:
+    """
+    Vectorised classification of stacked inputs (see _material_rows).
+
+    Returns:
+        {'stiff_stability', 'thermo_stability', 'phonon_stability'}: arrays
+        of StabilityLevel values, None where the input is missing and the
+        stored value is kept; 'min_eig': (n, 2) smallest eigenvalues
+    """
+    limits = dict(DEFAULT_LIMITS, **(limits or {}))
+    n = len(rows)
+    min_eig = np.full((n, len(METHODS)), np.nan)
+    for dimension in set(r['dimension'] for r in rows):
+        pos = [(i, j) for i, r in enumerate(rows) if r['dimension'] == dimension
+               for j, t in enumerate(r['tensors']) if t]
+        if pos:
+            tensors = np.array([rows[i]['tensors'][j] for i, j in pos], dtype=float)
+            idx = np.array(pos)
+            min_eig[idx[:, 0], idx[:, 1]] = min_eigenvalues(tensors, dimension)
+    stiff = combine_stiffness(min_eig[:, 0], min_eig[:, 1], limits['min_eig']).astype(object)
+    stiff[~np.isfinite(min_eig).any(axis=1)] = None
+
+    thermo_in = np.array([[np.nan if v is None else v for v in r['thermo']] for r in rows], dtype=float).reshape(n, 2)
+    thermo = classify_thermo(thermo_in[:, 0], thermo_in[:, 1], limits['formation_energy']).astype(object)
+    thermo[~np.isfinite(thermo_in).all(axis=1)] = None
+
+    hessian = np.array([np.nan if r['max_hessian'] is None else r['max_hessian'] for r in rows], dtype=float)
+    phonon = classify_phonon(hessian, limits['max_hessian']).astype(object)
+    phonon[~np.isfinite(hessian)] = None
+    return {'stiff_stability': stiff, 'thermo_stability': thermo, 'phonon_stability': phonon, 'min_eig': min_eig}
+
+
+def _write_material(args: Tuple[str, Dict[str, Dict[str, Any]]]) -> str:
+    fname, updates = args
+    doc = loadjson(fname)
+    stability = doc['properties']['StabilityDoc']['stability']
+    for label, blocks in updates.items():
+        for key, (value, meta) in blocks.items():
+            entry = stability[label].setdefault(key, {})
+            entry['value'] = value
+            entry['meta'] = dict(entry.get('meta') or {}, **meta)
+    dump_material_doc(doc, fname)
+    return fname
+
+
+def restability_database(database: str, material_ids: Optional[List[str]] = None,
+                         limits: Optional[Dict[str, float]] = None,
+                         nprocs: int = 1, dry_run: bool = False) -> Dict[str, int]:
+    """
+    Reclassify the stability of all (or the given) materials of a database
+    and write the changed StabilityDoc blocks back.
+
+    Args:
+        limits (dict): thresholds 'formation_energy', 'max_hessian', 'min_eig'
+    Returns:
+        {'materials', 'labels', 'changed'}
+    """
+    fnames = material_files(database, material_ids)
+    t = time.time()
+    if nprocs > 1 and len(fnames) > 1:
+        with Pool(processes=min(nprocs, len(fnames))) as pool:
+            rows = [r for rs in pool.map(_material_rows, fnames, chunksize=64) for r in rs]
+    else:
+        rows = [r for f in fnames for r in _material_rows(f)]
+    t_read = time.time() - t
+    t = time.time()
+    result = classify(rows, limits) if rows else {}
+    t_classify = time.time() - t
+    updates = {}
+    for i, row in enumerate(rows):
+        for k, key in enumerate(['stiff_stability', 'thermo_stability', 'phonon_stability']):
+            value = result[key][i]
+            if value is None or value == row['values'][k]:
+                continue
+            meta = {}
+            if key == 'stiff_stability':
+                meta = {m: float(e) for m, e in zip(METHODS, result['min_eig'][i]) if np.isfinite(e)}
+            updates.setdefault(row['fname'], {}).setdefault(row['label'], {})[key] = (value, meta)
+    t = time.time()
+    if updates and not dry_run:
+        jobs = list(updates.items())
+        if nprocs > 1 and len(jobs) > 1:
+            with Pool(processes=min(nprocs, len(jobs))) as pool:
+                pool.map(_write_material, jobs, chunksize=16)
+        else:
+            for job in jobs:
+                _write_material(job)
+    log.info('stability of %d labels of %d materials: read %.2f s  classify %.3f s  write %d %.2f s' % (
+        len(rows), len(fnames), t_read, t_classify, len(updates), time.time() - t))
+    return {'materials': len(fnames), 'labels': len(rows), 'changed': len(updates)}
+
+
+def benchmark_stability(n: int = 100000) -> None:
+    """
+    Time classify on n synthetic 2d materials against the per material
+    eigenvalue and from_key loop of Builder.set_stability.
+    """
+    from matvirdkit.model.stability import StiffnessStability, ThermoDynamicStability
+    rng = np.random.default_rng(0)
+    tensors = np.zeros((n, 6, 6))
+    block = rng.normal(size=(n, 3, 3))
+    tensors[:, [[0], [1], [5]], [0, 1, 5]] = block @ np.swapaxes(block, 1, 2) - 0.3
+    rows = [{'dimension': 2, 'tensors': [tensors[i].tolist(), None],
+             'thermo': (float(rng.uniform(-1, 1)), float(rng.uniform(0, 0.3))), 'max_hessian': None}
+            for i in range(n)]
+    t = time.time()
+    result = classify(rows)
+    t_batch = time.time() - t
+    m = min(n, 5000)
+    t = time.time()
+    for i in range(m):
+        e = min(np.linalg.eigvalsh(tensors[i][np.ix_([0, 1, 5], [0, 1, 5])]))
+        assert StiffnessStability.from_key(min_eig_tensor=e).value.value == result['stiff_stability'][i]
+        ThermoDynamicStability.from_key(*rows[i]['thermo'])
+    t_loop = (time.time() - t) * n / m
+    print('%d materials: batched %.2f s  per material loop %.1f s (estimated)' % (n, t_batch, t_loop))
+
+
+def main(args):
+    limits = {k: v for k, v in [('formation_energy', args.formation_energy),
+                                ('max_hessian', args.max_hessian),
+                                ('min_eig', args.min_eig)] if v is not None}
+    print(restability_database(args.database, material_ids=args.material_ids, limits=limits,
+                               nprocs=args.nprocs, dry_run=args.dry_run))
+
+
+if __name__ == '__main__':
+    benchmark_stability()
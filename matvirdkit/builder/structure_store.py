@@ -0,0 +1,129 @@
+"""
+Content-addressed store of crystal structures.
+
+Structures are kept once under ``STRUCTURES_DIR`` as uncompressed npz blobs
+of the compact array encoding (see structure_to_arrays) and documents refer
+to them by hash. ``dedup`` swaps every structure dict of a json-like document
+for a reference, ``rehydrate`` does the reverse; StructureRef decodes its
+structure on first access only.
+"""
+import os
+import io
+import copy
+from uuid import uuid4
+from functools import lru_cache
+from typing import Any, Dict
+
+import numpy as np
+from pymatgen.core import Structure
+
+from matvirdkit import STRUCTURES_DIR
+from matvirdkit.model.structure import structure_to_arrays, structure_from_arrays, arrays_hash
+
+__author__ = 'Haidi Wang'
+__email__ = 'haidi@hfut.edu.cn'
+
+REF_CLASS = 'StructureRef'
+
+
+def is_structure_dict(d: Any) -> bool:
+    return (isinstance(d, dict) and isinstance(d.get('lattice'), dict)
+            and 'matrix' in d['lattice'] and isinstance(d.get('sites'), list))
+
+
+def is_structure_ref(d: Any) -> bool:
+    return isinstance(d, dict) and d.get('@class') == REF_CLASS
+
+
+structure_hash = arrays_hash
+
+
+class StructureStore(object):
+    def __init__(self, store_dir: str = STRUCTURES_DIR):
+        self.store_dir = store_dir
+        os.makedirs(self.store_dir, exist_ok=True)
+
+    def _path(self, ref: str) -> str:
+        # two-level fan out keeps directories small
+        return os.path.join(self.store_dir, ref[:2], ref + '.npz')
+
+    def put(self, structure: Structure) -> str:
+        arrays = structure_to_arrays(structure)
+        ref = structure_hash(arrays)
+        fname = self._path(ref)
+        if not os.path.isfile(fname):
+            os.makedirs(os.path.dirname(fname), exist_ok=True)
+            buf = io.BytesIO()
+            np.savez(buf, **arrays)
+            tmp = os.path.join(os.path.dirname(fname), '.%s.tmp' % uuid4().hex)
+            with open(tmp, 'wb') as fid:
+                fid.write(buf.getvalue())
+            os.replace(tmp, fname)
+        return ref
+
+    def get(self, ref: str) -> Structure:
+        return _load_structure(self._path(ref)).copy()
+
+    def dedup(self, obj: Any, write: bool = True) -> Any:
+        """
+        Replace all structure dicts (pymatgen or StructureMP style) in a
+        json-like object by references into the store. Without write only
+        the references are computed and nothing is stored.
+        """
+        if is_structure_dict(obj):
+            structure = Structure.from_dict(obj)
+            ref = self.put(structure) if write else structure_hash(structure_to_arrays(structure))
+            return {'@module': __name__, '@class': REF_CLASS, 'ref': ref}
+        if isinstance(obj, dict):
+            return {k: self.dedup(v, write) for k, v in obj.items()}
+        if isinstance(obj, list):
+            return [self.dedup(v, write) for v in obj]
+        return obj
+
+    def rehydrate(self, obj: Any) -> Any:
+        """
+        Replace all references in a json-like object by structure dicts.
+        """
+        if is_structure_ref(obj):
+            return copy.deepcopy(_structure_dict(self._path(obj['ref'])))
+        if isinstance(obj, dict):
+            return {k: self.rehydrate(v) for k, v in obj.items()}
+        if isinstance(obj, list):
+            return [self.rehydrate(v) for v in obj]
+        return obj
+
+
+class StructureRef(object):
+    """
+    Reference to a stored structure, decoded on first access.
+    """
+    def __init__(self, ref: str, store: StructureStore = None):
+        self.ref = ref
+        self.store = store if store else StructureStore()
+        self._structure = None
+
+    @property
+    def structure(self) -> Structure:
+        if self._structure is None:
+            self._structure = self.store.get(self.ref)
+        return self._structure
+
+    def as_dict(self) -> Dict:
+        return {'@module': __name__, '@class': REF_CLASS, 'ref': self.ref}
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> 'StructureRef':
+        return cls(d['ref'])
+
+
+@lru_cache(maxsize=256)
+def _load_structure(fname: str) -> Structure:
+    if not os.path.isfile(fname):
+        raise RuntimeError('Structure %s not found in store' % fname)
+    with np.load(fname, allow_pickle=False) as npz:
+        return structure_from_arrays({k: npz[k] for k in npz.files})
+
+
+@lru_cache(maxsize=256)
+def _structure_dict(fname: str) -> Dict:
+    return _load_structure(fname).as_dict()
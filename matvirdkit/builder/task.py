@@ -4,11 +4,14 @@ from uuid import uuid4
 from typing import Dict,Union
 from importlib import import_module
 from monty.serialization import loadfn,dumpfn
-from matvirdkit import log,TASKS_DIR,REPO_DIR
-from matvirdkit.model.utils import jsanitize
+from matvirdkit import log,TASKS_DIR,REPO_DIR,PACK_TASKS
+from matvirdkit.model.utils import jsanitize,construct_trusted
 from matvirdkit.model.utils import create_path,sepline
 #from matvirdkit.model.vasp.task import TaskDocument as VaspTaskDocument
-from matvirdkit.model.utils import sha1encode,task_tag
+from matvirdkit.model.utils import task_tag,dumpjson
+from matvirdkit.builder.structure_store import StructureStore
+from matvirdkit.builder.archive import TaskArchive,archive_name,read_task_file
+from matvirdkit.builder.migrate import map_task_id,rename_task,task_id_of
 
 class TaskDocument():
       def __init__(self,code):
@@ -21,7 +24,10 @@ class TaskDocument():
           module=import_module(self.module_str)
           self.hook=getattr(module,'TaskDocument')
 
-      def from_dict(self,**kwargs):
+      def from_dict(self,trusted=False,**kwargs):
+          # documents read back from the repository skip validation
+          if trusted:
+             return construct_trusted(self.hook,kwargs)
           return self.hook(**kwargs) 
           
       def from_directory(self,task_id,task_dir,dst_dir,**kwargs):
@@ -33,7 +39,7 @@ class TaskDocument():
                                            dst_dir=dst_dir,**kwargs)
 
 class GeneralTask():
-    def __init__(self,task_dir,code,repo_dir=None,**kwargs):
+    def __init__(self,task_dir,code,repo_dir=None,dedup_structure=True,pack=PACK_TASKS,**kwargs):
         self.task_dir= os.path.abspath(task_dir)
         self.code = code
         self.root_dst_dir = os.path.abspath(repo_dir) if repo_dir else os.path.join(TASKS_DIR,code)
@@ -42,6 +48,9 @@ class GeneralTask():
         self.tmp_dst_dir = os.path.join(self.root_dst_dir,self.tmp_task_id)
         self.dst_dir = None
         self.kwargs = kwargs
+        # structures of stored task documents are kept in the structure store
+        self.structure_store = StructureStore() if dedup_structure else None
+        self.pack = pack
         self._set_tmp_dst_dir()
 
     def set_task_info(self, task_id):
@@ -52,6 +61,8 @@ class GeneralTask():
         assert self.dst_dir is not None
         if os.path.isdir(self.dst_dir):
            shutil.rmtree(self.dst_dir)
+        if os.path.isfile(archive_name(self.dst_dir)):
+           os.remove(archive_name(self.dst_dir))
         shutil.move(self.tmp_dst_dir, self.dst_dir)
 
     def _set_tmp_dst_dir(self) -> None:
@@ -66,21 +77,21 @@ class GeneralTask():
            return False
         fname=os.path.join(self.root_dst_dir,task_encode,f_task)
         log.debug('fname %s'%fname)
-        if os.path.isfile(fname):
-           try:
-              ret=loadfn(fname,cls=None)          
-              _hash = self.task_hash(ret['input'])
-              if _hash == task_encode:
-                 # rewrite the task_id , maker sure the directory 
-                 # name is the task_id
+        try:
+           ret=read_task_file(os.path.join(self.root_dst_dir,task_encode),f_task)
+           if ret is None:
+              return False
+           _hash = self.task_hash(ret['input'])
+           if _hash == task_encode:
+              # rewrite the task_id , maker sure the directory 
+              # name is the task_id
+              if ret.get('task_id') != _hash and os.path.isfile(fname):
                  ret['task_id'] = _hash
-                 dumpfn(ret,fname)
-                 return True
-              else:
-                 return False
-           except:
-              return False          
-        else:
+                 dumpjson(ret,fname)
+              return True
+           else:
+              return False
+        except:
            return False
 
    
@@ -90,8 +101,10 @@ class GeneralTask():
         assert mode in ['skip','new']
         if mode=='skip':
            log.debug("task.json: %s"%os.path.join(self.dst_dir,'task.json'))
-           data=loadfn(os.path.join(self.dst_dir,'task.json'),cls=None)
-           return _td.from_dict(**data)
+           data=read_task_file(self.dst_dir,'task.json')
+           if self.structure_store:
+              data=self.structure_store.rehydrate(data)
+           return _td.from_dict(trusted=True,**data)
         else:
            return _td.from_directory(task_id=self.tmp_task_id,
                                   task_dir=self.task_dir,
@@ -100,7 +113,11 @@ class GeneralTask():
     def get_task(self,**kwargs):
         tag=self.task_tag(status='check')
         if tag:
-           task_encode=tag.get('encode','')
+           # ids written before content hashing are looked up in the migration map,
+           # a task still stored under its old id is moved to the new one
+           task_encode=map_task_id(tag.get('encode',''))
+           if task_encode and task_encode!=tag.get('encode'):
+              rename_task(self.root_dst_dir,tag['encode'],task_encode)
            log.info('task_encode %s'%task_encode)
            if self.validated_task(task_encode):
               log.debug('From json !')
@@ -120,6 +137,10 @@ class GeneralTask():
 
         calc_type=td.calc_type
         td=jsanitize(td)
+        if self.structure_store:
+           # the task id is computed on the deduplicated input, the
+           # structure reference is itself a content hash
+           td=self.structure_store.dedup(td)
         info=td['input']
         task_encode = self.task_hash(info)
         td['task_id']=task_encode
@@ -128,10 +149,14 @@ class GeneralTask():
         log.debug(sepline(std=False))
         log.debug('tmp_task_id: %s'%self.tmp_task_id)
         log.debug('pem_task_id: %s'%self.task_id)
-        if kwargs.get('indent',False):
-           dumpfn(td,os.path.join(self.dst_dir,'task.json'),indent=4)
-        else:
-           dumpfn(td,os.path.join(self.dst_dir,'task.json'))
+        if self.pack:
+           # raw outputs become members of the task archive
+           for jfd in td.get('orig_outputs',{}).values():
+               if isinstance(jfd,dict) and (jfd.get('file_name') or jfd.get('json_file_name')):
+                  jfd['archive'] = os.path.basename(archive_name(self.dst_dir))
+        dumpjson(td,os.path.join(self.dst_dir,'task.json'),indent=kwargs.get('indent',False))
+        if self.pack:
+           TaskArchive.pack(self.dst_dir)
         log.info('write tag.json file')
         self.task_tag(status='write',info={'encode':task_encode})
         return task_encode, calc_type
@@ -155,7 +180,8 @@ class GeneralTask():
            return None
 
     def task_hash(self,info):
-        return sha1encode(info)
+        # the same canonical form as the migration, with or without the structure store
+        return task_id_of(info,self.structure_store)
 
 #def VaspTask(task_dir,repo_dir=REPO_DIR,**kwargs):
 #      
@@ -217,5 +243,5 @@ if __name__ == '__main__':
    from matvirdkit.model.utils import test_path,create_path
    relax_dir=os.path.join('./relax')
    gt=GeneralTask(task_dir=relax_dir,code='vasp',repo_dir='./tasks')
-   encode, calc_type=gt.get_task(indent=True) 
+   encode, calc_type=gt.get_task() 
    print("calc: %s  ID: %s"%(calc_type, encode)) 
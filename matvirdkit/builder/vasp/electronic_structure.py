@@ -6,6 +6,18 @@ from pymatgen.io.vasp import Vasprun,Incar,Outcar,Oszicar,Potcar
 from pymatgen.electronic_structure.dos import  DOS,Dos
 from matvirdkit.model.utils import transfer_file
 from matvirdkit.model.common import DataFigure,JFData
+from matvirdkit.builder.vasp.outputs import parse_vasprun
+from matvirdkit.builder.render import recipe
+
+def _figure(kind, src_fig_name, src_dir, dst_dir, dst_data_name, meta):
+    # a prepared figure is copied, otherwise it is drawn later from the data
+    # into dst_dir, named like a transferred file after the hash of the data
+    if os.path.isfile(os.path.join(src_dir, src_fig_name)):
+        dst_fig_name=transfer_file(src_fig_name,src_dir,dst_dir, compress=False)
+        return JFData(description='%s fig'%kind, file_fmt='png', file_name = dst_fig_name, json_id=None, meta=meta)
+    dst_fig_name=os.path.splitext(dst_data_name)[0]+os.path.splitext(src_fig_name)[1]
+    return JFData(description='%s fig'%kind, file_fmt='png', file_name = dst_fig_name, json_id=None, meta=meta,
+                  recipe=recipe(kind))
 
 class VaspElectronicStructure(object):
         
@@ -23,8 +35,8 @@ class VaspElectronicStructure(object):
     def _set_vasprun(self,filename='vasprun.xml'):
         fname=os.path.join(self.task_dir,filename)
         try:
-            vr = Vasprun(fname, parse_potcar_file = self.parse_potcar_file,
-                                parse_projected_eigen = self.parse_projected_eigen)
+            vr = parse_vasprun(fname, parse_potcar_file = self.parse_potcar_file,
+                                     parse_projected_eigen = self.parse_projected_eigen)
             if vr.converged:
                self._vr = vr.as_dict()
             else:
@@ -73,9 +85,8 @@ class VaspElectronicStructure(object):
         src_json_fname=prefix+'-dos.json'
         src_fig_name=prefix+'-dos.png'
         dst_json_name=transfer_file(src_json_fname,src_dir,dst_dir, compress = False)
-        dst_fig_name=transfer_file(src_fig_name,src_dir,dst_dir, compress=False)
         data=JFData(description='dos data', json_data= {},json_file_name = dst_json_name, json_id=None, meta=meta)
-        fig=JFData(description='dos fig', file_fmt='png', file_name = dst_fig_name, json_id=None, meta=meta)
+        fig=_figure('dos', src_fig_name, src_dir, dst_dir, dst_json_name, meta)
         return DataFigure(data=[data],figure=fig)
  
     @staticmethod
@@ -83,9 +94,8 @@ class VaspElectronicStructure(object):
         src_json_fname=prefix+'-band.json'
         src_fig_name=prefix+'-band.png'
         dst_json_name=transfer_file(src_json_fname,src_dir,dst_dir, compress = False)
-        dst_fig_name=transfer_file(src_fig_name,src_dir,dst_dir, compress=False)
         data=JFData(description='band data', json_data= {},json_file_name = dst_json_name, json_id=None, meta=meta)
-        fig=JFData(description='band fig', file_fmt='png', file_name = dst_fig_name, json_id=None, meta=meta)
+        fig=_figure('band', src_fig_name, src_dir, dst_dir, dst_json_name, meta)
         return DataFigure(data=[data],figure=fig)
 
 
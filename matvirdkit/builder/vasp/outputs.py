@@ -10,7 +10,6 @@ import copy
 import warnings
 import numpy as np
 from typing import List
-from hashlib import sha1
 from pprint import pprint
 from warnings import filterwarnings
 from monty.json import jsanitize
@@ -20,8 +19,11 @@ from pymatgen.io.vasp.inputs import Poscar, Potcar, Incar, Kpoints
 from pymatgen.io.vasp.outputs import Oszicar, Outcar, Vasprun, Elfcar, Procar, Chgcar
 from pymatgen.io.vasp.inputs import UnknownPotcarWarning
 
+from matvirdkit import VASPRUN_CACHE
 from matvirdkit.model.common import JFData
-from matvirdkit.model.utils import transfer_file
+from matvirdkit.model.utils import transfer_file, dumpjson, content_hash
+from matvirdkit.cache import DiskCache, file_stamp
+from matvirdkit.builder.structure_store import StructureStore
 
 filterwarnings(action='ignore', category=UnknownPotcarWarning, module='pymatgen')
 
@@ -32,6 +34,68 @@ __email__ = 'haidi@hfut.edu.cn'
 __date__ = 'Dec 21, 2021'
 __version__ = "0.1.0"
 
+_vasprun_cache = None
+# bumped whenever the cached form of a Vasprun changes
+VASPRUN_CACHE_FORMAT = 2
+
+def _vasprun_state(vr: Vasprun) -> dict:
+    """
+    Picklable plain-data form of a parsed Vasprun: its attributes with the
+    Incar ones (parameters, incar) as plain dicts. Unpickling an Incar goes
+    through Incar.__setitem__, which normalises the values again and gives
+    e.g. 'Normal' for the parsed 'normal'.
+    """
+    state = dict(vars(vr))
+    incars = [k for k, v in state.items() if isinstance(v, Incar)]
+    for k in incars:
+        state[k] = dict(state[k])
+    return {'state': state, 'incars': incars}
+
+def _vasprun_from_state(d: dict) -> Vasprun:
+    vr = Vasprun.__new__(Vasprun)
+    state = dict(d['state'])
+    for k in d['incars']:
+        # filled around __setitem__, the values are kept as parsed
+        incar = Incar.__new__(Incar)
+        if isinstance(incar, dict):
+            dict.update(incar, state[k])
+        else:
+            # UserDict based Incar of recent pymatgen
+            incar.data = dict(state[k])
+        state[k] = incar
+    vr.__dict__.update(state)
+    return vr
+
+def parse_vasprun(fname='vasprun.xml', use_cache=VASPRUN_CACHE, **kwargs) -> Vasprun:
+    """
+    Parse a vasprun.xml through the on-disk parse cache.
+
+    The cache key is the (realpath, size, mtime_ns) stamp of the file plus the
+    parser options, so any change of the file or of the options triggers a new
+    parse. With parse_potcar_file the stamp of the neighbouring POTCAR is part
+    of the key too, since the parsed potcar_spec depends on it.
+
+    Args:
+        fname (str): path of vasprun.xml
+        use_cache (bool): set False to always parse from scratch
+        kwargs: options passed to pymatgen.io.vasp.outputs.Vasprun
+    Returns:
+        Vasprun object
+    """
+    global _vasprun_cache
+    if not use_cache:
+        return Vasprun(fname, **kwargs)
+    if _vasprun_cache is None:
+        _vasprun_cache = DiskCache('vasprun')
+    key = [VASPRUN_CACHE_FORMAT, file_stamp(fname), sorted(kwargs.items())]
+    potcar = os.path.join(os.path.dirname(os.path.realpath(fname)), 'POTCAR')
+    if kwargs.get('parse_potcar_file', True) and os.path.isfile(potcar):
+        key.append(file_stamp(potcar))
+    # the cache keeps plain data, a hit and a fresh parse give the same object
+    state = _vasprun_cache.get_or_set(DiskCache.make_key(*key),
+                                      lambda: _vasprun_state(Vasprun(fname, **kwargs)))
+    return _vasprun_from_state(state)
+
 class VaspOutputs(object):
     def __init__(self, 
            work_path : str,
@@ -39,6 +103,7 @@ class VaspOutputs(object):
            sufix : str ='' ,
            relax : bool = True,
            allow_fail : bool =False,
+           dedup_structure : bool = True,
            **kargs
         ):
  
@@ -55,6 +120,7 @@ class VaspOutputs(object):
         self.allow_fail = allow_fail
         #self.save_raw = save_raw
         self.relax = relax
+        self.structure_store = StructureStore() if dedup_structure else None
         self.kargs = kargs
 
     def parse_output(self, dst_path, save_raw=True):
@@ -96,9 +162,11 @@ class VaspOutputs(object):
             #print(foutput, ' : raw-->', cfname)
 
             if data:
-               json_file_name=sha1(str(data).encode('utf-8')).hexdigest()
+               json_file_name=content_hash(data)
                json_file_name=os.path.join(dst_path,json_file_name+'-'+foutput+'.json')
-               dumpfn(data,json_file_name,indent=4)
+               if self.structure_store:
+                  data=self.structure_store.dedup(data)
+               dumpjson(data,json_file_name)
             else:
                json_file_name = ''
             #print(foutput, ' : jsanitize-->', json_file_name)
@@ -199,7 +267,7 @@ class VaspOutputs(object):
     def get_vasprun(cls, fname='vasprun.xml', allow_fail=False, parse_potcar_file=True):
         if os.path.exists(fname):
             try:
-                vr = Vasprun(fname, parse_potcar_file=parse_potcar_file)
+                vr = parse_vasprun(fname, parse_potcar_file=parse_potcar_file)
                 if allow_fail:
                     return vr.as_dict()
                 else:
@@ -0,0 +1,68 @@
+"""
+Content-addressed pool of POTCAR files.
+
+Tasks computed with the same pseudopotentials share one gzipped POTCAR under
+``POTCAR_DIR``, named by the hash of the potcar_spec (titel and hash of each
+single). Task documents only keep that reference.
+"""
+import os
+import gzip
+import json
+from uuid import uuid4
+from hashlib import sha1
+from functools import lru_cache
+from typing import Dict, List
+
+from pymatgen.io.vasp.inputs import Potcar
+
+from matvirdkit import log, POTCAR_DIR
+
+__author__ = 'Haidi Wang'
+__email__ = 'haidi@hfut.edu.cn'
+
+
+def potcar_spec(potcar: Potcar) -> List[Dict]:
+    """
+    potcar_spec in the same form as Vasprun.potcar_spec
+    """
+    return [{"titel": ps.keywords['TITEL'], "hash": ps.get_potcar_hash()} for ps in potcar]
+
+
+def potcar_ref(spec: List[Dict]) -> str:
+    return sha1(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class PotcarPool(object):
+    def __init__(self, pool_dir: str = POTCAR_DIR):
+        self.pool_dir = pool_dir
+        os.makedirs(self.pool_dir, exist_ok=True)
+
+    def _path(self, ref: str) -> str:
+        return os.path.join(self.pool_dir, ref + '-POTCAR.gz')
+
+    def __contains__(self, ref: str) -> bool:
+        return os.path.isfile(self._path(ref))
+
+    def put(self, potcar: Potcar) -> str:
+        """
+        Store the potcar once and return its reference.
+        """
+        ref = potcar_ref(potcar_spec(potcar))
+        fname = self._path(ref)
+        if not os.path.isfile(fname):
+            tmp = os.path.join(self.pool_dir, '.%s.tmp' % uuid4().hex)
+            with gzip.open(tmp, 'wt') as fid:
+                fid.write(str(potcar))
+            os.replace(tmp, fname)
+            log.debug('new POTCAR in pool: %s' % ref)
+        return ref
+
+    def get(self, ref: str) -> Potcar:
+        return _load_potcar(self._path(ref))
+
+
+@lru_cache(maxsize=32)
+def _load_potcar(fname: str) -> Potcar:
+    if not os.path.isfile(fname):
+        raise RuntimeError('POTCAR %s not found in pool' % fname)
+    return Potcar.from_file(fname)
@@ -0,0 +1,229 @@
+"""
+On-disk cache shared by all processes, used by the builder (parsed
+vasprun.xml) and by the models (symmetry and dimensionality).
+
+Every entry is a single pickle file named by its key under the cache
+directory. Writers dump to a temporary file in the same directory and
+``os.replace`` it in place, so concurrent readers see either the old entry,
+the new entry or nothing, never a partial file. The file mtime is used as
+the LRU stamp: it is touched on every hit, and the oldest entries are
+evicted once the directory grows beyond the size budget. Every process keeps
+a running estimate of the directory size (one scan, then the sizes it
+writes), the directory is only scanned again when the estimate exceeds the
+budget or every EVICT_INTERVAL writes to catch the writes of the other
+processes.
+
+TieredCache puts a per-process in-memory LRU in front of a DiskCache for
+small results that are asked for many times.
+"""
+import os
+import copy
+import fcntl
+import pickle
+from collections import OrderedDict
+from uuid import uuid4
+from hashlib import sha1
+from typing import Any, Callable, Optional
+
+from matvirdkit import log, CACHE_DIR, CACHE_SIZE_LIMIT
+
+__author__ = 'Haidi Wang'
+__email__ = 'haidi@hfut.edu.cn'
+
+_MISS = object()
+# writes between two full scans of the cache directory
+EVICT_INTERVAL = 256
+# an eviction goes down to this fraction of the budget, so that a full cache
+# is not scanned again on the next write
+EVICT_TARGET = 0.9
+
+
+def file_stamp(fname: str) -> tuple:
+    """
+    Identity of a file on disk: (realpath, size, mtime_ns).
+    """
+    fname = os.path.realpath(fname)
+    st = os.stat(fname)
+    return (fname, st.st_size, st.st_mtime_ns)
+
+
+class DiskCache(object):
+    def __init__(self, name: str, cache_dir: Optional[str] = None,
+                 size_limit: Optional[int] = None):
+        """
+        Args:
+            name (str): sub-directory of the cache root used for this cache
+            cache_dir (str): cache root, defaults to ``CACHE_DIR``
+            size_limit (int): size budget in bytes, defaults to ``CACHE_SIZE_LIMIT``
+        """
+        self.name = name
+        self.cache_dir = os.path.join(cache_dir if cache_dir else CACHE_DIR, name)
+        self.size_limit = CACHE_SIZE_LIMIT if size_limit is None else size_limit
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._lock_file = os.path.join(self.cache_dir, '.lock')
+        # running size estimate of this process, None until the first scan
+        self._size_estimate = None
+        self._writes = 0
+
+    @staticmethod
+    def make_key(*args) -> str:
+        return sha1(repr(args).encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + '.pkl')
+
+    def get(self, key: str, default: Any = None) -> Any:
+        fname = self._path(key)
+        try:
+            with open(fname, 'rb') as fid:
+                value = pickle.load(fid)
+        except FileNotFoundError:
+            return default
+        except Exception:
+            # truncated or incompatible entry, treat as a miss
+            log.debug('drop broken cache entry %s' % fname)
+            self.delete(key)
+            return default
+        try:
+            os.utime(fname)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        fname = self._path(key)
+        tmp = os.path.join(self.cache_dir, '.%s.%s.tmp' % (key, uuid4().hex))
+        try:
+            with open(tmp, 'wb') as fid:
+                pickle.dump(value, fid, protocol=pickle.HIGHEST_PROTOCOL)
+                written = fid.tell()
+            os.replace(tmp, fname)
+        except Exception as e:
+            log.debug('cache write failed for %s : %s' % (fname, e))
+            if os.path.isfile(tmp):
+                os.remove(tmp)
+            return
+        self._note_write(written)
+
+    def _note_write(self, nbytes: int) -> None:
+        if self.size_limit <= 0:
+            return
+        self._writes += 1
+        if self._size_estimate is None or self._writes % EVICT_INTERVAL == 0:
+            self._size_estimate = self.size()
+        else:
+            self._size_estimate += nbytes
+        if self._size_estimate > self.size_limit:
+            self.evict()
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def get_or_set(self, key: str, func: Callable[[], Any]) -> Any:
+        value = self.get(key, _MISS)
+        if value is _MISS:
+            value = func()
+            self.set(key, value)
+        return value
+
+    def size(self) -> int:
+        return sum(e.stat().st_size for e in os.scandir(self.cache_dir)
+                   if e.is_file() and e.name.endswith('.pkl'))
+
+    def evict(self) -> None:
+        """
+        Remove the least recently used entries until the cache fits
+        EVICT_TARGET of the size budget, the size estimate is reset to what
+        is left.
+        """
+        if self.size_limit <= 0:
+            return
+        with open(self._lock_file, 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # another process is evicting right now
+                return
+            try:
+                entries = []
+                total = 0
+                for e in os.scandir(self.cache_dir):
+                    if not e.name.endswith('.pkl'):
+                        continue
+                    try:
+                        st = e.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime_ns, st.st_size, e.path))
+                    total += st.st_size
+                if total <= self.size_limit:
+                    self._size_estimate = total
+                    return
+                entries.sort()
+                target = EVICT_TARGET * self.size_limit
+                for _, size, path in entries:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                    if total <= target:
+                        break
+                self._size_estimate = total
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def clear(self) -> None:
+        for e in os.scandir(self.cache_dir):
+            if e.name.endswith('.pkl'):
+                self.delete(e.name[:-4])
+        self._size_estimate = 0
+
+
+class TieredCache(object):
+    def __init__(self, name: str, maxsize: int = 1024, cache_dir: Optional[str] = None,
+                 size_limit: Optional[int] = None):
+        """
+        Args:
+            name (str): name of the on-disk tier, see DiskCache
+            maxsize (int): number of entries kept in memory
+        """
+        self.maxsize = maxsize
+        self.disk = DiskCache(name, cache_dir=cache_dir, size_limit=size_limit)
+        self._memory = OrderedDict()
+
+    make_key = staticmethod(DiskCache.make_key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return copy.deepcopy(self._memory[key])
+        value = self.disk.get(key, _MISS)
+        if value is _MISS:
+            return default
+        self._remember(key, value)
+        return copy.deepcopy(value)
+
+    def set(self, key: str, value: Any) -> None:
+        self._remember(key, copy.deepcopy(value))
+        self.disk.set(key, value)
+
+    def _remember(self, key: str, value: Any) -> None:
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def get_or_set(self, key: str, func: Callable[[], Any]) -> Any:
+        value = self.get(key, _MISS)
+        if value is _MISS:
+            value = func()
+            self.set(key, value)
+        return value
+
+    def clear(self) -> None:
+        self._memory.clear()
+        self.disk.clear()
@@ -7,6 +7,9 @@ import sys
 import itertools
 from matvirdkit.builder.base import main as builder_main
 from matvirdkit.creator.base import main as creator_main
+from matvirdkit.builder.render import main as render_main
+from matvirdkit.builder.stability import main as stability_main
+from matvirdkit.builder.similarity import main as similarity_main
 from matvirdkit import NAME, SHORT_CMD
 
 __author__ = ""
@@ -38,6 +41,41 @@ To see the options for the sub-commands, type "{SHORT_CMD} sub-command -h".""")
     parser_build.add_argument('-c','--config', type=str, default='info.json', help="The information file. Supported format: ['info.json','info.yaml']")
     parser_build.set_defaults(func=builder_main)
     
+    #-------------
+    # render
+    parser_render = subparsers.add_parser(
+        "render", help="Draw the figures of the built materials.")
+    parser_render.add_argument('-d','--database', type=str, required=True, help="The database name, e.g. mech2d")
+    parser_render.add_argument('-m','--material_ids', type=str, nargs='*', default=None, help="Only these materials")
+    parser_render.add_argument('-n','--nprocs', type=int, default=1, help="Number of processes")
+    parser_render.add_argument('-f','--force', action='store_true', help="Draw figures that are up to date too")
+    parser_render.set_defaults(func=render_main)
+
+    #-------------
+    # stability
+    parser_stability = subparsers.add_parser(
+        "stability", help="Reclassify the stability of the built materials.")
+    parser_stability.add_argument('-d','--database', type=str, required=True, help="The database name, e.g. mech2d")
+    parser_stability.add_argument('-m','--material_ids', type=str, nargs='*', default=None, help="Only these materials")
+    parser_stability.add_argument('-n','--nprocs', type=int, default=1, help="Number of processes")
+    parser_stability.add_argument('--formation_energy', type=float, default=None, help="Formation energy limit (eV/atom)")
+    parser_stability.add_argument('--max_hessian', type=float, default=None, help="Largest hessian limit")
+    parser_stability.add_argument('--min_eig', type=float, default=None, help="Smallest tensor eigenvalue limit")
+    parser_stability.add_argument('--dry_run', action='store_true', help="Do not write the documents")
+    parser_stability.set_defaults(func=stability_main)
+
+    #-------------
+    # similarity
+    parser_similarity = subparsers.add_parser(
+        "similarity", help="Index the built materials and write their similar structures.")
+    parser_similarity.add_argument('-d','--database', type=str, required=True, help="The database name, e.g. mech2d")
+    parser_similarity.add_argument('-m','--material_ids', type=str, nargs='*', default=None, help="Only these materials")
+    parser_similarity.add_argument('-n','--nprocs', type=int, default=1, help="Number of processes")
+    parser_similarity.add_argument('-t','--top', type=int, default=10, help="Number of similar materials kept")
+    parser_similarity.add_argument('-i','--index', type=str, default='default', help="Name of the similarity index")
+    parser_similarity.add_argument('--index_only', action='store_true', help="Do not write the documents")
+    parser_similarity.set_defaults(func=similarity_main)
+
     #-------------
     #creator
     parser_create= subparsers.add_parser(
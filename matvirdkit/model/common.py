@@ -24,6 +24,8 @@ class JFData(MatvirdBase):
      json_id :  str   This value will be set when data is inserted  into MongoDB GridFS system
      json_file_name: str   If this value is set, then it means the corresponding file will  be  saved into GridFS, and the entry id will be saved in json_id 
      json_data: dict   If this value is set, the data will be saved directly into the MongoDB in JFData entry. The json_data has priority compared with json_file_name
+     archive:  str   If this value is set, file_name and json_file_name are member names of this packed task archive
+     arrays:   dict  If this value is set, file_name (file_fmt 'bin') holds these named arrays as raw bytes, {key: {'offset','shape','dtype'}}, see model.utils.dump_arrays
 
      1. General txt data. For example, we can save the OUTCAR via following command:
         JFData(description='This is OUTCAR file',
@@ -58,8 +60,15 @@ class JFData(MatvirdBase):
                file_id  = '', 
                file_name= './dataset/bms-1/dos.png'
                json_id  = '',
-               json_file_name ='', 
-               json_data = {} ) 
+               json_file_name ='',
+               json_data = {} )
+
+     5. binary arrays. The curves are stored as raw bytes and read back as numpy arrays.
+        JFData(description='This is curve data',
+               file_fmt = 'bin',
+               file_id  = '',
+               file_name= 'mechanics/elc_energy/Def_1/Def_1_Energy.bin',
+               arrays   = {'data': {'offset': 0, 'shape': [11, 2], 'dtype': '<f8'}} )
      """
      file_fmt: Optional['str'] = Field('',description='file format of, which will be linked with f_id')
      file_id: Optional['str'] = Field('',description='If the file is saved in the mongoDB by file then the corresponding ID will be recorded')
@@ -67,6 +76,9 @@ class JFData(MatvirdBase):
      json_id: Optional['str'] = Field('',description='If the data is saved in the mongoDB by json then the corresponding ID will be recorded')
      json_file_name: Optional['str'] = Field('',description='The file name for json data that will be saved in Mongo directly by ref ID')
      json_data: Optional[Dict] = Field({},description='json data that will be saved in current data structure')
+     archive: Optional['str'] = Field('',description='The packed archive holding file_name and json_file_name as members')
+     arrays: Optional[Dict[str,Dict]] = Field({},description='Layout of the named arrays held in the binary file file_name')
+     recipe: Optional[Dict] = Field({},description='How to draw the figure file_name from the data of its DataFigure, see builder.render')
 
 class DataFigure(BaseModel):
     data: List[JFData] = Field([],description='data')
@@ -0,0 +1,150 @@
+"""
+Fast dimensionality classification from the periodic bonding graph.
+
+Atoms closer than the Jmol bond length of their element pair (the same
+cutoffs get_dimensionality_gorai uses) are bonded. Neighbours come from the
+vectorised periodic neighbour search of pymatgen. Every connected component
+of the bonding graph is walked once to give each atom an image offset; a bond
+closing a loop through another unit cell contributes the translation
+``offset_i + image - offset_j``. The rank of these translations is the
+dimensionality of the component (0 molecule, 1 chain, 2 layer, 3 bulk), that
+of the structure is the largest one.
+"""
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from pymatgen.core import Structure
+from pymatgen.analysis.dimensionality import get_dimensionality_gorai
+from pymatgen.analysis.local_env import JmolNN
+
+__author__ = 'Haidi Wang'
+__email__ = 'haidi@hfut.edu.cn'
+
+
+def _site_symbols(structure: Structure) -> List[str]:
+    # disordered sites are represented by their major element
+    return [max(site.species.items(), key=lambda x: x[1])[0].symbol for site in structure]
+
+
+@lru_cache(maxsize=8)
+def _jmol(el_radius_updates: Tuple = ()) -> JmolNN:
+    # JmolNN reads its radius table from yaml, build it once
+    return JmolNN(el_radius_updates=dict(el_radius_updates) if el_radius_updates else None)
+
+
+def bond_cutoffs(structure: Structure, el_radius_updates: Optional[Dict] = None,
+                 bonds: Optional[Dict] = None) -> Tuple[List[str], np.ndarray]:
+    """
+    Element symbols and the matrix of maximum bond lengths between them,
+    the same as get_max_bond_lengths unless bonds are given.
+    """
+    symbols = sorted(set(_site_symbols(structure)))
+    index = {s: i for i, s in enumerate(symbols)}
+    cutoff = np.zeros((len(symbols), len(symbols)))
+    if bonds:
+        for (el1, el2), length in bonds.items():
+            s1, s2 = getattr(el1, 'symbol', str(el1)), getattr(el2, 'symbol', str(el2))
+            if s1 in index and s2 in index:
+                cutoff[index[s1], index[s2]] = cutoff[index[s2], index[s1]] = length
+    else:
+        jm = _jmol(tuple(sorted(el_radius_updates.items())) if el_radius_updates else ())
+        for a, s1 in enumerate(symbols):
+            for b, s2 in enumerate(symbols):
+                cutoff[a, b] = jm.get_max_bond_distance(s1, s2)
+    return symbols, cutoff
+
+
+def bonded_pairs(structure: Structure, el_radius_updates: Optional[Dict] = None,
+                 bonds: Optional[Dict] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Bonds of a periodic structure as (i, j, image) arrays, atom j sits in the
+    cell translated by image.
+    """
+    symbols, cutoff = bond_cutoffs(structure, el_radius_updates, bonds)
+    kinds = np.array([symbols.index(s) for s in _site_symbols(structure)], dtype=int)
+    if cutoff.max() <= 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros((0, 3), dtype=int)
+    i, j, images, dist = structure.get_neighbor_list(float(cutoff.max()))
+    keep = dist <= cutoff[kinds[i], kinds[j]]
+    return i[keep], j[keep], np.rint(images[keep]).astype(int)
+
+
+def get_dimensionality_fast(structure: Structure, el_radius_updates: Optional[Dict] = None,
+                            bonds: Optional[Dict] = None) -> int:
+    """
+    Dimensionality (0, 1, 2 or 3) of a structure from the rank of the
+    periodic translations of its bonded components.
+
+    Args:
+        structure (Structure): structure to analyze
+        el_radius_updates (dict): symbol->float to update atomic radii
+        bonds (dict[tuple, float]): explicit max bond distances of element pairs
+    """
+    n = len(structure)
+    i, j, images = bonded_pairs(structure, el_radius_updates, bonds)
+    if not len(i):
+        return 0
+    order = np.argsort(i, kind='stable')
+    i, j, images = i[order], j[order], images[order]
+    start = np.searchsorted(i, np.arange(n + 1)).tolist()
+    jl, il = j.tolist(), images.tolist()
+
+    # walk each component once, giving every atom an image offset
+    offset = [None] * n
+    label = np.zeros(n, dtype=int)
+    for root in range(n):
+        if offset[root] is not None:
+            continue
+        offset[root] = (0, 0, 0)
+        label[root] = root
+        queue = deque([root])
+        while queue:
+            a = queue.popleft()
+            oa = offset[a]
+            for k in range(start[a], start[a + 1]):
+                b = jl[k]
+                if offset[b] is None:
+                    img = il[k]
+                    offset[b] = (oa[0] + img[0], oa[1] + img[1], oa[2] + img[2])
+                    label[b] = root
+                    queue.append(b)
+
+    offset = np.array(offset, dtype=int)
+    loops = offset[i] + images - offset[j]
+    cyclic = np.any(loops != 0, axis=1)
+    dim = 0
+    for comp in np.unique(label[i[cyclic]]):
+        vecs = np.unique(loops[cyclic & (label[i] == comp)], axis=0)
+        dim = max(dim, int(np.linalg.matrix_rank(vecs)))
+        if dim == 3:
+            break
+    return dim
+
+
+def benchmark_dimensionality(structures: List[Structure], supercell=None) -> None:
+    """
+    Compare get_dimensionality_fast with get_dimensionality_gorai (which
+    reports 0D as 1) and time both, optionally on supercells.
+    """
+    if supercell:
+        structures = [st * supercell for st in structures]
+    t_fast = t_gorai = 0.0
+    agree = 0
+    for st in structures:
+        t = time.time()
+        fast = get_dimensionality_fast(st)
+        t_fast += time.time() - t
+        t = time.time()
+        gorai = get_dimensionality_gorai(st)
+        t_gorai += time.time() - t
+        agree += int(max(fast, 1) == gorai)
+        print('%-12s natoms %4d  fast %d  gorai %d' % (st.composition.reduced_formula, len(st), fast, gorai))
+    print('agree %d/%d  fast %.3f s  gorai %.3f s' % (agree, len(structures), t_fast, t_gorai))
+
+
+if __name__ == '__main__':
+    import sys
+    benchmark_dimensionality([Structure.from_file(f) for f in sys.argv[1:]])
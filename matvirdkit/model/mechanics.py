@@ -1,5 +1,6 @@
 import os
 import uuid
+import numpy as np
 from datetime import datetime
 from typing import ClassVar, Dict, List, Optional, Union, Tuple,TypeVar,Type , Any
 from pydantic import BaseModel, Field
@@ -12,6 +13,108 @@ from matvirdkit.model.common import DataFigure,JFData,MatvirdBase
 M2S = TypeVar("M2", bound="Mechanics2dSummary")
 M3S = TypeVar("M3", bound="Mechanics3dSummary")
 
+# in-plane (xx, yy, xy) rows and columns of a 6x6 Voigt tensor
+VOIGT_2D = [0, 1, 5]
+
+def tensor_2d(tensor):
+    """
+    In-plane 3x3 blocks of stacked 6x6 Voigt tensors, 3x3 tensors are
+    returned as they are.
+    """
+    tensor = np.asarray(tensor, dtype=float)
+    if tensor.shape[-1] == 6:
+        tensor = tensor[..., VOIGT_2D, :][..., VOIGT_2D]
+    return tensor
+
+def min_eigenvalues(tensor, dimension=2):
+    """
+    Smallest eigenvalue of stacked 6x6 Voigt tensors, of their in-plane 3x3
+    blocks for 2d materials; the stiffness criterion of Builder.set_stability.
+    """
+    tensor = np.asarray(tensor, dtype=float)
+    if dimension == 2:
+        tensor = tensor_2d(tensor)
+    return np.linalg.eigvalsh(tensor)[..., 0]
+
+def polar_moduli(compliance, ntheta=360):
+    """
+    Angle dependent Young's modulus and Poisson's ratio of stacked 2D
+    compliance tensors, in one matrix product for all of them.
+
+    Args:
+        compliance (array): (..., 3, 3) in-plane or (..., 6, 6) Voigt compliance (m/N)
+        ntheta (int): number of angles over [0, 2 pi]
+    Returns:
+        theta (ntheta,), E (..., ntheta) in N/m, nu (..., ntheta)
+    """
+    s = tensor_2d(compliance)
+    theta = np.linspace(0, 2 * np.pi, ntheta)
+    c, si = np.cos(theta), np.sin(theta)
+    # Voigt stress of a unit load along theta and strain across it
+    load = np.stack([c * c, si * si, c * si])
+    lateral = np.stack([si * si, c * c, -c * si])
+    q_load = (load[:, None, :] * load[None, :, :]).reshape(9, ntheta)
+    q_lateral = (lateral[:, None, :] * load[None, :, :]).reshape(9, ntheta)
+    s9 = s.reshape(s.shape[:-2] + (9,))
+    E = 1.0 / (s9 @ q_load)
+    nu = -(s9 @ q_lateral) * E
+    return theta, E, nu
+
+def polar_statistics(compliance, ntheta=360, chunk=10000):
+    """
+    Extrema of E(theta) and nu(theta) of stacked 2D compliance tensors.
+
+    Returns:
+        {'E_max', 'E_min', 'E_anisotropy' (E_max/E_min), 'nu_max', 'nu_min'},
+        each an array over the tensors
+    """
+    s = tensor_2d(compliance).reshape(-1, 3, 3)
+    keys = ['E_max', 'E_min', 'nu_max', 'nu_min']
+    ret = {key: np.empty(len(s)) for key in keys}
+    for start in range(0, len(s), chunk):
+        _, E, nu = polar_moduli(s[start:start + chunk], ntheta)
+        part = slice(start, start + chunk)
+        ret['E_max'][part], ret['E_min'][part] = E.max(axis=1), E.min(axis=1)
+        ret['nu_max'][part], ret['nu_min'][part] = nu.max(axis=1), nu.min(axis=1)
+    ret['E_anisotropy'] = ret['E_max'] / ret['E_min']
+    return ret
+
+def elastic_moduli(stiffness):
+    """
+    Voigt, Reuss and Hill averages of stacked 6x6 stiffness tensors (GPa),
+    in one pass for all of them.
+
+    Returns:
+        {'K_V', 'K_R', 'K_H', 'G_V', 'G_R', 'G_H', 'E_H', 'nu_H', 'A_U',
+        'min_eig'}, each an array over the tensors; A_U is the universal
+        anisotropy index and min_eig the smallest eigenvalue of the
+        stiffness (Born criterion: > 0)
+    """
+    c = np.asarray(stiffness, dtype=float)
+    c = 0.5 * (c + np.swapaxes(c, -1, -2))
+    s = np.linalg.inv(c)
+    diag = np.arange(3)
+    shear = np.arange(3, 6)
+    ret = {}
+    c_a = c[..., diag, diag].sum(-1)
+    c_b = c[..., [0, 1, 0], [1, 2, 2]].sum(-1)
+    c_c = c[..., shear, shear].sum(-1)
+    s_a = s[..., diag, diag].sum(-1)
+    s_b = s[..., [0, 1, 0], [1, 2, 2]].sum(-1)
+    s_c = s[..., shear, shear].sum(-1)
+    ret['K_V'] = (c_a + 2 * c_b) / 9
+    ret['G_V'] = (c_a - c_b + 3 * c_c) / 15
+    ret['K_R'] = 1 / (s_a + 2 * s_b)
+    ret['G_R'] = 15 / (4 * s_a - 4 * s_b + 3 * s_c)
+    ret['K_H'] = (ret['K_V'] + ret['K_R']) / 2
+    ret['G_H'] = (ret['G_V'] + ret['G_R']) / 2
+    K, G = ret['K_H'], ret['G_H']
+    ret['E_H'] = 9 * K * G / (3 * K + G)
+    ret['nu_H'] = (3 * K - 2 * G) / (2 * (3 * K + G))
+    ret['A_U'] = 5 * ret['G_V'] / ret['G_R'] + ret['K_V'] / ret['K_R'] - 6
+    ret['min_eig'] = np.linalg.eigvalsh(c)[..., 0]
+    return ret
+
 class ApproachAndProperty(ValueEnum):
       elc_energy="elc_energy"
       elc_stress="elc_stress"
@@ -70,12 +173,85 @@ class Mechanics2dSummary(MechanicsBase):
           #dumpfn(cls.schema(),'schema-2d.json')
           return cls(**{k: v for k, v in data.items() if k in fields}, **kwargs)
 
+      @classmethod
+      def from_tensor(
+          cls: Type[M2S],
+          c2d,
+          **kwargs
+          ) -> M2S:
+          """
+          Summary from the 3x3 stiffness tensor (N/m) in the Voigt order
+          xx, yy, xy; the tensors are stored in the 6x6 layout with the
+          in-plane components at 0, 1 and 5.
+          """
+          c2d = np.asarray(c2d, dtype=float)
+          s2d = np.linalg.inv(c2d)
+          stiffness = np.zeros((6, 6))
+          compliance = np.zeros((6, 6))
+          stiffness[np.ix_(VOIGT_2D, VOIGT_2D)] = c2d
+          compliance[np.ix_(VOIGT_2D, VOIGT_2D)] = s2d
+          data={
+                "s_tensor" : stiffness.tolist(),
+                "c_tensor": compliance.tolist(),
+                "Lm": (c2d[0,0]+c2d[1,1]+2*c2d[0,1])/4,
+                "Y10": 1/s2d[0,0],
+                "Y01": 1/s2d[1,1],
+                "Gm": c2d[2,2],
+                "V10": -s2d[0,1]/s2d[0,0],
+                "V01": -s2d[0,1]/s2d[1,1],
+                "stability": YesOrNo.yes if np.linalg.eigvalsh(c2d).min() > 0 else YesOrNo.no
+              }
+          return cls(**data, **kwargs)
+
+      def polar_ev(self, ntheta=360):
+          """
+          theta (rad), Young's modulus (N/m) and Poisson's ratio over
+          [0, 2 pi] from the compliance tensor, the table of EV_theta.dat.
+          """
+          theta, E, nu = polar_moduli(self.c_tensor, ntheta)
+          return np.column_stack([theta, E, nu])
 
-class Mechanics3d(BaseModel):
-      description : Optional[str] = ''
 
 class Mechanics3dSummary(MechanicsBase):
-      pass
+      K_V:  float = Field(None,description='Voigt bulk modulus (GPa)')
+      K_R:  float = Field(None,description='Reuss bulk modulus (GPa)')
+      K_H:  float = Field(None,description='Hill bulk modulus (GPa)')
+      G_V:  float = Field(None,description='Voigt shear modulus (GPa)')
+      G_R:  float = Field(None,description='Reuss shear modulus (GPa)')
+      G_H:  float = Field(None,description='Hill shear modulus (GPa)')
+      E_H:  float = Field(None,description='Hill Young\'s modulus (GPa)')
+      nu_H: float = Field(None,description='Hill Poisson ratio')
+      A_U:  float = Field(None,description='universal anisotropy index')
+      stability:  YesOrNo = Field(None,description='stable or not (Born criterion)')
+      @classmethod
+      def from_tensor(
+          cls: Type[M3S],
+          c3d,
+          **kwargs
+          ) -> M3S:
+          """
+          Summary from the 6x6 Voigt stiffness tensor (GPa), stored like
+          the 2d one: s_tensor holds the stiffness, c_tensor the compliance.
+          """
+          c3d = np.asarray(c3d, dtype=float)
+          moduli = elastic_moduli(c3d)
+          data={
+                "s_tensor" : c3d.tolist(),
+                "c_tensor": np.linalg.inv(c3d).tolist(),
+                "stability": YesOrNo.yes if moduli.pop('min_eig') > 0 else YesOrNo.no
+              }
+          data.update({k: float(v) for k, v in moduli.items()})
+          return cls(**data, **kwargs)
+
+class Elc2nd3d(BaseModel):
+      summary:  Mechanics3dSummary = Field(None, description='Summary of 3d mechanical properties')
+      # e.g.   {'Def_1': DataFigure(data=[data],figure=figure)}
+      deformations: Dict[str,DataFigure] = Field(None, description='Used to save the deformation information and corresponding figure')
+      meta: Dict[str,Any] = Field({})
+
+class Mechanics3d(MatvirdBase):
+      provenance: Dict[str,LocalProvenance] = Field({}, description="Property provenance")
+      elc2nd_stress: Elc2nd3d = Field (None, description='2nd elastic constant calculation info obtained via stress method')
 
 class Elc3nd2d(BaseModel):
       summary: Dict = Field({})
@@ -90,8 +266,11 @@ class Elc2nd2d(BaseModel):
       meta: Dict[str,Any] = Field({})
      
 class EOS(BaseModel):
-      minmum: float = Field(None)
-      equilibrium: float = Field(None)  
+      minmum: float = Field(None, description='minimum energy (eV)')
+      equilibrium: float = Field(None, description='equilibrium volume (A^3), area (A^2) or strain')
+      modulus: float = Field(None, description='bulk (GPa) or layer (N/m) modulus at equilibrium')
+      modulus_derivative: float = Field(None, description='pressure derivative of the modulus')
+      form: str = Field(None, description='birch_murnaghan, vinet or polynomial')
       data:  DataFigure = Field(None)
 
 class StressStrain(BaseModel):
@@ -118,7 +297,7 @@ class Mechanics3dDoc(BaseModel):
     An Mechanics  property block
     """
     property_name: ClassVar[str] = "mechanics3d"
-    mechanics3d: List[Mechanics3d] = Field([], description='3d Mechanics information')
+    mechanics3d: Dict[str,Mechanics3d] = Field({}, description='3d Mechanics information')
 
 if __name__=='__main__': 
    import numpy as np
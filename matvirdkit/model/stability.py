@@ -1,4 +1,5 @@
 import uuid
+import numpy as np
 from datetime import datetime
 from typing import ClassVar, Dict, List, Optional, Union, Tuple, TypeVar, Type
 from pydantic import BaseModel, Field, validator
@@ -17,6 +18,50 @@ class StabilityLevel(ValueEnum):
       unknown='unknown'
       check='checking'
 
+# thresholds of the classification rules
+FORMATION_ENERGY_LIMIT = 0.2   # eV/atom
+MAX_HESSIAN_LIMIT = -0.01
+MIN_EIG_LIMIT = 0.0
+
+def classify_thermo(formation_energy_per_atom, energy_above_hull, limit=FORMATION_ENERGY_LIMIT):
+    """
+    StabilityLevel values of stacked formation energies and energies above
+    the hull (eV/atom).
+    """
+    fe = np.asarray(formation_energy_per_atom, dtype=float)
+    eh = np.asarray(energy_above_hull, dtype=float)
+    return np.select([fe > limit, (fe > limit + eh) & (fe < limit)],
+                     [StabilityLevel.low.value, StabilityLevel.middle.value],
+                     StabilityLevel.high.value)
+
+def classify_phonon(max_hessian, limit=MAX_HESSIAN_LIMIT):
+    """
+    StabilityLevel values of stacked largest hessian (imaginary mode) values.
+    """
+    return np.where(np.asarray(max_hessian, dtype=float) <= limit,
+                    StabilityLevel.low.value, StabilityLevel.high.value)
+
+def classify_stiffness(min_eig_tensor, limit=MIN_EIG_LIMIT):
+    """
+    StabilityLevel values of stacked smallest eigenvalues of elastic tensors.
+    """
+    return np.where(np.asarray(min_eig_tensor, dtype=float) <= limit,
+                    StabilityLevel.low.value, StabilityLevel.high.value)
+
+def combine_stiffness(min_eig_energy, min_eig_stress, limit=MIN_EIG_LIMIT):
+    """
+    Stiffness stability from the energy and the stress method, nan where a
+    method is missing: both stable is high, a disagreement or an unstable
+    pair is checking, a single method is classified alone.
+    """
+    e = np.asarray(min_eig_energy, dtype=float)
+    s = np.asarray(min_eig_stress, dtype=float)
+    has_e, has_s = np.isfinite(e), np.isfinite(s)
+    both = np.where((e > limit) & (s > limit), StabilityLevel.high.value, StabilityLevel.check.value)
+    return np.select([has_e & has_s, has_e, has_s],
+                     [both, classify_stiffness(e, limit), classify_stiffness(s, limit)],
+                     StabilityLevel.unknown.value)
+
 class ThermoDynamicStability(MatvirdBase):
       value: StabilityLevel = Field(None, description='stability from thermodynamic')
       @classmethod
@@ -36,15 +81,13 @@ class ThermoDynamicStability(MatvirdBase):
               else fields
           )
 
-          if formation_energy_per_atom > 0.2 :
-             value=StabilityLevel.low           
-          elif   formation_energy_per_atom > 0.2+ energy_above_hull and formation_energy_per_atom < 0.2:
-             value=StabilityLevel.middle
-          else:
-             value=StabilityLevel.high
+          value=StabilityLevel(str(classify_thermo(formation_energy_per_atom, energy_above_hull)))
           data={
                 'value': value,
                 }
+          # the inputs are kept for a later reclassification, see builder.stability
+          kwargs['meta']=dict(kwargs.get('meta') or {}, formation_energy_per_atom=formation_energy_per_atom,
+                              energy_above_hull=energy_above_hull)
           return cls(**{k: v for k, v in data.items() if k in fields}, **kwargs)
 
 class PhononStability(MatvirdBase):
@@ -65,13 +108,11 @@ class PhononStability(MatvirdBase):
               else fields
           )
 
-          if max_hessian <= -0.01 :
-             value=StabilityLevel.low           
-          else:
-             value=StabilityLevel.high
+          value=StabilityLevel(str(classify_phonon(max_hessian)))
           data={
                 'value': value,
                 }
+          kwargs['meta']=dict(kwargs.get('meta') or {}, max_hessian=max_hessian)
           return cls(**{k: v for k, v in data.items() if k in fields}, **kwargs)
 
 class StiffnessStability(MatvirdBase):
@@ -92,13 +133,11 @@ class StiffnessStability(MatvirdBase):
               else fields
           )
 
-          if min_eig_tensor <= 0 :
-             value=StabilityLevel.low           
-          else:
-             value=StabilityLevel.high
+          value=StabilityLevel(str(classify_stiffness(min_eig_tensor)))
           data={
                 'value': value,
                 }
+          kwargs['meta']=dict(kwargs.get('meta') or {}, min_eig_tensor=min_eig_tensor)
           return cls(**{k: v for k, v in data.items() if k in fields}, **kwargs)
 
 
@@ -1,13 +1,18 @@
+import json
 import numpy as np
 from enum import  Enum
+from hashlib import sha1
 from pydantic import BaseModel, Field
 from pymatgen.core import Composition #as COMPOSITION
 from pymatgen.core import Structure   #as STRUCTURE
 from pymatgen.core.periodic_table import Element
 from pymatgen.analysis.dimensionality import get_dimensionality_gorai
-from typing import List, Dict, Union, Tuple, Optional, Type, TypeVar, overload
+from typing import Any, ClassVar, List, Dict, Union, Tuple, Optional, Type, TypeVar, overload
+from matvirdkit import SYMMETRY_CACHE, COMPACT_STRUCTURE
 from matvirdkit.model.symmetry import SymmetryData
+from matvirdkit.model.dimensionality import get_dimensionality_fast
 from matvirdkit.model.utils import Vector3D, Matrix3D,ValueEnum
+from matvirdkit.cache import TieredCache
 
 #Composition = Dict[str, float] 
 #Composition.__doc__ = "Composition dict"  # type: ignore
@@ -239,34 +244,192 @@ class StructureMetadata(BaseModel):
 
         return cls(**{k: v for k, v in data.items() if k in fields}, **kwargs)
 
+def structure_to_arrays(structure: Structure) -> Dict[str, np.ndarray]:
+    """
+    Compact array encoding of a structure: 3x3 lattice, Nx3 fractional
+    coordinates, a species table with per-site indices into it and one
+    column per site property. Disordered sites are kept as json
+    {specie: occupancy} entries of the species table.
+    """
+    table: List[str] = []
+    index: Dict[str, int] = {}
+    species = np.empty(len(structure), dtype=np.int32)
+    for i, site in enumerate(structure):
+        if site.is_ordered:
+            key = str(site.specie)
+        else:
+            key = json.dumps({str(sp): occu for sp, occu in site.species.items()}, sort_keys=True)
+        if key not in index:
+            index[key] = len(table)
+            table.append(key)
+        species[i] = index[key]
+    d = {
+        "lattice": np.array(structure.lattice.matrix, dtype=np.float64),
+        "frac_coords": np.array(structure.frac_coords, dtype=np.float64).reshape(-1, 3),
+        "species_table": np.array(table, dtype=str),
+        "species": species,
+        "charge": np.array(structure.charge if structure.charge else 0.0, dtype=np.float64),
+    }
+    d.update(site_property_columns(structure.site_properties))
+    return d
+
+def site_property_columns(site_properties: Dict[str, List]) -> Dict[str, np.ndarray]:
+    """
+    One "prop:<key>" array per site property, json for ragged or object
+    columns.
+    """
+    d = {}
+    for key, values in site_properties.items():
+        try:
+            col = np.array(values)
+        except ValueError:
+            col = None
+        if col is None or col.dtype == object:
+            col = np.array(json.dumps(values))
+        d["prop:" + key] = col
+    return d
+
+def site_properties_from_columns(d: Dict[str, np.ndarray]) -> Dict[str, List]:
+    """
+    Inverse of site_property_columns
+    """
+    site_properties = {}
+    for key, col in d.items():
+        if key.startswith("prop:"):
+            site_properties[key[5:]] = json.loads(col.item()) if col.ndim == 0 else col.tolist()
+    return site_properties
+
+def structure_from_arrays(d: Dict[str, np.ndarray]) -> Structure:
+    """
+    Inverse of structure_to_arrays
+    """
+    table = [json.loads(sp) if sp.startswith("{") else sp for sp in d["species_table"].tolist()]
+    species = [table[i] for i in d["species"].tolist()]
+    site_properties = site_properties_from_columns(d)
+    charge = float(d["charge"]) if "charge" in d else None
+    return Structure(d["lattice"], species, d["frac_coords"],
+                     charge=charge if charge else None,
+                     site_properties=site_properties if site_properties else None)
+
+def arrays_hash(arrays: Dict[str, np.ndarray]) -> str:
+    """
+    sha1 over the names, dtypes and raw bytes of an array encoding
+    """
+    h = sha1()
+    for key in sorted(arrays.keys()):
+        h.update(key.encode("utf-8"))
+        h.update(str(arrays[key].dtype).encode("utf-8"))
+        h.update(np.ascontiguousarray(arrays[key]).tobytes())
+    return h.hexdigest()
+
+def structure_fingerprint(structure: Structure) -> str:
+    """
+    Exact fingerprint of a structure: lattice, coordinates, species, charge
+    and site properties (magmom enters the symmetry search). Structures
+    with the same fingerprint give the same analysis results.
+    """
+    return arrays_hash(structure_to_arrays(structure))
+
+_dimensionality_cache = None
+
+def get_dimensionality(structure: Structure, use_cache: bool = SYMMETRY_CACHE,
+                       method: str = "fast") -> int:
+    """
+    Dimensionality of a structure, cached by structure fingerprint in
+    memory and on disk.
+
+    Args:
+        method (str): 'fast' (bonding graph periodicity, 0-3, see
+            model.dimensionality) or 'gorai' (get_dimensionality_gorai, 1-3).
+            Both use the Jmol bond cutoffs and agree except for molecules,
+            0 with 'fast' and 1 with 'gorai' (tests/model/test_dimensionality.py)
+    """
+    global _dimensionality_cache
+    assert method in ["fast", "gorai"]
+    func = get_dimensionality_fast if method == "fast" else get_dimensionality_gorai
+    if not use_cache:
+        return func(structure)
+    if _dimensionality_cache is None:
+        _dimensionality_cache = TieredCache("dimensionality")
+    key = TieredCache.make_key(method, structure_fingerprint(structure))
+    return _dimensionality_cache.get_or_set(key, lambda: func(structure))
+
 class Dimension(ValueEnum):
       zero: int = 0   # quantom dot
       one: int =  1   # nano wire
       two: int =  2   # nano film 
       three: int= 3   # bulk
 
+class CompactStructure(BaseModel):
+    """
+    Array form of a structure (see structure_to_arrays): lattice, fractional
+    coordinates, a species table with one index per site and site property
+    columns. Much smaller than the per-site dicts of StructureMP.
+    """
+    lattice: Matrix3D = Field(..., title="Lattice matrix in Angstroms")
+    frac_coords: List[Vector3D] = Field(..., title="Fractional coordinates of the sites")
+    species_table: List[str] = Field(..., title="Distinct species, json {specie: occupancy} for disordered sites")
+    species: List[int] = Field(..., title="Index of each site into species_table")
+    charge: float = Field(0.0, title="Total charge")
+    site_properties: Dict[str, Any] = Field({}, title="Site property columns")
+
+    @classmethod
+    def from_structure(cls, structure: Structure) -> "CompactStructure":
+        arrays = structure_to_arrays(structure)
+        return cls.construct(
+            lattice=arrays["lattice"].tolist(),
+            frac_coords=arrays["frac_coords"].tolist(),
+            species_table=arrays["species_table"].tolist(),
+            species=arrays["species"].tolist(),
+            charge=float(arrays["charge"]),
+            site_properties=site_properties_from_columns(arrays),
+        )
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        d = {
+            "lattice": np.array(self.lattice, dtype=np.float64),
+            "frac_coords": np.array(self.frac_coords, dtype=np.float64).reshape(-1, 3),
+            "species_table": np.array(self.species_table, dtype=str),
+            "species": np.array(self.species, dtype=np.int32),
+            "charge": np.array(self.charge if self.charge else 0.0, dtype=np.float64),
+        }
+        d.update(site_property_columns(self.site_properties))
+        return d
+
+    def to_structure(self) -> Structure:
+        return structure_from_arrays(self.to_arrays())
+
 class StructureMatvird(BaseModel):
     """
     Structure object with periodicity for Matvird database. Essentially a sequence
-    of Sites having a common lattice and a total charge.
+    of Sites having a common lattice and a total charge. The structure is kept
+    either MP style in ``structure`` or as arrays in ``compact_structure``.
     """
     description : Optional[str] = 'Structure information'
     dimension :  Optional[Dimension] = Field(None, title= 'Dimension of structure')
-    structure: StructureMP = Field(..., title="Material project style structure")
+    structure: StructureMP = Field(None, title="Material project style structure")
+    compact_structure: CompactStructure = Field(None, title="Array encoded structure")
     metadata:  StructureMetadata = Field(..., title="Structure meta data")
+
+    def get_structure(self) -> Structure:
+        if self.compact_structure is not None:
+            return self.compact_structure.to_structure()
+        return Structure.from_dict(self.structure.dict())
+
     @classmethod
     def from_structure(
         cls: Type[M],
         structure: Structure,
         dimension: Optional[Dimension]=None,
         fields: Optional[List[str]] = None,
+        compact: bool = COMPACT_STRUCTURE,
         **kwargs
         ) -> M:
 
         fields = (
             [
               "dimension",
-              "structure",
+              "compact_structure" if compact else "structure",
               "metadata"
             ]
             if fields is None
@@ -275,16 +438,28 @@ class StructureMatvird(BaseModel):
         if dimension:
            pass
         else:
-           dimension=get_dimensionality_gorai(structure)
+           dimension=get_dimensionality(structure)
         _metadata=StructureMetadata.from_structure(structure)
         #if dimension == 2:
         #  _metadata['volume']=np.linalg.norm(np.cross(structure.lattice.matrix[0],structure.lattice.matrix[1]))
         data={"dimension": dimension,
-              'structure': structure.as_dict(),
               'metadata':  _metadata
               }
+        if "structure" in fields:
+           data['structure'] = structure.as_dict()
+        if "compact_structure" in fields:
+           data['compact_structure'] = CompactStructure.from_structure(structure)
         return cls(**{k: v for k, v in data.items() if k in fields}, **kwargs)
 
+class SimilarStructure(BaseModel):
+    material_id: str = Field(None, title="Material ID")
+    database: str = Field(None, title="Database of the material")
+    similarity: float = Field(None, title="Cosine similarity of the structure fingerprints")
+
+class SimilarStructuresDoc(BaseModel):
+    property_name: ClassVar[str] = "similar_structures"
+    similar_structures: List[SimilarStructure] = Field([], description="most similar materials, best first")
+
 if __name__=='__main__':
   import os
   from matvirdkit.model.utils import jsanitize,ValueEnum
@@ -303,3 +478,6 @@ if __name__=='__main__':
   print(meta.dict())
   #print(meta.json())
   dumpfn(jsanitize(meta),'structure.json',indent=4)
+  for _st in [st, st * [3, 3, 1]]:
+      print('natoms %d  as_dict %d bytes  compact %d bytes'%(len(_st),
+            len(json.dumps(jsanitize(_st.as_dict()))), len(json.dumps(jsanitize(CompactStructure.from_structure(_st))))))
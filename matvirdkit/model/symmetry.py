@@ -1,12 +1,18 @@
-from typing import Any, Dict
+import os
+from multiprocessing import Pool
+from typing import Any, Dict, List, Optional
 
 from pydantic import BaseModel, Field
 from pymatgen.core import Structure
 from pymatgen.symmetry.analyzer import SpacegroupAnalyzer, spglib
 
 from enum import Enum
+from matvirdkit import SYMMETRY_CACHE
 from matvirdkit.model.utils import ValueEnum
 from matvirdkit.model.settings import SYMPREC
+from matvirdkit.cache import TieredCache
+
+_symmetry_cache = None
 
 
 
@@ -58,27 +64,91 @@ class SymmetryData(BaseModel):
     version: str = Field(None, title="SPGLib version")
 
     @classmethod
-    def from_structure(cls, structure: Structure) -> "SymmetryData":
-        symprec = SYMPREC
-        sg = SpacegroupAnalyzer(structure, symprec=symprec)
-        symmetry: Dict[str, Any] = {"symprec": symprec}
-        if not sg.get_symmetry_dataset():
-            sg = SpacegroupAnalyzer(structure, 1e-3, 1)
-            symmetry["symprec"] = 1e-3
-
-        symmetry.update(
-            {
-                "source": "spglib",
-                "symbol": sg.get_space_group_symbol(),
-                "number": sg.get_space_group_number(),
-                "point_group": sg.get_point_group_symbol(),
-                "crystal_system": CrystalSystem(sg.get_crystal_system().title()),
-                "hall": sg.get_hall(),
-                "version": spglib.__version__,
-            }
-        )
-
-        return SymmetryData(**symmetry)
+    def from_structure(cls, structure: Structure, use_cache: bool = SYMMETRY_CACHE) -> "SymmetryData":
+        """
+        Symmetry of a structure from spglib. With use_cache the result is
+        looked up by structure fingerprint, symprec and spglib version.
+        """
+        global _symmetry_cache
+        if not use_cache:
+            return SymmetryData(**_symmetry_dict(structure, SYMPREC))
+        # imported here, model.structure depends on this module
+        from matvirdkit.model.structure import structure_fingerprint
+        if _symmetry_cache is None:
+            _symmetry_cache = TieredCache("symmetry")
+        key = TieredCache.make_key(structure_fingerprint(structure), SYMPREC, spglib.__version__)
+        return SymmetryData(**_symmetry_cache.get_or_set(key, lambda: _symmetry_dict(structure, SYMPREC)))
+
+def _symmetry_dict(structure: Structure, symprec: float) -> Dict[str, Any]:
+    sg = SpacegroupAnalyzer(structure, symprec=symprec)
+    symmetry: Dict[str, Any] = {"symprec": symprec}
+    if not sg.get_symmetry_dataset():
+        sg = SpacegroupAnalyzer(structure, 1e-3, 1)
+        symmetry["symprec"] = 1e-3
+
+    symmetry.update(
+        {
+            "source": "spglib",
+            "symbol": sg.get_space_group_symbol(),
+            "number": sg.get_space_group_number(),
+            "point_group": sg.get_point_group_symbol(),
+            "crystal_system": sg.get_crystal_system().title(),
+            "hall": sg.get_hall(),
+            "version": spglib.__version__,
+        }
+    )
+    return symmetry
+
+def symmetry_from_structures(structures: List[Structure], nprocs: Optional[int] = None,
+                             use_cache: bool = SYMMETRY_CACHE, chunksize: int = 8) -> List[SymmetryData]:
+    """
+    SymmetryData of many structures at once, for large ingests.
+
+    Identical structures in the batch are analysed once, cached results are
+    reused and the remaining structures are spread over a process pool.
+    Every structure costs one spglib dataset (two when the 1e-3 fallback is
+    needed), all fields are read from it.
+
+    Args:
+        structures (list): pymatgen structures
+        nprocs (int): number of worker processes, defaults to the cpu count
+        use_cache (bool): look up and fill the symmetry cache
+        chunksize (int): structures sent to a worker at a time
+    Returns:
+        list of SymmetryData in the order of structures
+    """
+    global _symmetry_cache
+    from matvirdkit.model.structure import structure_fingerprint
+    fingerprints = [structure_fingerprint(st) for st in structures]
+    todo = {}
+    for fp, st in zip(fingerprints, structures):
+        todo.setdefault(fp, st)
+
+    results = {}
+    keys = {}
+    if use_cache:
+        if _symmetry_cache is None:
+            _symmetry_cache = TieredCache("symmetry")
+        for fp in list(todo.keys()):
+            keys[fp] = TieredCache.make_key(fp, SYMPREC, spglib.__version__)
+            hit = _symmetry_cache.get(keys[fp])
+            if hit is not None:
+                results[fp] = hit
+                del todo[fp]
+
+    nprocs = nprocs if nprocs else (os.cpu_count() or 1)
+    args = [(st, SYMPREC) for st in todo.values()]
+    if nprocs > 1 and len(args) > chunksize:
+        with Pool(processes=min(nprocs, -(-len(args) // chunksize))) as pool:
+            computed = pool.starmap(_symmetry_dict, args, chunksize=chunksize)
+    else:
+        computed = [_symmetry_dict(*arg) for arg in args]
+
+    for fp, symmetry in zip(todo.keys(), computed):
+        results[fp] = symmetry
+        if use_cache:
+            _symmetry_cache.set(keys[fp], symmetry)
+    return [SymmetryData(**results[fp]) for fp in fingerprints]
 
 if __name__== '__main__':
    import os
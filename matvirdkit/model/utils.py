@@ -5,21 +5,34 @@ from pathlib import Path
 from typing import Dict, Iterator, List, Tuple
 
 import os
+import re
+import sys
+import json
+import time
+from monty.io import zopen
 from monty.shutil import compress_file
 import shutil
 from shutil import SameFileError
-from hashlib import sha1
+from hashlib import sha1, blake2b
+from uuid import UUID
 import bson
 import numpy as np
-from monty.json import MSONable
+from monty.json import MSONable, MontyEncoder
 from monty.serialization import loadfn,dumpfn
 from pydantic import BaseModel
+from pydantic.datetime_parse import parse_datetime
+from pydantic.fields import SHAPE_SINGLETON, SHAPE_LIST, SHAPE_SET, SHAPE_SEQUENCE, SHAPE_DICT, SHAPE_MAPPING
 from pymatgen.analysis.structure_matcher import ElementComparator, StructureMatcher
 from pymatgen.core.structure import Structure
 from typing_extensions import Literal
 
 from matvirdkit.model.settings import SYMPREC,LTOL,STOL,ANGLE_TOL
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 Len = 40
 Vector3D = Tuple[float, float, float]
 Vector3D.__doc__ = "Real space vector"  # type: ignore
@@ -50,9 +63,211 @@ def task_tag(task_dir,status='write',info={}):
     else:
        return None  
     
+def _json_default(obj):
+    # orjson does not take float subclasses such as FloatWithUnit
+    if isinstance(obj, float):
+        return float(obj)
+    return MontyEncoder().default(obj)
+
+class _FallbackEncoder(MontyEncoder):
+    # what orjson writes natively: numpy as lists and numbers, enums as
+    # their values and uuids as strings
+    def default(self, o):
+        if isinstance(o, np.ndarray):
+            return o.tolist()
+        if isinstance(o, np.generic):
+            return o.item()
+        if isinstance(o, Enum):
+            return o.value
+        if isinstance(o, UUID):
+            return str(o)
+        return super().default(o)
+
+# json strings and the non-finite float tokens of the json module
+_NONFINITE = re.compile(r'"(?:[^"\\]|\\.)*"|-?Infinity|NaN')
+
+def _nonfinite_to_null(match):
+    token = match.group(0)
+    return token if token[0] == '"' else 'null'
+
+def dumpsjson(obj, indent=False):
+    """
+    Encode obj as compact canonical json bytes: sorted keys and no
+    whitespace (unless indent is asked for debugging). Uses orjson, the json
+    module is only a fallback; objects unknown to json go through
+    MontyEncoder. Both write NaN and infinities as null and non-ASCII
+    characters as UTF-8; only the spelling of small and large floats
+    (0.00001 or 1e-05) and the order of non-string keys may differ.
+    """
+    if orjson is not None:
+        # datetimes are written by MontyEncoder like dumpfn did
+        option = (orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS |
+                  orjson.OPT_PASSTHROUGH_DATETIME)
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_json_default, option=option)
+    data = json.dumps(obj, cls=_FallbackEncoder, sort_keys=True, ensure_ascii=False,
+                      indent=2 if indent else None,
+                      separators=(',', ': ') if indent else (',', ':'))
+    return _NONFINITE.sub(_nonfinite_to_null, data).encode('utf-8')
+
+def loadsjson(data):
+    """
+    Decode json bytes as plain dicts and lists. Documents written by
+    dumpfn or json.dumps may hold NaN and Infinity, which orjson rejects;
+    they are read by the json module.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
+def dumpjson(obj, fname, indent=False):
+    """
+    Write a stored document as compact canonical json (see dumpsjson).
+    Files ending with .gz/.bz2 are compressed.
+    """
+    data = dumpsjson(obj, indent=indent)
+    with zopen(fname, 'wb') as fid:
+        fid.write(data)
+
+def loadjson(fname):
+    """
+    Read a json document as plain dicts and lists, i.e. loadfn(fname, cls=None)
+    without going through monty's decoder.
+    """
+    with zopen(fname, 'rb') as fid:
+        return loadsjson(fid.read())
+
 def sha1encode(data):
+    """
+    Legacy id: sha1 of str(data). Depends on dict ordering and object
+    reprs, use content_hash for new ids.
+    """
     return  sha1(str(data).encode('utf-8')).hexdigest()
 
+HASH_DIGEST_SIZE = 20
+
+def content_hash(data) -> str:
+    """
+    Canonical content hash of a json-like object (40 hex digits).
+
+    The object is streamed into BLAKE2b as a type-tagged encoding: dict keys
+    are sorted, floats are normalised to 12 significant digits (-0.0 and
+    NaN included), enums are replaced by their values, arrays and tuples
+    hash like lists, pydantic and MSONable objects like their dicts. The
+    result does not depend on dict ordering or on the repr of objects.
+    """
+    h = blake2b(digest_size=HASH_DIGEST_SIZE)
+    _feed_hash(h, data)
+    return h.hexdigest()
+
+def _feed_hash(h, obj):
+    if obj is None:
+        h.update(b'N')
+    elif isinstance(obj, bool):
+        h.update(b'T' if obj else b'F')
+    elif isinstance(obj, Enum):
+        _feed_hash(h, obj.value)
+    elif isinstance(obj, int):
+        h.update(b'i%d;' % obj)
+    elif isinstance(obj, float):
+        if obj != obj:
+            h.update(b'fnan;')
+        else:
+            h.update(b'f%s;' % ('%.12g' % (obj + 0.0)).encode('ascii'))
+    elif isinstance(obj, str):
+        data = obj.encode('utf-8')
+        h.update(b's%d:' % len(data))
+        h.update(data)
+    elif isinstance(obj, bytes):
+        h.update(b'b%d:' % len(obj))
+        h.update(obj)
+    elif isinstance(obj, dict):
+        h.update(b'd')
+        for k, v in sorted(((k.__str__(), v) for k, v in obj.items()), key=lambda kv: kv[0]):
+            _feed_hash(h, k)
+            _feed_hash(h, v)
+        h.update(b'e')
+    elif isinstance(obj, (list, tuple)):
+        h.update(b'l')
+        for v in obj:
+            _feed_hash(h, v)
+        h.update(b'e')
+    elif isinstance(obj, (set, frozenset)):
+        h.update(b'l')
+        for v in sorted(content_hash(v) for v in obj):
+            _feed_hash(h, v)
+        h.update(b'e')
+    elif isinstance(obj, np.ndarray):
+        _feed_hash(h, obj.tolist())
+    elif isinstance(obj, np.generic):
+        _feed_hash(h, obj.item())
+    elif isinstance(obj, BaseModel):
+        _feed_hash(h, obj.__dict__)
+    elif isinstance(obj, MSONable):
+        _feed_hash(h, obj.as_dict())
+    elif isinstance(obj, (datetime.datetime, datetime.date)):
+        _feed_hash(h, obj.isoformat())
+    else:
+        _feed_hash(h, obj.__str__())
+
+def file_hash(fname, chunk_size=1 << 20) -> str:
+    """
+    Content hash of a file, read in chunks.
+    """
+    h = blake2b(digest_size=HASH_DIGEST_SIZE)
+    with open(fname, 'rb') as fid:
+        for chunk in iter(lambda: fid.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def dump_arrays(arrays, fname, float32=False):
+    """
+    Write named arrays back to back as raw little-endian C-ordered bytes,
+    e.g. the sidecar of a JFData (file_fmt 'bin') or a GridFS file.
+
+    Args:
+        arrays (dict): {key: array like}
+        float32 (bool): store floating point arrays in single precision
+    Returns:
+        layout {key: {'offset', 'shape', 'dtype'}} and the content hash of
+        the file
+    """
+    layout = {}
+    h = blake2b(digest_size=HASH_DIGEST_SIZE)
+    offset = 0
+    with open(fname, 'wb') as fid:
+        for key in sorted(arrays):
+            arr = np.asarray(arrays[key])
+            if arr.dtype.kind == 'f':
+                arr = arr.astype('<f4' if float32 else '<f8', copy=False)
+            else:
+                arr = arr.astype(arr.dtype.newbyteorder('<'), copy=False)
+            data = np.ascontiguousarray(arr).tobytes()
+            fid.write(data)
+            h.update(data)
+            layout[key] = {'offset': offset, 'shape': list(arr.shape), 'dtype': arr.dtype.str}
+            offset += len(data)
+    return layout, h.hexdigest()
+
+def load_arrays(fname, layout, data=None):
+    """
+    Named arrays of a file written by dump_arrays. The arrays are read-only
+    views of one buffer, data (bytes) if it is given instead of the file.
+    """
+    if data is None:
+        with open(fname, 'rb') as fid:
+            data = fid.read()
+    ret = {}
+    for key, item in layout.items():
+        dtype = np.dtype(item['dtype'])
+        count = int(np.prod(item['shape'], dtype=np.int64))
+        ret[key] = np.frombuffer(data, dtype=dtype, count=count, offset=item['offset']).reshape(item['shape'])
+    return ret
+
 def get_sg(struc, symprec=SYMPREC) -> int:
     """helper function to get spacegroup with a loose tolerance"""
     try:
@@ -66,6 +281,7 @@ def group_structures(
     stol: float = STOL,
     angle_tol: float = ANGLE_TOL,
     symprec: float = SYMPREC,
+    nprocs: int = 1,
 ) -> Iterator[List[Structure]]:
     """
     Groups structures according to space group and structure matching
@@ -76,6 +292,7 @@ def group_structures(
         stol (float): StructureMatcher tuning parameter for matching tasks to materials
         angle_tol (float): StructureMatcher tuning parameter for matching tasks to materials
         symprec (float): symmetry tolerance for space group finding
+        nprocs (int): match the space group groups in that many processes
     """
 
     sm = StructureMatcher(
@@ -89,12 +306,21 @@ def group_structures(
         comparator=ElementComparator(),
     )
 
-    def _get_sg(struc):
-        return get_sg(struc, symprec=symprec)
+    # space group of every structure once, sorted() and groupby() would
+    # otherwise both call spglib
+    sgs = [get_sg(struc, symprec=symprec) for struc in structures]
+    order = sorted(range(len(structures)), key=sgs.__getitem__)
 
     # First group by spacegroup number then by structure matching
-    for _, pregroup in groupby(sorted(structures, key=_get_sg), key=_get_sg):
-        for group in sm.group_structures(list(pregroup)):
+    pregroups = [[structures[i] for i in idx] for _, idx in groupby(order, key=sgs.__getitem__)]
+    if nprocs > 1 and len(pregroups) > 1:
+        from multiprocessing import Pool
+        with Pool(processes=min(nprocs, len(pregroups))) as pool:
+            results = pool.map(sm.group_structures, pregroups)
+    else:
+        results = map(sm.group_structures, pregroups)
+    for groups in results:
+        for group in groups:
             yield group
 
 
@@ -119,51 +345,149 @@ def jsanitize(obj, strict=False, allow_bson=False):
     Returns:
         Sanitized dict that can be json serialized.
     """
-    if allow_bson and (
-        isinstance(obj, (datetime.datetime, bytes))
-        or (bson is not None and isinstance(obj, bson.objectid.ObjectId))
-    ):
-        return obj
-    if isinstance(obj, (list, tuple, set)):
-        return [jsanitize(i, strict=strict, allow_bson=allow_bson) for i in obj]
-    if np is not None and isinstance(obj, np.ndarray):
-        return [
-            jsanitize(i, strict=strict, allow_bson=allow_bson) for i in obj.tolist()
-        ]
-    if isinstance(obj, Enum):
-        return obj.value
-    if isinstance(obj, dict):
-        return {
-            k.__str__(): jsanitize(v, strict=strict, allow_bson=allow_bson)
-            for k, v in obj.items()
-        }
-    if isinstance(obj, MSONable):
-        return {
-            k.__str__(): jsanitize(v, strict=strict, allow_bson=allow_bson)
-            for k, v in obj.as_dict().items()
-        }
-
-    if isinstance(obj, BaseModel):
-        return {
-            k.__str__(): jsanitize(v, strict=strict, allow_bson=allow_bson)
-            for k, v in obj.dict().items()
-        }
-    if isinstance(obj, (int, float)):
-        if np.isnan(obj):
-            return 0
-        return obj
-
-    if obj is None:
-        return None
-
+    handler = _JSANITIZE_DISPATCH.get(type(obj))
+    if handler is None:
+        handler = _resolve_jsanitize(type(obj))
+    return handler(obj, strict, allow_bson)
+
+# The handlers below follow the order of the isinstance checks of jsanitize.
+# The chosen handler depends on the type only, so it is resolved once per
+# type and cached in _JSANITIZE_DISPATCH.
+
+def _jsanitize_sequence(obj, strict, allow_bson):
+    return [jsanitize(i, strict, allow_bson) for i in obj]
+
+def _jsanitize_ndarray(obj, strict, allow_bson):
+    kind = obj.dtype.kind
+    if obj.ndim and kind in 'biu':
+        return obj.tolist()
+    if obj.ndim and kind == 'f':
+        data = obj.tolist()
+        nan = np.isnan(obj)
+        if nan.any():
+            # NaN is written as the integer 0, as for scalars
+            for idx in zip(*np.nonzero(nan)):
+                row = data
+                for i in idx[:-1]:
+                    row = row[i]
+                row[idx[-1]] = 0
+        return data
+    return [jsanitize(i, strict, allow_bson) for i in obj.tolist()]
+
+def _jsanitize_enum(obj, strict, allow_bson):
+    return obj.value
+
+def _jsanitize_dict(obj, strict, allow_bson):
+    return {k.__str__(): jsanitize(v, strict, allow_bson) for k, v in obj.items()}
+
+def _jsanitize_msonable(obj, strict, allow_bson):
+    return {k.__str__(): jsanitize(v, strict, allow_bson) for k, v in obj.as_dict().items()}
+
+def _jsanitize_model(obj, strict, allow_bson):
+    # walk the fields directly, BaseModel.dict() would first copy the whole
+    # tree into dicts which are then walked again
+    return {k.__str__(): jsanitize(v, strict, allow_bson) for k, v in obj.__dict__.items()}
+
+def _jsanitize_int(obj, strict, allow_bson):
+    return obj
+
+def _jsanitize_float(obj, strict, allow_bson):
+    if obj != obj:
+        return 0
+    return obj
+
+def _jsanitize_none(obj, strict, allow_bson):
+    return None
+
+def _jsanitize_other(obj, strict, allow_bson):
     if not strict:
         return obj.__str__()
-
     if isinstance(obj, str):
         return obj.__str__()
-
     return jsanitize(obj.as_dict(), strict=strict, allow_bson=allow_bson)
 
+def _resolve_jsanitize(tp):
+    if issubclass(tp, (list, tuple, set)):
+        handler = _jsanitize_sequence
+    elif np is not None and issubclass(tp, np.ndarray):
+        handler = _jsanitize_ndarray
+    elif issubclass(tp, Enum):
+        handler = _jsanitize_enum
+    elif issubclass(tp, dict):
+        handler = _jsanitize_dict
+    elif issubclass(tp, MSONable):
+        handler = _jsanitize_msonable
+    elif issubclass(tp, BaseModel):
+        handler = _jsanitize_model
+    elif issubclass(tp, float):
+        handler = _jsanitize_float
+    elif issubclass(tp, int):
+        handler = _jsanitize_int
+    elif tp is type(None):
+        handler = _jsanitize_none
+    else:
+        handler = _jsanitize_other
+    if issubclass(tp, (datetime.datetime, bytes)) or (
+        bson is not None and issubclass(tp, bson.objectid.ObjectId)
+    ):
+        handler = _bson_passthrough(handler)
+    _JSANITIZE_DISPATCH[tp] = handler
+    return handler
+
+def _bson_passthrough(handler):
+    def _handler(obj, strict, allow_bson):
+        if allow_bson:
+            return obj
+        return handler(obj, strict, allow_bson)
+    return _handler
+
+_JSANITIZE_DISPATCH = {}
+
+
+def construct_trusted(model, data):
+    """
+    Build a pydantic model from data written by this package, without
+    validation.
+
+    Nested models are built recursively with ``construct``, enums, datetimes
+    and MSONable fields (Structure, Composition ...) are decoded, everything
+    else is taken as is. Only use it for documents read back from the
+    repository; user supplied data must go through normal validation.
+    """
+    values = {}
+    for name, field in model.__fields__.items():
+        key = field.alias if field.alias in data else name
+        if key in data:
+            values[name] = _construct_field(field, data[key])
+    return model.construct(_fields_set=set(values.keys()), **values)
+
+_LIST_SHAPES = (SHAPE_LIST, SHAPE_SET, SHAPE_SEQUENCE)
+_DICT_SHAPES = (SHAPE_DICT, SHAPE_MAPPING)
+
+def _construct_field(field, value):
+    if value is None:
+        return None
+    if field.shape == SHAPE_SINGLETON:
+        return _construct_value(field.type_, value)
+    if field.shape in _LIST_SHAPES and isinstance(value, list):
+        return [_construct_value(field.type_, v) for v in value]
+    if field.shape in _DICT_SHAPES and isinstance(value, dict):
+        return {k: _construct_value(field.type_, v) for k, v in value.items()}
+    return value
+
+def _construct_value(tp, value):
+    if value is None or not isinstance(tp, type):
+        # Union, Any, Literal ...: keep the stored value
+        return value
+    if issubclass(tp, BaseModel):
+        return construct_trusted(tp, value) if isinstance(value, dict) else value
+    if issubclass(tp, Enum):
+        return value if isinstance(value, tp) else tp(value)
+    if issubclass(tp, datetime.datetime):
+        return parse_datetime(value)
+    if issubclass(tp, MSONable) and isinstance(value, dict):
+        return tp.from_dict(value)
+    return value
 
 class ValueEnum(Enum):
     """
@@ -230,9 +554,7 @@ def transfer_file(fname, src_path, dst_path, rename = True, path_type = 'base',
     fname=os.path.join(src_path,fname)
     if rename:
        if os.path.isfile(fname):
-           with open(fname,'rb') as fid:
-                data=fid.read()
-           encode_fname = sha1(str(data).encode('utf-8')).hexdigest()
+           encode_fname = file_hash(fname)
            dst_fname = os.path.join(dst_path, encode_fname + '-' + os.path.basename(fname))
            try:
               shutil.copyfile(src=fname, dst=dst_fname)
@@ -289,5 +611,68 @@ def test_path(f='.'):
     elif f=='..' or f=='../':
        return os.path.abspath(os.path.join(fpath,'../../../tests_files'))
 
+def benchmark_loading(tasks_dir, repeat=3):
+    '''
+    Compare the load time of the task documents under tasks_dir with
+    loadfn(cls=None) and loadjson, and the size of the indented versus
+    compact encoding.
+    '''
+    fnames=[]
+    for root, _, files in os.walk(tasks_dir):
+        fnames += [os.path.join(root,f) for f in files if f=='task.json']
+    docs=[loadjson(f) for f in fnames]
+    size_indent=sum(len(json.dumps(d,indent=4)) for d in docs)
+    size_compact=sum(len(json.dumps(d,sort_keys=True,separators=(',',':'))) for d in docs)
+    print('%d task documents, indent=4: %.2f MB, compact: %.2f MB'%(len(docs),size_indent/1e6,size_compact/1e6))
+    for name, func in [('loadfn(cls=None)',lambda f: loadfn(f,cls=None)),
+                       ('loadjson',loadjson)]:
+        t=time.time()
+        for _ in range(repeat):
+            for f in fnames:
+                func(f)
+        print('%-20s %.3f ms/doc'%(name,(time.time()-t)/repeat/max(len(fnames),1)*1e3))
+
+def benchmark_jsanitize(tasks_dir, repeat=3):
+    '''
+    Time jsanitize on the TaskDocument models rebuilt from the task.json
+    files under tasks_dir.
+    '''
+    from matvirdkit.model.vasp.task import TaskDocument
+    from matvirdkit.builder.structure_store import StructureStore
+    store=StructureStore()
+    docs=[]
+    for root, _, files in os.walk(tasks_dir):
+        if 'task.json' in files:
+           docs.append(TaskDocument(**store.rehydrate(loadjson(os.path.join(root,'task.json')))))
+    t=time.time()
+    for _ in range(repeat):
+        for doc in docs:
+            jsanitize(doc)
+    print('jsanitize %.3f ms/doc over %d task documents'%((time.time()-t)/repeat/max(len(docs),1)*1e3,len(docs)))
+
+def benchmark_construct(tasks_dir, repeat=3):
+    '''
+    Compare validated and trusted construction of TaskDocument models from
+    the task.json files under tasks_dir.
+    '''
+    from matvirdkit.model.vasp.task import TaskDocument
+    from matvirdkit.builder.structure_store import StructureStore
+    store=StructureStore()
+    data=[]
+    for root, _, files in os.walk(tasks_dir):
+        if 'task.json' in files:
+           data.append(store.rehydrate(loadjson(os.path.join(root,'task.json'))))
+    for label, func in [('validate', lambda d: TaskDocument(**d)),
+                        ('trusted',  lambda d: construct_trusted(TaskDocument, d))]:
+        t=time.time()
+        for _ in range(repeat):
+            for d in data:
+                func(d)
+        print('%-10s %.3f ms/doc over %d task documents'%(label,(time.time()-t)/repeat/max(len(data),1)*1e3,len(data)))
+
 if __name__ == '__main__':
    print(test_path())
+   if len(sys.argv) > 1:
+      benchmark_loading(sys.argv[1])
+      benchmark_jsanitize(sys.argv[1])
+      benchmark_construct(sys.argv[1])
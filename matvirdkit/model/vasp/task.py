@@ -11,14 +11,15 @@ from pymatgen.analysis.magnetism import CollinearMagneticStructureAnalyzer, Orde
 from pymatgen.analysis.structure_analyzer import oxide_type
 from pymatgen.core import Composition, Structure
 from pymatgen.entries.computed_entries import ComputedEntry, ComputedStructureEntry
-from pymatgen.io.vasp import VaspInput,Vasprun,Outcar,Oszicar,Elfcar,Locpot,Chgcar,Procar,Poscar
+from pymatgen.io.vasp import VaspInput,Vasprun,Outcar,Oszicar,Elfcar,Locpot,Chgcar,Procar,Poscar,Potcar
 
 from matvirdkit import log
 from matvirdkit.model.utils import Matrix3D, Vector3D,ValueEnum
 from matvirdkit.model.structure import StructureMetadata,StructureMP
 from matvirdkit.model.vasp.calc_types.enums import CalcType, RunType, TaskType 
 from matvirdkit.model.vasp.calc_types.utils import calc_type, run_type,  task_type
-from matvirdkit.builder.vasp.outputs import VaspOutputs
+from matvirdkit.builder.vasp.outputs import VaspOutputs, parse_vasprun
+from matvirdkit.builder.vasp.potcar import PotcarPool,potcar_spec
 from matvirdkit.model.common import JFData
 from matvirdkit.model.utils import transfer_file,sha1encode,task_tag
 
@@ -56,13 +57,28 @@ class InputSummary(BaseModel):
 class InputData(BaseModel) :
     INCAR: Dict = Field({},description="INCAR file")
     POSCAR: Dict = Field({},description="POSCAR file")
-    POTCAR: Dict = Field({},description="POTCAR file")
+    POTCAR: Dict = Field({},description="POTCAR file, only potcar_spec and potcar_ref are stored, the full data is kept in the POTCAR pool")
     KPOINTS: Dict = Field({},description="KPOINTS file")
     @classmethod
     def from_directory(cls,
-                   task_dir:str) -> 'InputData':
+                   task_dir:str,
+                   pool: bool = True) -> 'InputData':
          vi=VaspInput.from_directory(task_dir)
-         return cls(**vi.as_dict())
+         d=vi.as_dict()
+         if pool:
+            d['POTCAR']={'potcar_spec': potcar_spec(vi['POTCAR']),
+                         'potcar_ref': PotcarPool().put(vi['POTCAR'])}
+         return cls(**d)
+
+    def get_potcar(self) -> Potcar:
+         """
+         Resolve the full POTCAR from the pool, falling back to the
+         pymatgen POTCAR library for documents without a reference.
+         """
+         ref=self.POTCAR.get('potcar_ref','')
+         if ref:
+            return PotcarPool().get(ref)
+         return Potcar.from_dict(self.POTCAR)
   
 class OutputData(BaseModel):
     VASPRUN: JFData = Field(JFData(),description="vasprun file, json_id, file_id")
@@ -278,7 +294,7 @@ class TaskDocument(StructureMetadata):
         f_outputs = f_outputs if f_outputs else  ['vasprun.xml','OSZICAR','OUTCAR','CONTCAR']
         
         try:
-           vr=Vasprun(os.path.join(task_dir,'vasprun.xml'))
+           vr=parse_vasprun(os.path.join(task_dir,'vasprun.xml'))
         except:
            raise RuntimeError('Bad vasprun.xml')
         try:
@@ -347,7 +363,7 @@ class TaskDocument(StructureMetadata):
            
 if __name__== '__main__':
    import os
-   from matvirdkit.model.utils import jsanitize,ValueEnum
+   from matvirdkit.model.utils import jsanitize,ValueEnum,dumpjson
    from matvirdkit.model.utils import test_path,create_path
    from monty.serialization import loadfn,dumpfn
    from uuid import uuid4
@@ -367,7 +383,7 @@ if __name__== '__main__':
       shutil.move(out_dir,encode_dir)
       info={'path':os.path.abspath(out_dir.replace(out_dir,encode_dir)),
              'encode': encode}
-      dumpfn(td,os.path.join(encode_dir,'task.json'),indent=4)
+      dumpjson(td,os.path.join(encode_dir,'task.json'))
       task_tag(relax_dir,status='write',info=info)
  
    print('finished!')
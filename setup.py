@@ -25,7 +25,8 @@ install_requires=["pymatgen==2022.4.26",
                    "pymongo==4.1.1",
                    "Flask==2.1.2",
                    "fastapi==0.75.2",
-                   "python-decouple==3.6"],
+                   "python-decouple==3.6",
+                   "orjson==3.6.8"],
 
 setup(
     name="matvirdkit",
@@ -0,0 +1,5 @@
+import sys,os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+test_files_dir=os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'tests_files'))
+def setUpModule():
+    os.chdir(os.path.abspath(os.path.dirname(__file__)))
@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from pymatgen.io.vasp.inputs import Incar
+from pymatgen.io.vasp.outputs import Vasprun
+from .context import setUpModule, test_files_dir
+from matvirdkit import cache
+from matvirdkit.cache import DiskCache
+from matvirdkit.builder.vasp import outputs
+from matvirdkit.builder.vasp.outputs import parse_vasprun
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_get_set(self):
+        dc = DiskCache('test', cache_dir=self.tmp.name, size_limit=0)
+        dc.set('a', {'x': [1, 2]})
+        self.assertEqual(dc.get('a'), {'x': [1, 2]})
+        self.assertIsNone(dc.get('b'))
+
+    def test_size_limit(self):
+        dc = DiskCache('test', cache_dir=self.tmp.name, size_limit=20000)
+        for i in range(100):
+            dc.set(str(i), b'x' * 1000)
+        self.assertLessEqual(dc.size(), 20000 + 1100)
+        self.assertIsNotNone(dc.get('99'))
+
+    def test_no_scan_per_write(self):
+        dc = DiskCache('test', cache_dir=self.tmp.name, size_limit=50000)
+        with mock.patch.object(DiskCache, 'size', wraps=dc.size) as size, \
+             mock.patch.object(DiskCache, 'evict', wraps=dc.evict) as evict:
+            for i in range(200):
+                dc.set(str(i), b'x' * 1000)
+        # one initial scan and one eviction per ~5 kB of headroom
+        self.assertEqual(size.call_count, 1)
+        self.assertLess(evict.call_count, 200 // 4)
+
+    def test_rescan_interval(self):
+        dc = DiskCache('test', cache_dir=self.tmp.name, size_limit=10**9)
+        with mock.patch.object(cache, 'EVICT_INTERVAL', 10), \
+             mock.patch.object(DiskCache, 'size', wraps=dc.size) as size:
+            for i in range(30):
+                dc.set(str(i), i)
+        # first write, then writes 10, 20 and 30
+        self.assertEqual(size.call_count, 4)
+
+
+class TestVasprunCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.fname = os.path.join(test_files_dir, 'scf', 'vasprun.xml')
+        self.patch = mock.patch.object(outputs, '_vasprun_cache',
+                                       DiskCache('vasprun', cache_dir=self.tmp.name))
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.tmp.cleanup()
+
+    def check(self, vr, ref):
+        self.assertIsInstance(vr.parameters, Incar)
+        self.assertIsInstance(vr.incar, Incar)
+        self.assertEqual(dict(vr.parameters), dict(ref.parameters))
+        self.assertEqual(dict(vr.incar), dict(ref.incar))
+        self.assertEqual(vr.as_dict(), ref.as_dict())
+
+    def test_hit_matches_fresh_parse(self):
+        ref = Vasprun(self.fname)
+        self.check(parse_vasprun(self.fname), ref)
+        self.check(parse_vasprun(self.fname), ref)
+        # one entry, the second call was a hit
+        entries = [f for f in os.listdir(outputs._vasprun_cache.cache_dir) if f.endswith('.pkl')]
+        self.assertEqual(len(entries), 1)
+
+    def test_hit_skips_incar_normalisation(self):
+        # values read back from the cache are not cleaned up by Incar again
+        parse_vasprun(self.fname)
+        with mock.patch.object(Incar, '__setitem__', side_effect=AssertionError('normalised')), \
+             mock.patch.object(Vasprun, '__init__', side_effect=AssertionError('parsed')):
+            vr = parse_vasprun(self.fname)
+        self.check(vr, Vasprun(self.fname))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import os
+import unittest
+import numpy as np
+from .context import setUpModule, test_files_dir
+from matvirdkit.builder.elastic2d import lagrangian_strain, lagrangian_stress, fit_energy, fit_stress
+from matvirdkit.builder.elastic2d import read_deformations
+from matvirdkit.builder.manifest import scan_mechanics
+from matvirdkit.builder.elastic2d import EV_A2_TO_NM, KBAR_A_TO_NM
+
+# in-plane lattice vectors and a vacuum along z
+OBLIQUE = np.array([[3.2, 0.0, 0.0],
+                    [1.1, 4.3, 0.0],
+                    [0.0, 0.0, 20.0]])
+RECTANGULAR = np.array([[3.3, 0.0, 0.0],
+                        [0.0, 4.6, 0.0],
+                        [0.0, 0.0, 18.0]])
+# stiffness (N/m) over xx, yy, xy with the engineering shear strain
+C_OBLIQUE = np.array([[95.0, 18.0, 6.0],
+                      [18.0, 40.0, -3.0],
+                      [6.0, -3.0, 25.0]])
+C_RECTANGULAR = np.array([[95.0, 18.0, 0.0],
+                          [18.0, 40.0, 0.0],
+                          [0.0, 0.0, 25.0]])
+DIRECTIONS = [(1, 0, 0), (0, 1, 0), (0, 0, 1), (1, 1, 0), (1, 0, 1), (0, 1, 1)]
+STRAINS = np.linspace(-0.02, 0.02, 9)
+
+
+def stretch(voigt):
+    """
+    Symmetric deformation gradient with the Lagrangian strain of voigt.
+    """
+    eta = np.zeros((3, 3))
+    eta[0, 0], eta[1, 1] = voigt[0], voigt[1]
+    eta[0, 1] = eta[1, 0] = voigt[2] / 2
+    w, v = np.linalg.eigh(np.eye(3) + 2 * eta)
+    return v @ np.diag(np.sqrt(w)) @ v.T
+
+
+def energy_modes(ref, c2d, directions):
+    # E(e) = E0 + A 1/2 d.C.d e^2 with anharmonic terms the fit has to absorb
+    area = np.linalg.norm(np.cross(ref[0], ref[1]))
+    modes = {}
+    for i, d in enumerate(directions):
+        d = np.array(d, dtype=float)
+        quad = 0.5 * d @ c2d @ d * area / EV_A2_TO_NM
+        energy = -20.0 + quad * STRAINS ** 2 - 3.0 * STRAINS ** 3 + 40.0 * STRAINS ** 4
+        modes['Def_%d' % (i + 1)] = {'strain': STRAINS, 'direction': d, 'energy': energy}
+    return modes
+
+
+def stress_modes(ref, c2d, directions):
+    # linear Lagrangian stress S = C.d e, stored as the Cauchy stress in
+    # kBar with the VASP sign like vasprun.xml
+    c = ref[2, 2]
+    modes = {}
+    for i, d in enumerate(directions):
+        d = np.array(d, dtype=float)
+        F, stress = [], []
+        for e in STRAINS:
+            f = stretch(d * e)
+            s1, s2, s6 = c2d @ (d * e)
+            S = -np.array([[s1, s6, 0], [s6, s2, 0], [0, 0, 0]]) / (c * KBAR_A_TO_NM)
+            F.append(f)
+            stress.append(f @ S @ f.T / np.linalg.det(f))
+        modes['Def_%d' % (i + 1)] = {'strain': STRAINS, 'direction': d,
+                                     'F': np.array(F), 'stress': np.array(stress),
+                                     'c': np.full(len(STRAINS), c)}
+    return modes
+
+
+class TestLagrangianStrain(unittest.TestCase):
+    def test_known_gradient(self):
+        F = np.array([[[1.01, 0.02, 0.0], [-0.01, 0.98, 0.0], [0.0, 0.0, 1.0]],
+                      [[0.99, 0.00, 0.0], [0.03, 1.02, 0.0], [0.0, 0.0, 1.0]]])
+        lattices = OBLIQUE[None] @ np.swapaxes(F, 1, 2)
+        F_fit, eta = lagrangian_strain(OBLIQUE, lattices)
+        np.testing.assert_allclose(F_fit, F, atol=1e-12)
+        np.testing.assert_allclose(eta, 0.5 * (np.swapaxes(F, 1, 2) @ F - np.eye(3)), atol=1e-12)
+
+    def test_reference_is_unstrained(self):
+        F, eta = lagrangian_strain(OBLIQUE, OBLIQUE[None])
+        np.testing.assert_allclose(F[0], np.eye(3), atol=1e-12)
+        np.testing.assert_allclose(eta[0], np.zeros((3, 3)), atol=1e-12)
+
+    def test_stretch_strain(self):
+        voigt = np.array([0.015, -0.01, 0.02])
+        f = stretch(voigt)
+        eta = lagrangian_strain(RECTANGULAR, (RECTANGULAR @ f.T)[None])[1][0]
+        np.testing.assert_allclose([eta[0, 0], eta[1, 1], 2 * eta[0, 1]], voigt, atol=1e-12)
+
+
+class TestFitEnergy(unittest.TestCase):
+    def test_oblique(self):
+        c2d = fit_energy(OBLIQUE, energy_modes(OBLIQUE, C_OBLIQUE, DIRECTIONS), order=4)
+        np.testing.assert_allclose(c2d, C_OBLIQUE, atol=1e-6)
+
+    def test_rectangular(self):
+        # four modes determine the four constants of a rectangular lattice
+        modes = energy_modes(RECTANGULAR, C_RECTANGULAR, DIRECTIONS[:4])
+        c2d = fit_energy(RECTANGULAR, modes, order=4)
+        np.testing.assert_allclose(c2d, C_RECTANGULAR, atol=1e-6)
+
+    def test_underdetermined(self):
+        modes = energy_modes(OBLIQUE, C_OBLIQUE, DIRECTIONS[:4])
+        with self.assertRaises(RuntimeError):
+            fit_energy(OBLIQUE, modes, order=4)
+
+
+class TestFitStress(unittest.TestCase):
+    def test_lagrangian_stress(self):
+        modes = stress_modes(OBLIQUE, C_OBLIQUE, DIRECTIONS[2:3])
+        mode = modes['Def_1']
+        S = -lagrangian_stress(mode) * mode['c'][:, None, None] * KBAR_A_TO_NM
+        np.testing.assert_allclose(S[:, 0, 1], C_OBLIQUE[2, 2] * STRAINS, atol=1e-9)
+        np.testing.assert_allclose(S[:, 0, 0], C_OBLIQUE[0, 2] * STRAINS, atol=1e-9)
+
+    def test_oblique(self):
+        c2d = fit_stress(OBLIQUE, stress_modes(OBLIQUE, C_OBLIQUE, DIRECTIONS), order=1)
+        np.testing.assert_allclose(c2d, C_OBLIQUE, atol=1e-6)
+
+    def test_rectangular(self):
+        # two uniaxial and one shear mode are enough for the stress method
+        modes = stress_modes(RECTANGULAR, C_RECTANGULAR, [(1, 0, 0), (0, 1, 0), (0, 0, 1)])
+        c2d = fit_stress(RECTANGULAR, modes, order=1)
+        np.testing.assert_allclose(c2d, C_RECTANGULAR, atol=1e-6)
+
+
+class TestReadDeformations(unittest.TestCase):
+    def test_manifest_order(self):
+        # steps get their own vasprun.xml whatever the order of the manifest
+        task_dir = os.path.join(test_files_dir, 'alpha-P-R')
+        manifest = scan_mechanics(task_dir, ['elc_stress'])
+        shuffled = manifest._replace(approaches={'elc_stress': {
+            name: entry._replace(steps=entry.steps[::-1])
+            for name, entry in reversed(list(manifest.modes('elc_stress').items()))}})
+        for max_workers in [1, 4]:
+            ref, modes = read_deformations(task_dir, 'elc_stress', manifest=manifest, max_workers=max_workers)
+            _, shuffled_modes = read_deformations(task_dir, 'elc_stress', manifest=shuffled, max_workers=max_workers)
+            self.assertEqual(sorted(modes), sorted(shuffled_modes))
+            for name in modes:
+                self.assertEqual(modes[name]['steps'], shuffled_modes[name]['steps'])
+                for key in ['strain', 'energy', 'stress', 'F']:
+                    np.testing.assert_array_equal(modes[name][key], shuffled_modes[name][key])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from .context import setUpModule, test_files_dir
+from matvirdkit.builder.mechanics import mechanics2d_parser, POLAR_NTHETA
+
+
+class TestM2dFixtures(unittest.TestCase):
+    """
+    The in-process fits against the output m2d wrote for the same
+    calculations: EV_theta.dat of the energy approach and the stress tables.
+    """
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.dst_dir = os.path.join(self.tmp, 'mat', 'mechanics')
+        os.makedirs(self.dst_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def parse(self, name, prop, order):
+        return mechanics2d_parser(os.path.join(test_files_dir, name), self.dst_dir, prop,
+                                  order=order, float32=False)
+
+    def check_polar(self, name, order):
+        ret = self.parse(name, 'elc_energy', order)
+        self.assertEqual(ret['meta'], {'order': order})
+        ref = np.loadtxt(os.path.join(test_files_dir, name, 'EV_theta.dat'))
+        data = ret['summary'].polar_ev(POLAR_NTHETA)
+        self.assertEqual(data.shape, ref.shape)
+        np.testing.assert_allclose(data[:, 0], ref[:, 0], atol=1e-6)
+        # E in N/m and nu, m2d writes six decimals
+        np.testing.assert_allclose(data[:, 1], ref[:, 1], atol=1e-5)
+        np.testing.assert_allclose(data[:, 2], ref[:, 2], atol=1e-5)
+        for _def in ret['deformations']:
+            fname = os.path.join('elc_energy', _def, _def + '_Energy.dat')
+            np.testing.assert_allclose(np.loadtxt(os.path.join(self.dst_dir, fname)),
+                                       np.loadtxt(os.path.join(test_files_dir, name, fname)), atol=1e-8)
+
+    def test_energy_alpha_P_R(self):
+        self.check_polar('alpha-P-R', 4)
+
+    def test_energy_GeSe_RC(self):
+        self.check_polar('GeSe-RC', 2)
+
+    def test_stress_tables_alpha_P_R(self):
+        ret = self.parse('alpha-P-R', 'elc_stress', None)
+        self.assertEqual(sorted(ret['deformations']), ['Def_1', 'Def_2'])
+        for _def in ret['deformations']:
+            for kind in ['Lagrangian', 'Physical']:
+                fname = os.path.join('elc_stress', _def, '%s_%s_Stress.dat' % (_def, kind))
+                np.testing.assert_allclose(np.loadtxt(os.path.join(self.dst_dir, fname)),
+                                           np.loadtxt(os.path.join(test_files_dir, 'alpha-P-R', fname)),
+                                           atol=1e-5)
+
+    def test_no_m2d_meta_file(self):
+        ret = self.parse('alpha-P-R', 'elc_stress', None)
+        self.assertNotIn('json_file_name', ret['meta'])
+        self.assertFalse(os.path.exists(os.path.join(self.dst_dir, 'elc_stress', 'Mech2D.json')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import os
+import shutil
+import tempfile
+import unittest
+from .context import setUpModule
+from matvirdkit.model.utils import dumpjson
+from matvirdkit.builder.vasp.electronic_structure import VaspElectronicStructure
+
+
+class TestManualFigures(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.src_dir = os.path.join(self.tmp, 'dos')
+        self.dst_dir = os.path.join(self.tmp, 'mat')
+        os.makedirs(self.src_dir)
+        os.makedirs(self.dst_dir)
+        dumpjson({'energies': [0.0, 1.0]}, os.path.join(self.src_dir, 'm-1-dos.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_transferred_figure(self):
+        with open(os.path.join(self.src_dir, 'm-1-dos.png'), 'wb') as fid:
+            fid.write(b'png')
+        datafig = VaspElectronicStructure.get_dos_manually('m-1', self.src_dir, self.dst_dir)
+        fig = datafig.figure
+        self.assertFalse(fig.recipe)
+        self.assertTrue(fig.file_name.endswith('-m-1-dos.png'))
+        self.assertTrue(os.path.isfile(os.path.join(self.dst_dir, fig.file_name)))
+
+    def test_recipe_figure(self):
+        # no prepared figure: the name is relative to dst_dir like a transferred one
+        datafig = VaspElectronicStructure.get_dos_manually('m-1', self.src_dir, self.dst_dir)
+        data, fig = datafig.data[0], datafig.figure
+        self.assertEqual(fig.recipe['kind'], 'dos')
+        self.assertEqual(fig.file_name, data.json_file_name[:-len('.json')] + '.png')
+        self.assertTrue(os.path.isfile(os.path.join(self.dst_dir, data.json_file_name)))
+        self.assertFalse(os.path.isabs(fig.file_name))
+
+
+if __name__ == '__main__':
+    unittest.main()
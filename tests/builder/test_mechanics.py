@@ -0,0 +1,41 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from .context import setUpModule
+from matvirdkit.builder import mechanics
+from matvirdkit.builder.mechanics import _curve_data
+
+
+class TestCurveData(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dst_dir = os.path.join(self.tmp.name, 'mechanics')
+        os.makedirs(self.dst_dir)
+        x = np.linspace(-0.02, 0.02, 41)
+        # a kinked curve: straight pieces collapse to a few points
+        self.data = np.column_stack([x, np.abs(x) * 10 + 1.0])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_points_kept(self):
+        with mock.patch.object(mechanics, 'ARRAY_CURVES', False):
+            jfd = _curve_data('curve', {'data': self.data}, self.dst_dir, 'curve.bin',
+                              tolerance=1e-6, full='curve.dat')
+        kept = len(jfd.json_data['data'])
+        self.assertEqual(kept, 3)
+        self.assertEqual(jfd.meta['points'], kept)
+        self.assertEqual(jfd.meta['points_full'], 41)
+        self.assertEqual(jfd.meta['full'], 'curve.dat')
+
+    def test_no_tolerance(self):
+        with mock.patch.object(mechanics, 'ARRAY_CURVES', False):
+            jfd = _curve_data('curve', {'data': self.data}, self.dst_dir, 'curve.bin')
+        self.assertEqual(len(jfd.json_data['data']), 41)
+        self.assertNotIn('points', jfd.meta)
+
+
+if __name__ == '__main__':
+    unittest.main()
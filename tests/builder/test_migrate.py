@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+from functools import partial
+from unittest import mock
+from .context import setUpModule, test_files_dir
+from matvirdkit.model.utils import sha1encode, loadjson, dumpjson
+from matvirdkit.builder import task, migrate
+from matvirdkit.cache import DiskCache
+from matvirdkit.builder.vasp import outputs
+from matvirdkit.builder.task import GeneralTask
+from matvirdkit.builder.migrate import build_task_id_map, map_task_id
+from matvirdkit.builder.structure_store import StructureStore
+
+
+class TestTaskIdMigration(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.calc_dir = os.path.join(self.tmp, 'scf')
+        shutil.copytree(os.path.join(test_files_dir, 'scf'), self.calc_dir)
+        self.tasks_dir = os.path.join(self.tmp, 'tasks')
+        self.map_file = os.path.join(self.tmp, 'task_id_map.json')
+        store = partial(StructureStore, store_dir=os.path.join(self.tmp, 'structures'))
+        self.patches = [mock.patch.object(task, 'StructureStore', store),
+                        mock.patch.object(migrate, 'StructureStore', store),
+                        mock.patch.object(task, 'map_task_id', partial(map_task_id, fname=self.map_file)),
+                        # a cold vasprun cache with the cache enabled: the first build parses,
+                        # a rebuild of the same files is served from the cache
+                        mock.patch.object(outputs, '_vasprun_cache',
+                                          DiskCache('vasprun', cache_dir=os.path.join(self.tmp, 'cache'))),
+                        mock.patch.object(outputs.parse_vasprun, '__defaults__', ('vasprun.xml', True))]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        shutil.rmtree(self.tmp)
+
+    def build(self):
+        return GeneralTask(self.calc_dir, 'vasp', repo_dir=self.tasks_dir).get_task()[0]
+
+    def make_legacy(self, task_id):
+        """
+        Store the task as before content hashing: full structures in the
+        input and the sha1 of its str as id.
+        """
+        td = loadjson(os.path.join(self.tasks_dir, task_id, 'task.json'))
+        td = StructureStore(os.path.join(self.tmp, 'structures')).rehydrate(td)
+        legacy_id = sha1encode(td['input'])
+        td['task_id'] = legacy_id
+        shutil.move(os.path.join(self.tasks_dir, task_id), os.path.join(self.tasks_dir, legacy_id))
+        dumpjson(td, os.path.join(self.tasks_dir, legacy_id, 'task.json'))
+        dumpjson({'encode': legacy_id}, os.path.join(self.calc_dir, 'tag.json'))
+        return legacy_id
+
+    def test_migrated_id_is_rebuilt_id(self):
+        with mock.patch.object(outputs, '_vasprun_state', wraps=outputs._vasprun_state) as parsed:
+            task_id = self.build()
+        self.assertGreater(parsed.call_count, 0)
+        legacy_id = self.make_legacy(task_id)
+        self.assertNotEqual(legacy_id, task_id)
+        id_map = build_task_id_map(self.tasks_dir, fname=self.map_file)
+        self.assertEqual(id_map, {legacy_id: task_id})
+        # rebuild from scratch, without the tag and the stored task
+        os.remove(os.path.join(self.calc_dir, 'tag.json'))
+        shutil.rmtree(os.path.join(self.tasks_dir, legacy_id))
+        # the id does not depend on whether vasprun.xml came from the cache
+        with mock.patch.object(outputs, '_vasprun_state', wraps=outputs._vasprun_state) as parsed:
+            self.assertEqual(self.build(), task_id)
+        self.assertEqual(parsed.call_count, 0)
+
+    def test_map_without_rename(self):
+        task_id = self.build()
+        legacy_id = self.make_legacy(task_id)
+        build_task_id_map(self.tasks_dir, fname=self.map_file)
+        with mock.patch.object(task.TaskDocument, 'from_directory', side_effect=AssertionError('parsed again')):
+            self.assertEqual(self.build(), task_id)
+        self.assertFalse(os.path.exists(os.path.join(self.tasks_dir, legacy_id)))
+        self.assertEqual(loadjson(os.path.join(self.tasks_dir, task_id, 'task.json'))['task_id'], task_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+import numpy as np
+from .context import setUpModule
+from matvirdkit.model.mechanics import Mechanics2dSummary
+from matvirdkit.model.stability import StabilityLevel
+from matvirdkit.builder.stability import stiffness_min_eigenvalues, classify
+
+# stiffness (N/m) over xx, yy, xy, the smallest eigenvalue is about 25
+C2D = np.array([[95.0, 18.0, 6.0],
+                [18.0, 40.0, -3.0],
+                [6.0, -3.0, 25.0]])
+
+
+def mechanics_doc(c2d):
+    summary = Mechanics2dSummary.from_tensor(c2d).dict()
+    return {'mechanics2d': {'relax': {'elc2nd_energy': {'summary': summary}}}}
+
+
+class TestStiffnessEigenvalues(unittest.TestCase):
+    def test_stiffness_not_compliance(self):
+        min_eigs = stiffness_min_eigenvalues(mechanics_doc(C2D), 'relax')
+        self.assertAlmostEqual(min_eigs['elc2nd_energy'], min(np.linalg.eigvalsh(C2D)), places=8)
+        self.assertTrue(np.isnan(min_eigs['elc2nd_stress']))
+
+    def test_limit_in_stiffness_units(self):
+        # the limit is in N/m like the stiffness eigenvalues
+        rows = [{'dimension': 2, 'tensors': [Mechanics2dSummary.from_tensor(C2D).s_tensor, None],
+                 'thermo': (None, None), 'max_hessian': None}]
+        result = classify(rows, {'min_eig': 1.0})
+        self.assertEqual(result['stiff_stability'][0], StabilityLevel.high.value)
+        self.assertAlmostEqual(result['min_eig'][0, 0], min(np.linalg.eigvalsh(C2D)), places=8)
+
+
+if __name__ == '__main__':
+    unittest.main()
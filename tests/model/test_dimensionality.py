@@ -0,0 +1,51 @@
+import os
+import unittest
+from .context import setUpModule
+from pymatgen.core import Lattice, Structure
+from pymatgen.analysis.dimensionality import get_dimensionality_gorai
+from matvirdkit.model.dimensionality import get_dimensionality_fast
+from matvirdkit.model.structure import get_dimensionality
+
+test_files_dir=os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'tests_files'))
+
+
+def structures():
+    """
+    {name: (structure, dimensionality)}
+    """
+    si = Structure(Lattice.cubic(5.43), ['Si'] * 8,
+                   [[0, 0, 0], [0, .5, .5], [.5, 0, .5], [.5, .5, 0],
+                    [.25, .25, .25], [.25, .75, .75], [.75, .25, .75], [.75, .75, .25]])
+    graphene = Structure(Lattice.hexagonal(2.46, 20), ['C', 'C'], [[1 / 3, 2 / 3, .5], [2 / 3, 1 / 3, .5]])
+    mos2 = Structure(Lattice.hexagonal(3.19, 20), ['Mo', 'S', 'S'],
+                     [[1 / 3, 2 / 3, .5], [2 / 3, 1 / 3, .5 + 1.56 / 20], [2 / 3, 1 / 3, .5 - 1.56 / 20]])
+    # slanted cell, the chain runs along a
+    chain = Structure(Lattice.from_parameters(2.5, 15, 15, 90, 90, 75), ['C', 'C'], [[0, .5, .5], [.5, .5, .5]])
+    co = Structure(Lattice.cubic(12), ['C', 'O'], [[.5, .5, .5], [.5, .5, .5 + 1.13 / 12]])
+    ret = {'Si': (si, 3), 'graphene': (graphene, 2), 'MoS2': (mos2, 2), 'chain': (chain, 1), 'CO': (co, 0)}
+    ret.update({name + '-supercell': (st * (3, 3, 2), dim) for name, (st, dim) in list(ret.items())})
+    # the Jmol radius of P (0.75) is too short for the 2.22 A bonds of
+    # phosphorene, both methods see isolated atoms
+    for name, dim in [('alpha-P-R', 0), ('GeSe-RC', 2)]:
+        ret[name] = (Structure.from_file(os.path.join(test_files_dir, name, 'POSCAR')), dim)
+    return ret
+
+
+class TestDimensionality(unittest.TestCase):
+    def test_fast(self):
+        for name, (st, dim) in structures().items():
+            self.assertEqual(get_dimensionality_fast(st), dim, name)
+
+    def test_fast_agrees_with_gorai(self):
+        # gorai has no 0D and reports molecules as 1
+        for name, (st, dim) in structures().items():
+            self.assertEqual(max(get_dimensionality_fast(st), 1), get_dimensionality_gorai(st), name)
+
+    def test_methods(self):
+        st, _ = structures()['MoS2']
+        self.assertEqual(get_dimensionality(st, use_cache=False), 2)
+        self.assertEqual(get_dimensionality(st, use_cache=False, method='gorai'), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
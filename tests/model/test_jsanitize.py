@@ -0,0 +1,85 @@
+"""
+jsanitize against the golden output of the isinstance chain it replaced.
+
+files/jsanitize_golden.json was written by the jsanitize of the baseline
+tree (before the per-type dispatch) from golden_objects(), as
+json.dumps(jsanitize(golden_objects())); the dispatcher must give the same
+bytes.
+"""
+import os
+import json
+import unittest
+from enum import Enum
+from datetime import datetime, date
+import numpy as np
+from monty.json import MSONable
+from .context import setUpModule
+from matvirdkit.model.utils import jsanitize
+from matvirdkit.model.common import JFData
+from matvirdkit.model.provenance import LocalProvenance, Origin
+from matvirdkit.model.stability import Stability, StabilityDoc, StabilityLevel, StiffnessStability, ThermoDynamicStability
+
+golden_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'files', 'jsanitize_golden.json')
+stamp = datetime(2022, 5, 1, 12, 30, 15, 250)
+
+
+class Color(Enum):
+    red = 1
+    blue = 'blue'
+
+
+class Point(MSONable):
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+def golden_objects():
+    provenance = LocalProvenance(created_at=stamp, last_updated=stamp,
+                                 origins=[Origin(name='pbe-static', task_id='task-1', last_updated=stamp)],
+                                 tags=['2d'])
+    stability = Stability(provenance={'stiff_stability': provenance},
+                          stiff_stability=StiffnessStability.from_key(min_eig_tensor=0.1),
+                          thermo_stability=ThermoDynamicStability.from_key(formation_energy_per_atom=-0.1,
+                                                                           energy_above_hull=np.float64(0.02)))
+    return {
+        'model': StabilityDoc(stability={'PBE': stability}),
+        'jfdata': JFData(description='curve', file_fmt='bin', meta={'n': 3, 'shape': (2, 3)}),
+        'enum': [StabilityLevel.high, Color.red, Color.blue],
+        'arrays': {'float': np.array([[1.5, np.nan], [np.inf, -2.0]]),
+                   'float32': np.array([0.1, np.nan], dtype=np.float32),
+                   'int': np.arange(6).reshape(2, 3),
+                   'bool': np.array([True, False]),
+                   'empty': np.zeros((0, 3)),
+                   'object': np.array([1, 'a', None], dtype=object),
+                   'numpy_scalars': [np.float64(np.nan), np.float64(1.25), np.int64(3), np.bool_(True)]},
+        'datetime': [stamp, date(2022, 5, 1)],
+        'nested': {1: {2.5: [(1, 2), {'a': None, 'b': float('nan')}], 'set': {3}},
+                   None: [Point(1, [2.0, np.nan])], 'bytes': b'ab', 'true': True},
+    }
+
+
+class TestJsanitize(unittest.TestCase):
+    def test_golden(self):
+        with open(golden_file, 'rb') as fid:
+            golden = fid.read()
+        self.assertEqual(json.dumps(jsanitize(golden_objects())).encode('utf-8'), golden)
+
+    def test_golden_per_case(self):
+        with open(golden_file) as fid:
+            golden = json.load(fid)
+        for key, obj in golden_objects().items():
+            self.assertEqual(json.dumps(jsanitize(obj)), json.dumps(golden[key]), key)
+
+    def test_allow_bson(self):
+        obj = {'t': stamp, 'b': b'ab', 'l': [stamp]}
+        self.assertEqual(jsanitize(obj, allow_bson=True), {'t': stamp, 'b': b'ab', 'l': [stamp]})
+
+    def test_strict(self):
+        self.assertEqual(jsanitize(Point(1, 2), strict=True)['x'], 1)
+        with self.assertRaises(AttributeError):
+            jsanitize(object(), strict=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
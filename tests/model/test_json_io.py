@@ -0,0 +1,78 @@
+import os
+import json
+import enum
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+import numpy as np
+from monty.serialization import dumpfn
+from .context import setUpModule
+from matvirdkit.model import utils
+from matvirdkit.model.utils import dumpsjson, dumpjson, loadjson, loadsjson
+
+
+class Kind(enum.Enum):
+    band = 'band'
+
+
+def document():
+    return {'energy': [1, 0.1, -2.5, float('nan'), float('inf'), -float('inf')],
+            'formula': 'Mo₂S',
+            'label': 'the "NaN" phase',
+            'arrays': np.array([[1.0, np.nan], [2.0, 3.0]]),
+            'scalars': [np.int64(3), np.float32(0.5), np.float64(0.25)],
+            'kind': Kind.band,
+            'created': datetime(2022, 5, 1, 12, 30, 0, 15),
+            'empty': [{}, []],
+            'nested': {'b': {'z': None, 'a': True}}}
+
+
+class TestJsonIO(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_legacy_nan(self):
+        # dumpfn and json.dumps write the NaN and Infinity tokens
+        doc = {'task_id': 'mp-1', 'energy': float('nan'), 'gap': [float('inf'), 1.5]}
+        for name in ['legacy.json', 'legacy.json.gz']:
+            fname = os.path.join(self.tmp.name, name)
+            dumpfn(doc, fname, indent=4)
+            ret = loadjson(fname)
+            self.assertEqual(ret['task_id'], 'mp-1')
+            self.assertTrue(np.isnan(ret['energy']))
+            self.assertEqual(ret['gap'], [float('inf'), 1.5])
+        self.assertEqual(loadsjson(json.dumps(doc).encode())['gap'][1], 1.5)
+
+    def test_fallback_same_bytes(self):
+        doc = document()
+        data = dumpsjson(doc)
+        data_indent = dumpsjson(doc, indent=True)
+        with mock.patch.object(utils, 'orjson', None):
+            self.assertEqual(dumpsjson(doc), data)
+            self.assertEqual(dumpsjson(doc, indent=True), data_indent)
+
+    def test_nonfinite_as_null(self):
+        with mock.patch.object(utils, 'orjson', None):
+            data = dumpsjson(document())
+        self.assertNotIn(b'NaN', data.replace(b'"the \\"NaN\\" phase"', b''))
+        self.assertNotIn(b'Infinity', data)
+        ret = loadsjson(data)
+        self.assertEqual(ret['energy'], [1, 0.1, -2.5, None, None, None])
+        self.assertEqual(ret['label'], 'the "NaN" phase')
+        self.assertEqual(ret['formula'], 'Mo₂S')
+
+    def test_round_trip(self):
+        fname = os.path.join(self.tmp.name, 'doc.json')
+        dumpjson(document(), fname)
+        ret = loadjson(fname)
+        self.assertEqual(ret['arrays'], [[1.0, None], [2.0, 3.0]])
+        self.assertEqual(ret['kind'], 'band')
+        self.assertEqual(ret['created']['@class'], 'datetime')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import json
+import unittest
+import numpy as np
+from .context import setUpModule
+from pymatgen.core import Lattice, Structure
+from matvirdkit.model.utils import jsanitize
+from matvirdkit.model.structure import (structure_to_arrays, structure_from_arrays, structure_fingerprint,
+                                        CompactStructure, StructureMatvird)
+
+test_files_dir=os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'tests_files'))
+
+
+def triclinic():
+    lattice = Lattice.from_parameters(4.1, 5.3, 6.7, 71.5, 83.2, 101.9)
+    st = Structure(lattice, ['Fe', 'O', 'O', {'Ni': 0.5, 'Co': 0.5}],
+                   [[0, 0, 0], [0.25, 0.31, 0.12], [0.71, 0.66, 0.49], [0.5, 0.5, 0.5]],
+                   site_properties={'magmom': [2.5, 0.0, -0.1, 1.2],
+                                    'selective_dynamics': [[True, True, False]] * 4,
+                                    'label': ['a', 'b', 'c', 'd'],
+                                    'tags': [None, [1, 2], {'x': 1}, 3]},
+                   charge=1.0)
+    return st
+
+
+class TestStructureArrays(unittest.TestCase):
+    def assertSameStructure(self, a, b):
+        self.assertEqual(a, b)
+        self.assertTrue(np.array_equal(a.lattice.matrix, b.lattice.matrix))
+        self.assertTrue(np.array_equal(a.frac_coords, b.frac_coords))
+        self.assertEqual(a.site_properties, b.site_properties)
+        self.assertEqual(a.charge, b.charge)
+        self.assertEqual([s.species for s in a], [s.species for s in b])
+
+    def test_round_trip(self):
+        for st in [triclinic(), triclinic() * (2, 1, 3),
+                   Structure.from_file(os.path.join(test_files_dir, 'relax', 'CONTCAR'))]:
+            self.assertSameStructure(structure_from_arrays(structure_to_arrays(st)), st)
+
+    def test_species_table(self):
+        st = triclinic() * (2, 2, 1)
+        arrays = structure_to_arrays(st)
+        self.assertEqual(len(arrays['species_table']), 3)
+        self.assertEqual(arrays['prop:magmom'].dtype, np.float64)
+        self.assertEqual(arrays['prop:tags'].ndim, 0)
+
+    def test_fingerprint(self):
+        st = triclinic()
+        self.assertEqual(structure_fingerprint(st), structure_fingerprint(st.copy()))
+        st2 = st.copy()
+        st2.add_site_property('magmom', [0.0] * len(st2))
+        self.assertNotEqual(structure_fingerprint(st), structure_fingerprint(st2))
+
+
+class TestCompactStructure(unittest.TestCase):
+    def test_round_trip(self):
+        st = triclinic() * (3, 3, 1)
+        cst = CompactStructure.from_structure(st)
+        TestStructureArrays.assertSameStructure(self, cst.to_structure(), st)
+        # through json, as stored
+        cst = CompactStructure(**json.loads(json.dumps(jsanitize(cst))))
+        TestStructureArrays.assertSameStructure(self, cst.to_structure(), st)
+
+    def test_to_arrays(self):
+        st = triclinic()
+        arrays = CompactStructure.from_structure(st).to_arrays()
+        ref = structure_to_arrays(st)
+        self.assertEqual(sorted(arrays), sorted(ref))
+        for key in ref:
+            self.assertEqual(arrays[key].dtype, ref[key].dtype, key)
+            self.assertTrue(np.array_equal(arrays[key], ref[key]), key)
+
+    def test_structure_matvird(self):
+        st = triclinic()
+        mst = StructureMatvird.from_structure(st, dimension=3, compact=True)
+        self.assertIsNone(mst.structure)
+        self.assertEqual(mst.get_structure(), st)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import os
+import tempfile
+import unittest
+from functools import partial
+from unittest import mock
+from .context import setUpModule
+from pymatgen.io.vasp import Potcar
+from matvirdkit.builder.vasp.potcar import PotcarPool
+from matvirdkit.model.vasp import task
+from matvirdkit.model.vasp.task import InputData
+
+scf_dir=os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'tests_files', 'scf'))
+
+
+class TestInputDataPotcar(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.pool = mock.patch.object(task, 'PotcarPool', partial(PotcarPool, pool_dir=self.tmp.name))
+        self.pool.start()
+
+    def tearDown(self):
+        self.pool.stop()
+        self.tmp.cleanup()
+
+    def test_only_reference_stored(self):
+        inputs = InputData.from_directory(scf_dir)
+        self.assertEqual(set(inputs.POTCAR), {'potcar_spec', 'potcar_ref'})
+        self.assertEqual(os.listdir(self.tmp.name), [inputs.POTCAR['potcar_ref'] + '-POTCAR.gz'])
+
+    def test_get_potcar(self):
+        inputs = InputData.from_directory(scf_dir)
+        with mock.patch.object(PotcarPool, 'get', autospec=True, side_effect=PotcarPool.get) as get:
+            inputs = InputData(**inputs.dict())
+            get.assert_not_called()
+            potcar = inputs.get_potcar()
+            get.assert_called_once()
+        ref = Potcar.from_file(os.path.join(scf_dir, 'POTCAR'))
+        self.assertEqual(str(potcar), str(ref))
+        self.assertEqual(potcar.symbols, ref.symbols)
+
+
+if __name__ == '__main__':
+    unittest.main()